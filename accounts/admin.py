@@ -1,3 +1,12 @@
 from django.contrib import admin
+from .models import UserTravelStats
 
-# Register your models here.
+@admin.register(UserTravelStats)
+class UserTravelStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'total_trips', 'total_seats', 'total_spend', 'cancelled_trips', 'updated_at']
+    search_fields = ['user__username', 'user__email']
+    readonly_fields = ['user', 'total_trips', 'total_seats', 'total_spend', 'cancelled_trips',
+                       'routes', 'upcoming', 'updated_at']
+    
+    def has_add_permission(self, request):
+        return False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+    
+    def ready(self):
+        from . import stats  # noqa: F401 connects booking signal receivers
+        from . import backends  # noqa: F401 connects user cache invalidation
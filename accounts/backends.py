@@ -0,0 +1,90 @@
+"""
+Authentication with a short-lived cache of the logged-in user.
+
+``AuthenticationMiddleware`` asks the backend for the session's user on
+every request. ``CachedModelBackend`` keeps that user, with their profile
+joined in, in the cache for ``ACCOUNTS_USER_CACHE_TTL`` seconds; together
+with the ``cached_db`` session engine a logged-in page view reads neither
+the session nor the user table. A TTL of 0 turns the cache off, leaving a
+plain ``ModelBackend``; it is the only backend either way, so sessions stay
+valid when the cache is switched on or off.
+
+The password hash is not cached: the entry holds the user with ``password``
+deferred and the session auth hash derived from it, which is all that
+checking the session needs. Reading ``password`` loads it from the
+database, and saving the user leaves it alone.
+
+The cached user is dropped when the user or their profile is saved or
+deleted (a password change included, so other sessions are logged out as
+before) and on logout. Writes that bypass ``save()``, such as
+``User.objects.update()``, show up once the entry expires.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserProfile
+
+CACHE_PREFIX = 'auth:user'
+DEFAULT_TTL = 60
+
+
+def get_ttl():
+    return getattr(settings, 'ACCOUNTS_USER_CACHE_TTL', DEFAULT_TTL)
+
+
+def cache_key(user_id):
+    return f'{CACHE_PREFIX}:{user_id}'
+
+
+def forget_user(user_id):
+    key = cache_key(user_id)
+    cache.delete(key)
+    # A request that read the old row before the change committed may have
+    # cached it again in the meantime
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        ttl = get_ttl()
+        if not ttl:
+            return super().get_user(user_id)
+        key = cache_key(user_id)
+        cached = cache.get(key)
+        if cached is None:
+            user = User._default_manager.select_related('profile').filter(pk=user_id).first()
+            if user is None:
+                return None
+            session_hash = user.get_session_auth_hash()
+            # Deferred: not pickled into the cache, and left out of save()
+            del user.__dict__['password']
+            cached = (user, session_hash)
+            cache.set(key, cached, ttl)
+        user, session_hash = cached
+        # Checked by the auth middleware on every request, without the password
+        user.get_session_auth_hash = lambda: session_hash
+        return user if self.user_can_authenticate(user) else None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_saved_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def forget_saved_profile(sender, instance, **kwargs):
+    forget_user(instance.user_id)
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
@@ -14,21 +14,20 @@ class CustomUserCreationForm(UserCreationForm):
         model = User
         fields = ("username", "first_name", "last_name", "email", "password1", "password2")
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.layout = Layout(
-            Row(
-                Column('first_name', css_class='form-group col-md-6 mb-0'),
-                Column('last_name', css_class='form-group col-md-6 mb-0'),
-                css_class='form-row'
-            ),
-            'username',
-            'email',
-            'password1',
-            'password2',
-            Submit('submit', 'Sign Up', css_class='btn btn-primary btn-lg')
-        )
+    # Shared by every instance; crispy only reads it
+    helper = FormHelper()
+    helper.layout = Layout(
+        Row(
+            Column('first_name', css_class='form-group col-md-6 mb-0'),
+            Column('last_name', css_class='form-group col-md-6 mb-0'),
+            css_class='form-row'
+        ),
+        'username',
+        'email',
+        'password1',
+        'password2',
+        Submit('submit', 'Sign Up', css_class='btn btn-primary btn-lg')
+    )
     
     def save(self, commit=True):
         user = super().save(commit=False)
@@ -52,26 +51,26 @@ class UserProfileForm(forms.ModelForm):
             'address': forms.Textarea(attrs={'rows': 3}),
         }
     
+    helper = FormHelper()
+    helper.layout = Layout(
+        Row(
+            Column('first_name', css_class='form-group col-md-6 mb-0'),
+            Column('last_name', css_class='form-group col-md-6 mb-0'),
+            css_class='form-row'
+        ),
+        'email',
+        'phone_number',
+        'date_of_birth',
+        'address',
+        Submit('submit', 'Update Profile', css_class='btn btn-primary')
+    )
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance and self.instance.user:
             self.fields['first_name'].initial = self.instance.user.first_name
             self.fields['last_name'].initial = self.instance.user.last_name
             self.fields['email'].initial = self.instance.user.email
-        
-        self.helper = FormHelper()
-        self.helper.layout = Layout(
-            Row(
-                Column('first_name', css_class='form-group col-md-6 mb-0'),
-                Column('last_name', css_class='form-group col-md-6 mb-0'),
-                css_class='form-row'
-            ),
-            'email',
-            'phone_number',
-            'date_of_birth',
-            'address',
-            Submit('submit', 'Update Profile', css_class='btn btn-primary')
-        )
     
     def save(self, commit=True):
         profile = super().save(commit=False)
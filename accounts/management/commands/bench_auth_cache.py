@@ -0,0 +1,60 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+MODES = [
+    ('database', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    }),
+    ('cached', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_BACKENDS': ['accounts.backends.CachedModelBackend'],
+        'ACCOUNTS_USER_CACHE_TTL': 60,
+    }),
+]
+
+class Command(BaseCommand):
+    help = 'Measure queries and time per logged-in request with database and with cached sessions and users'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Requests per page and mode'
+        )
+    
+    def handle(self, *args, **options):
+        n = options['requests']
+        user, created = User.objects.get_or_create(username='bench-auth')
+        if created:
+            user.set_password('bench-auth-password')
+            user.save()
+        urls = [reverse('travel:booking_list'), reverse('accounts:profile')]
+        results = {}
+        for mode, settings in MODES:
+            with override_settings(**settings):
+                client = Client(HTTP_HOST='localhost')
+                client.login(username='bench-auth', password='bench-auth-password')
+                for url in urls:
+                    client.get(url)  # warm caches
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        for _ in range(n):
+                            client.get(url)
+                        elapsed = time.perf_counter() - started
+                    results[(mode, url)] = (len(queries) / n, elapsed / n * 1000)
+        self.stdout.write(f'{"":<20} {"database":>22} {"cached":>22} {"saved":>8}')
+        for url in urls:
+            db_queries, db_ms = results[('database', url)]
+            cached_queries, cached_ms = results[('cached', url)]
+            self.stdout.write(
+                f'{url:<20} {db_queries:>6.1f} queries {db_ms:>6.2f}ms {cached_queries:>6.1f} queries '
+                f'{cached_ms:>6.2f}ms {db_queries - cached_queries:>8.1f}'
+            )
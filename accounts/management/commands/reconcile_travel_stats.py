@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from accounts.stats import reconcile
+
+class Command(BaseCommand):
+    help = 'Recompute per-user travel statistics from bookings and repair rows that drifted'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Users recomputed per transaction'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without writing'
+        )
+    
+    def handle(self, *args, **options):
+        checked, created, fixed = reconcile(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        verb = 'would be' if options['dry_run'] else 'were'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Checked {checked} users: {created} stats rows {verb} created, {fixed} {verb} out of date.'
+            )
+        )
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTravelStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='travel_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_trips', models.PositiveIntegerField(default=0)),
+                ('total_seats', models.PositiveIntegerField(default=0)),
+                ('total_spend', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('cancelled_trips', models.PositiveIntegerField(default=0)),
+                ('routes', models.JSONField(blank=True, default=dict)),
+                ('upcoming', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'user travel stats',
+            },
+        ),
+    ]
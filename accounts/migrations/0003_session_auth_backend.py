@@ -0,0 +1,47 @@
+# Generated by Django 5.0.14 on 2026-10-19 16:10
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.db import migrations
+
+BACKEND_SESSION_KEY = '_auth_user_backend'
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+CACHED_MODEL_BACKEND = 'accounts.backends.CachedModelBackend'
+
+
+def rewrite_backend(apps, old, new):
+    """Point sessions logged in through ``old`` at ``new``, so they stay logged in"""
+    Session = apps.get_model('sessions', 'Session')
+    store = SessionStore()
+    cache = caches[settings.SESSION_CACHE_ALIAS]
+    for session in Session.objects.iterator():
+        data = store.decode(session.session_data)
+        if data.get(BACKEND_SESSION_KEY) != old:
+            continue
+        data[BACKEND_SESSION_KEY] = new
+        session.session_data = store.encode(data)
+        session.save(update_fields=['session_data'])
+        # cached_db would keep serving the old copy
+        cache.delete(cached_db.KEY_PREFIX + session.session_key)
+
+
+def forwards(apps, schema_editor):
+    rewrite_backend(apps, MODEL_BACKEND, CACHED_MODEL_BACKEND)
+
+
+def backwards(apps, schema_editor):
+    rewrite_backend(apps, CACHED_MODEL_BACKEND, MODEL_BACKEND)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_travel_stats'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -1,3 +1,5 @@
+from datetime import timezone as dt_timezone
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
@@ -14,6 +16,46 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+def utc_stamp(value):
+    """Sortable string form of an aware datetime"""
+    return value.astimezone(dt_timezone.utc).isoformat()
+
+class UserTravelStats(models.Model):
+    """
+    Per-user travel summary for the profile dashboard, kept up to date by
+    the booking signals (see accounts/stats.py) so the page never has to
+    scan a user's booking history.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='travel_stats')
+    total_trips = models.PositiveIntegerField(default=0)
+    total_seats = models.PositiveIntegerField(default=0)
+    total_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cancelled_trips = models.PositiveIntegerField(default=0)
+    # {"Source → Destination": confirmed bookings}
+    routes = models.JSONField(default=dict, blank=True)
+    # [[departure ISO datetime, booking pk], ...] of confirmed future trips, soonest first
+    upcoming = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'user travel stats'
+    
+    def __str__(self):
+        return f"{self.user.username}'s travel stats"
+    
+    @property
+    def total_bookings(self):
+        """Confirmed and cancelled bookings, as the profile has always counted them"""
+        return self.total_trips + self.cancelled_trips
+    
+    def favourite_routes(self, limit=3):
+        ranked = sorted(self.routes.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+    
+    def upcoming_booking_ids(self, now, limit=5):
+        now = utc_stamp(now)
+        return [pk for departure, pk in self.upcoming if departure >= now][:limit]
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
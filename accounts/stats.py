@@ -0,0 +1,180 @@
+"""
+Per-user travel statistics.
+
+``UserTravelStats`` rows are updated incrementally from the
+``bookings_created`` and ``bookings_cancelled`` signals, inside the booking
+transaction, so they commit or roll back with the bookings themselves. The
+rows of the affected users are locked in user id order, after the travel
+option rows the booking code already holds.
+
+``compute_stats`` rebuilds the figures from scratch with a handful of
+grouped queries per batch of users; it seeds a user's row the first time
+it is touched and backs the ``reconcile_travel_stats`` command.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
+from django.dispatch import receiver
+from django.utils import timezone
+
+from travel.models import ArchivedBooking, Booking
+from travel.signals import bookings_cancelled, bookings_created
+
+from .models import UserTravelStats, utc_stamp
+
+STAT_FIELDS = ['total_trips', 'total_seats', 'total_spend', 'cancelled_trips', 'routes', 'upcoming']
+
+
+def route_label(source, destination):
+    return f'{source} → {destination}'
+
+
+def _empty():
+    return {
+        'total_trips': 0,
+        'total_seats': 0,
+        'total_spend': Decimal('0.00'),
+        'cancelled_trips': 0,
+        'routes': {},
+        'upcoming': [],
+    }
+
+
+def compute_stats(user_ids, now=None):
+    """``{user_id: {field: value}}`` for the given users, from current and archived bookings"""
+    now = now or timezone.now()
+    stats = {user_id: _empty() for user_id in user_ids}
+    for model in (Booking, ArchivedBooking):
+        bookings = model.objects.filter(user_id__in=user_ids).order_by()
+        for row in bookings.values('user_id', 'status').annotate(
+            trips=Count('pk'), seats=Sum('number_of_seats'), spend=Sum('total_price'),
+        ):
+            entry = stats[row['user_id']]
+            if row['status'] == 'confirmed':
+                entry['total_trips'] += row['trips']
+                entry['total_seats'] += row['seats'] or 0
+                entry['total_spend'] += row['spend'] or 0
+            else:
+                entry['cancelled_trips'] += row['trips']
+        for row in bookings.filter(status='confirmed').values(
+            'user_id', 'travel_option__source', 'travel_option__destination',
+        ).annotate(trips=Count('pk')):
+            routes = stats[row['user_id']]['routes']
+            label = route_label(row['travel_option__source'], row['travel_option__destination'])
+            routes[label] = routes.get(label, 0) + row['trips']
+
+    # Archived departures are in the past by definition
+    upcoming = Booking.objects.filter(
+        user_id__in=user_ids, status='confirmed', travel_option__departure_at__gte=now,
+    ).order_by().values_list('user_id', 'pk', 'travel_option__departure_at')
+    for user_id, pk, departure_at in upcoming:
+        stats[user_id]['upcoming'].append([utc_stamp(departure_at), pk])
+    for entry in stats.values():
+        entry['upcoming'].sort()
+    return stats
+
+
+def _locked_stats(user_ids):
+    """Lock (creating where missing) the stats rows of ``user_ids``; returns ``{user_id: stats}``"""
+    rows = {
+        row.user_id: row
+        for row in UserTravelStats.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id')
+    }
+    missing = sorted(set(user_ids) - set(rows))
+    if missing:
+        # Seeded from the database, which already includes the change being signalled
+        for user_id, values in compute_stats(missing).items():
+            try:
+                with transaction.atomic():
+                    UserTravelStats.objects.create(user_id=user_id, **values)
+            except IntegrityError:
+                # Created concurrently: fall back to an incremental update
+                rows[user_id] = UserTravelStats.objects.select_for_update().get(user_id=user_id)
+    return rows
+
+
+def _apply(bookings, sign):
+    now = timezone.now()
+    by_user = defaultdict(list)
+    for booking in bookings:
+        by_user[booking.user_id].append(booking)
+    rows = _locked_stats(list(by_user))
+    for user_id, row in rows.items():
+        upcoming = [entry for entry in row.upcoming if entry[0] >= utc_stamp(now)]
+        for booking in by_user[user_id]:
+            option = booking.travel_option
+            label = route_label(option.source, option.destination)
+            row.total_trips += sign
+            row.total_seats += sign * booking.number_of_seats
+            row.total_spend += sign * booking.total_price
+            row.routes[label] = row.routes.get(label, 0) + sign
+            if row.routes[label] <= 0:
+                del row.routes[label]
+            if sign > 0:
+                if option.departure_at and option.departure_at >= now:
+                    upcoming.append([utc_stamp(option.departure_at), booking.pk])
+            else:
+                row.cancelled_trips += 1
+                upcoming = [entry for entry in upcoming if entry[1] != booking.pk]
+        row.upcoming = sorted(upcoming)
+        row.updated_at = now
+    UserTravelStats.objects.bulk_update(list(rows.values()), STAT_FIELDS + ['updated_at'])
+
+
+@receiver(bookings_created)
+def record_bookings_created(sender, bookings, **kwargs):
+    _apply(bookings, 1)
+
+
+@receiver(bookings_cancelled)
+def record_bookings_cancelled(sender, bookings, **kwargs):
+    _apply(bookings, -1)
+
+
+def get_stats(user):
+    """The user's stats row, seeded on first use"""
+    row = UserTravelStats.objects.filter(user=user).first()
+    if row is None:
+        with transaction.atomic():
+            row = _locked_stats([user.pk]).get(user.pk) or UserTravelStats.objects.get(user=user)
+    return row
+
+
+def reconcile(batch_size=500, dry_run=False):
+    """
+    Recompute every user's stats in batches and repair rows that drifted.
+    Returns ``(users checked, rows created, rows fixed)``.
+    """
+    checked = created = fixed = 0
+    last_pk = 0
+    while True:
+        user_ids = list(User.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not user_ids:
+            return checked, created, fixed
+        last_pk = user_ids[-1]
+        with transaction.atomic():
+            existing = {
+                row.user_id: row
+                for row in UserTravelStats.objects.select_for_update().filter(user_id__in=user_ids)
+            }
+            expected = compute_stats(user_ids)
+            new_rows, changed = [], []
+            for user_id, values in expected.items():
+                row = existing.get(user_id)
+                if row is None:
+                    new_rows.append(UserTravelStats(user_id=user_id, **values))
+                elif any(getattr(row, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(row, field, value)
+                    row.updated_at = timezone.now()
+                    changed.append(row)
+            if not dry_run:
+                # A booking may have seeded a row meanwhile; it is fixed on the next run
+                UserTravelStats.objects.bulk_create(new_rows, batch_size=batch_size, ignore_conflicts=True)
+                UserTravelStats.objects.bulk_update(changed, STAT_FIELDS + ['updated_at'], batch_size=batch_size)
+        checked += len(user_ids)
+        created += len(new_rows)
+        fixed += len(changed)
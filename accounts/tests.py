@@ -1,3 +1,174 @@
-from django.test import TestCase
+from datetime import date, time, timedelta
+from importlib import import_module
+from io import StringIO
+from decimal import Decimal
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from travel.models import Booking, TravelOption
+
+from .backends import cache_key
+from .models import UserTravelStats
+from .stats import get_stats
+
+class UserTravelStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='traveller', password='testpass123')
+        self.outbound = self._option('ST001', 'Oslo', 'Bergen', 5)
+        self.inbound = self._option('ST002', 'Bergen', 'Oslo', 9)
+        # Rate limit buckets are per user id, which other tests reuse
+        cache.clear()
+    
+    def _option(self, travel_id, source, destination, days):
+        return TravelOption.objects.create(
+            travel_id=travel_id,
+            type='train',
+            source=source,
+            destination=destination,
+            departure_date=date.today() + timedelta(days=days),
+            departure_time=time(9, 00),
+            arrival_date=date.today() + timedelta(days=days),
+            arrival_time=time(16, 00),
+            price=Decimal('50.00'),
+            available_seats=100,
+            total_seats=100
+        )
+    
+    def _book(self, option, seats=1):
+        self.client.login(username='traveller', password='testpass123')
+        self.client.post(reverse('travel:book_travel', args=[option.pk]), {
+            'number_of_seats': seats,
+            'passenger_names': '\n'.join(f'P{i}' for i in range(seats)),
+            'contact_phone': '+1234567890',
+        })
+        return Booking.objects.filter(user=self.user).order_by('-pk').first()
+    
+    def test_updated_on_booking_and_cancellation(self):
+        self._book(self.outbound, 2)
+        booking = self._book(self.outbound)
+        self._book(self.inbound)
+        stats = UserTravelStats.objects.get(user=self.user)
+        self.assertEqual(stats.total_trips, 3)
+        self.assertEqual(stats.total_seats, 4)
+        self.assertEqual(stats.total_spend, Decimal('200.00'))
+        self.assertEqual(stats.favourite_routes(), [('Oslo → Bergen', 2), ('Bergen → Oslo', 1)])
+        self.assertEqual(len(stats.upcoming), 3)
+        
+        booking.cancel_booking()
+        stats.refresh_from_db()
+        self.assertEqual(stats.total_trips, 2)
+        self.assertEqual(stats.cancelled_trips, 1)
+        self.assertEqual(stats.total_spend, Decimal('150.00'))
+        self.assertNotIn(booking.pk, [pk for _, pk in stats.upcoming])
+        # Cancelled bookings still count towards the profile's total
+        self.assertContains(self.client.get(reverse('accounts:profile')), '<strong>Total Bookings:</strong> 3')
+    
+    def test_seeded_from_existing_history(self):
+        Booking.objects.create(user=self.user, travel_option=self.inbound, number_of_seats=1,
+                               total_price=Decimal('50.00'))
+        stats = get_stats(self.user)
+        self.assertEqual(stats.total_trips, 1)
+        self._book(self.outbound)
+        stats.refresh_from_db()
+        self.assertEqual(stats.total_trips, 2)
+    
+    def test_reconcile_repairs_drift(self):
+        self._book(self.outbound)
+        UserTravelStats.objects.filter(user=self.user).update(total_trips=40, routes={})
+        call_command('reconcile_travel_stats', stdout=StringIO())
+        stats = UserTravelStats.objects.get(user=self.user)
+        self.assertEqual(stats.total_trips, 1)
+        self.assertEqual(stats.routes, {'Oslo → Bergen': 1})
+    
+    def test_profile_cost_is_independent_of_history(self):
+        self._book(self.outbound)
+        
+        def profile_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('accounts:profile'))
+            self.assertContains(response, 'Oslo → Bergen')
+            return len(queries)
+        
+        # Warm per-process caches (exchange rates) first
+        profile_queries()
+        few = profile_queries()
+        for _ in range(15):
+            self._book(self.inbound)
+        # Each login saves last_login, which drops the cached user
+        profile_queries()
+        self.assertEqual(profile_queries(), few)
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+                   AUTHENTICATION_BACKENDS=['accounts.backends.CachedModelBackend'],
+                   ACCOUNTS_USER_CACHE_TTL=60)
+class AuthCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cached', password='testpass123', first_name='Ada')
+        self.client.login(username='cached', password='testpass123')
+    
+    def _sql(self, client, url):
+        client.get(url)  # warm the session, user and exchange rate caches
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries.captured_queries]
+    
+    def test_logged_in_requests_skip_session_and_user_reads(self):
+        for url in (reverse('travel:booking_list'), reverse('accounts:profile')):
+            cached = self._sql(self.client, url)
+            self.assertFalse([sql for sql in cached if 'django_session' in sql or 'FROM "auth_user"' in sql])
+            with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db',
+                                   AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend']):
+                client = Client()
+                client.login(username='cached', password='testpass123')
+                uncached = self._sql(client, url)
+            # Session, user and (on the profile page) profile reads saved per request
+            self.assertGreaterEqual(len(uncached) - len(cached), 2, url)
+    
+    def test_profile_update_and_password_change_invalidate(self):
+        self.client.get(reverse('accounts:profile'))
+        self.assertIsNotNone(cache.get(cache_key(self.user.pk)))
+        self.client.post(reverse('accounts:profile'), {
+            'first_name': 'Grace', 'last_name': 'Hopper', 'email': 'grace@example.com',
+            'phone_number': '', 'address': '',
+        })
+        self.assertContains(self.client.get(reverse('travel:booking_list')), 'Grace')
+        
+        self.user.set_password('a-new-password-123')
+        self.user.save()
+        response = self.client.get(reverse('travel:booking_list'))
+        self.assertEqual(response.status_code, 302)
+    
+    def test_logout_forgets_the_user(self):
+        self.client.get(reverse('travel:booking_list'))
+        self.client.post(reverse('logout'))
+        self.assertIsNone(cache.get(cache_key(self.user.pk)))
+        self.assertEqual(self.client.get(reverse('travel:booking_list')).status_code, 302)
+    
+    def test_password_hash_is_not_cached(self):
+        self.client.get(reverse('travel:booking_list'))
+        cached_user, session_hash = cache.get(cache_key(self.user.pk))
+        self.assertNotIn('password', cached_user.__dict__)
+        self.assertEqual(session_hash, self.user.get_session_auth_hash())
+        # The session is still checked against it, and saving keeps the password
+        self.assertEqual(self.client.get(reverse('travel:booking_list')).status_code, 200)
+        cached_user.first_name = 'Grace'
+        cached_user.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('testpass123'))
+    
+    def test_sessions_of_model_backend_stay_logged_in(self):
+        migration = import_module('accounts.migrations.0003_session_auth_backend')
+        client = Client()
+        with override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend']):
+            client.login(username='cached', password='testpass123')
+        self.assertEqual(client.get(reverse('travel:booking_list')).status_code, 302)
+        migration.forwards(apps, None)
+        self.assertEqual(client.get(reverse('travel:booking_list')).status_code, 200)
@@ -2,7 +2,10 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.utils import timezone
+from travel.models import Booking
 from .forms import CustomUserCreationForm, UserProfileForm
+from .stats import get_stats
 
 def signup(request):
     """User registration view"""
@@ -32,8 +35,16 @@ def profile(request):
     else:
         form = UserProfileForm(instance=profile)
     
+    # Precomputed, so the dashboard costs the same for every booking history
+    stats = get_stats(request.user)
+    upcoming_ids = stats.upcoming_booking_ids(timezone.now())
+    upcoming = Booking.objects.filter(pk__in=upcoming_ids).select_related('travel_option')
+    
     context = {
         'form': form,
         'user': request.user,
+        'stats': stats,
+        'favourite_routes': stats.favourite_routes(),
+        'upcoming_bookings': sorted(upcoming, key=lambda booking: upcoming_ids.index(booking.pk)),
     }
     return render(request, 'accounts/profile.html', context)
\ No newline at end of file
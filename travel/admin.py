@@ -1,32 +1,120 @@
+import csv
+from datetime import timedelta
+
 from django.contrib import admin
+from django.http import HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.html import format_html
-from .models import TravelOption, Booking
+from . import inventory, outbox, recurring, reports
+from .models import (
+    TravelOption, Booking, PriceHistory, WaitlistEntry, Job, ArchivedTravelOption, ArchivedBooking,
+    SlowQuery, SeatMap, SeatShard, DailyRouteStats, IdempotencyKey, ExchangeRate, RoutePopularity,
+    RecurringSchedule, OutboxEvent,
+)
 
 @admin.register(TravelOption)
 class TravelOptionAdmin(admin.ModelAdmin):
     list_display = ['travel_id', 'type', 'source', 'destination', 'departure_date', 
-                   'departure_time', 'price', 'available_seats', 'total_seats']
-    list_filter = ['type', 'departure_date', 'source', 'destination']
+                   'departure_time', 'duration', 'price', 'available_seats', 'total_seats']
+    list_filter = ['type', 'departure_date', 'source', 'destination', 'recurring_schedule']
     search_fields = ['travel_id', 'source', 'destination']
     ordering = ['departure_date', 'departure_time']
     date_hierarchy = 'departure_date'
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('travel_id', 'type', 'source', 'destination')
+            'fields': ('travel_id', 'type', 'source', 'destination', 'recurring_schedule')
         }),
         ('Schedule', {
             'fields': ('departure_date', 'departure_time', 'arrival_date', 'arrival_time')
         }),
         ('Pricing & Capacity', {
-            'fields': ('price', 'total_seats', 'available_seats')
+            'fields': ('price', 'base_price', 'total_seats', 'available_seats', 'seat_shards')
         }),
     )
+    readonly_fields = ['seat_shards']
+    actions = ['shard_seat_inventory', 'merge_seat_inventory']
     
     def get_readonly_fields(self, request, obj=None):
+        if obj and obj.seat_shards:  # seats live in the shards
+            return ['travel_id', 'available_seats'] + list(self.readonly_fields)
         if obj:  # editing an existing object
             return ['travel_id'] + list(self.readonly_fields)
         return self.readonly_fields
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'price' in form.changed_data:
+            outbox.prices_changed([(obj.pk, form.initial['price'], obj.price)])
+        if change and 'available_seats' in form.changed_data:
+            outbox.seats_changed(obj.pk, obj.available_seats - form.initial['available_seats'])
+    
+    @admin.action(description='Split seat inventory into shards (very busy departures)')
+    def shard_seat_inventory(self, request, queryset):
+        shards = inventory.default_shards()
+        pks = list(queryset.filter(seat_shards=0).values_list('pk', flat=True))
+        for pk in pks:
+            inventory.set_seat_shards(pk, shards)
+        self.message_user(request, f'{len(pks)} travel option(s) split into {shards} seat shards.')
+    
+    @admin.action(description='Merge seat shards back into one counter')
+    def merge_seat_inventory(self, request, queryset):
+        pks = list(queryset.filter(seat_shards__gt=0).values_list('pk', flat=True))
+        for pk in pks:
+            inventory.set_seat_shards(pk, 0)
+        self.message_user(request, f'{len(pks)} travel option(s) merged.')
+
+@admin.register(RecurringSchedule)
+class RecurringScheduleAdmin(admin.ModelAdmin):
+    list_display = ['code', 'type', 'source', 'destination', 'weekdays', 'departure_time',
+                   'valid_from', 'valid_until', 'base_price', 'total_seats', 'active', 'materialized_until']
+    list_filter = ['type', 'active']
+    search_fields = ['code', 'source', 'destination']
+    readonly_fields = ['materialized_until', 'created_at', 'updated_at']
+    actions = ['materialize_schedules']
+    
+    fieldsets = (
+        ('Route', {
+            'fields': ('code', 'type', 'source', 'destination', 'active')
+        }),
+        ('Timetable', {
+            'fields': ('weekdays', 'departure_time', 'arrival_time', 'arrival_day_offset',
+                       'valid_from', 'valid_until')
+        }),
+        ('Pricing & Capacity', {
+            'fields': ('base_price', 'total_seats')
+        }),
+        ('Expansion', {
+            'fields': ('materialized_until', 'created_at', 'updated_at'),
+            'classes': ['collapse']
+        }),
+    )
+    
+    def get_readonly_fields(self, request, obj=None):
+        if obj:  # departures' travel ids are derived from the code
+            return ['code'] + list(self.readonly_fields)
+        return self.readonly_fields
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            result = recurring.apply_changes(obj)
+            self.message_user(
+                request,
+                f"{result['updated']} departure(s) updated, {result['removed']} removed and "
+                f"{result['created']} added; {result['kept']} with bookings left unchanged."
+            )
+        else:
+            created = recurring.materialize(obj)
+            self.message_user(request, f'{created} departure(s) created.')
+    
+    @admin.action(description='Create departures up to the horizon now')
+    def materialize_schedules(self, request, queryset):
+        created = sum(recurring.materialize(schedule) for schedule in queryset)
+        self.message_user(request, f'{created} departure(s) created.')
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
@@ -68,4 +156,172 @@ class BookingAdmin(admin.ModelAdmin):
             colors.get(obj.status, 'black'),
             obj.get_status_display()
         )
-    colored_status.short_description = 'Status'
\ No newline at end of file
+    colored_status.short_description = 'Status'
+
+@admin.register(PriceHistory)
+class PriceHistoryAdmin(admin.ModelAdmin):
+    list_display = ['travel_option_id', 'old_price', 'new_price', 'load_factor',
+                   'days_to_departure', 'changed_at']
+    list_filter = ['changed_at', 'travel_option__type']
+    search_fields = ['travel_option__travel_id']
+    date_hierarchy = 'changed_at'
+    raw_id_fields = ['travel_option']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ['travel_option', 'user', 'number_of_seats', 'status',
+                   'created_at', 'allocated_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username', 'travel_option__travel_id']
+    raw_id_fields = ['user', 'travel_option', 'booking']
+    readonly_fields = ['created_at', 'allocated_at']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'task', 'status', 'attempts', 'max_attempts', 'run_at',
+                   'locked_by', 'updated_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'locked_by']
+    readonly_fields = ['created_at', 'updated_at', 'locked_by', 'locked_at', 'last_error']
+    actions = ['retry_jobs']
+    
+    @admin.action(description='Retry selected jobs now')
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), last_error=''
+        )
+        self.message_user(request, f'{updated} job(s) queued for retry.')
+
+class ReadOnlyAdmin(admin.ModelAdmin):
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedTravelOption)
+class ArchivedTravelOptionAdmin(ReadOnlyAdmin):
+    list_display = ['travel_id', 'type', 'source', 'destination', 'departure_date',
+                   'price', 'total_seats', 'archived_at']
+    list_filter = ['type', 'departure_date']
+    search_fields = ['travel_id', 'source', 'destination']
+    date_hierarchy = 'departure_date'
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(ReadOnlyAdmin):
+    list_display = ['booking_id', 'user', 'travel_option', 'number_of_seats',
+                   'total_price', 'status', 'booking_date', 'archived_at']
+    list_filter = ['status', 'booking_date']
+    search_fields = ['booking_id', 'user__username', 'travel_option__travel_id']
+    list_select_related = ['user', 'travel_option']
+    raw_id_fields = ['user', 'travel_option']
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(ReadOnlyAdmin):
+    list_display = ['short_statement', 'count', 'total_ms', 'avg_ms', 'max_ms', 'origin', 'last_seen']
+    list_filter = ['origin']
+    search_fields = ['statement', 'origin', 'location']
+    readonly_fields = ['fingerprint', 'statement', 'sample_params', 'origin', 'location', 'count',
+                       'total_ms', 'max_ms', 'explain_plan', 'first_seen', 'last_seen']
+    exclude = ['explain']
+    
+    @admin.display(description='Statement')
+    def short_statement(self, obj):
+        return obj.statement[:120]
+    
+    @admin.display(description='Avg ms')
+    def avg_ms(self, obj):
+        return round(obj.avg_ms, 1)
+    
+    @admin.display(description='Explain')
+    def explain_plan(self, obj):
+        return format_html('<pre>{}</pre>', obj.explain or 'Not available')
+
+@admin.register(SeatMap)
+class SeatMapAdmin(ReadOnlyAdmin):
+    list_display = ['travel_option', 'layout', 'capacity', 'free_count', 'updated_at']
+    search_fields = ['travel_option__travel_id']
+    exclude = ['taken']
+    readonly_fields = ['travel_option', 'layout', 'capacity', 'free_count', 'updated_at']
+
+@admin.register(SeatShard)
+class SeatShardAdmin(ReadOnlyAdmin):
+    list_display = ['travel_option', 'shard', 'available_seats']
+    search_fields = ['travel_option__travel_id']
+    raw_id_fields = ['travel_option']
+
+@admin.register(DailyRouteStats)
+class DailyRouteStatsAdmin(ReadOnlyAdmin):
+    list_display = ['day', 'source', 'destination', 'type', 'departures', 'total_seats',
+                   'seats_sold', 'occupancy', 'bookings', 'revenue']
+    list_filter = ['type', 'day']
+    search_fields = ['source', 'destination']
+    date_hierarchy = 'day'
+    change_list_template = 'admin/travel/dailyroutestats/change_list.html'
+    
+    def get_urls(self):
+        return [
+            path('report/', self.admin_site.admin_view(self.report_view), name='travel_dailyroutestats_report'),
+        ] + super().get_urls()
+    
+    def report_view(self, request):
+        """Occupancy and revenue over a date range, from the cached rollup; ?format=csv downloads it"""
+        today = timezone.now().date()
+        start = parse_date(request.GET.get('start') or '') or today - timedelta(days=30)
+        end = parse_date(request.GET.get('end') or '') or today + timedelta(days=30)
+        travel_type = request.GET.get('type') or None
+        route = request.GET.get('route', '').strip() or None
+        rows = reports.report_rows(start, end, travel_type, route)
+        
+        if request.GET.get('format') == 'csv':
+            response = HttpResponse(content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="occupancy-{start}-{end}.csv"'
+            writer = csv.writer(response)
+            writer.writerow(reports.COLUMNS)
+            for row in rows:
+                writer.writerow([row[column] for column in reports.COLUMNS])
+            return response
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Occupancy and revenue',
+            'rows': rows,
+            'totals': reports.totals(rows),
+            'start': start,
+            'end': end,
+            'travel_type': travel_type or '',
+            'route': route or '',
+            'travel_types': DailyRouteStats._meta.get_field('type').choices,
+            'query': request.GET.urlencode(),
+        }
+        return TemplateResponse(request, 'admin/travel/dailyroutestats/report.html', context)
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(ReadOnlyAdmin):
+    list_display = ['key', 'user', 'scope', 'created_at', 'expires_at']
+    search_fields = ['key', 'user__username', 'scope']
+    raw_id_fields = ['user']
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(ReadOnlyAdmin):
+    list_display = ['currency', 'rate', 'decimals', 'symbol', 'version', 'updated_at']
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(ReadOnlyAdmin):
+    list_display = ['id', 'topic', 'key', 'created_at']
+    list_filter = ['topic']
+    search_fields = ['=key']
+
+@admin.register(RoutePopularity)
+class RoutePopularityAdmin(ReadOnlyAdmin):
+    list_display = ['source', 'destination', 'score', 'updated_at']
+    search_fields = ['source', 'destination']
+    ordering = ['-score']
+
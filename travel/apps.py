@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class TravelConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'travel'
+    
+    def ready(self):
+        from . import metrics  # noqa: F401 connects booking signal receivers
+        from . import outbox  # noqa: F401 connects booking signal receivers
+        from . import reports  # noqa: F401 connects departure signal receivers
+        from . import tasks  # noqa: F401 registers background job handlers
+        from . import trending  # noqa: F401 connects booking signal receivers
@@ -0,0 +1,142 @@
+"""
+Hot/cold lifecycle for departures and bookings.
+
+Travel options that departed more than a retention window ago are moved,
+with all of their bookings, from the hot tables into ``ArchivedTravelOption``
+and ``ArchivedBooking``. Rows keep their primary keys, so existing booking
+URLs keep working: ``booking_detail`` and ``booking_list`` fall back to the
+archive transparently.
+
+Work is done in small batches, each in its own short transaction, so live
+traffic never waits behind a long-running lock.
+"""
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import TravelOption, Booking, ArchivedTravelOption, ArchivedBooking
+
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_BATCH_SIZE = 200
+
+
+def _copied_fields(source, target):
+    source_names = {f.attname for f in source._meta.concrete_fields}
+    return [
+        f.attname for f in target._meta.concrete_fields
+        if f.attname in source_names
+    ]
+
+
+def archive_batch(cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Move up to ``batch_size`` travel options that departed before ``cutoff``
+    and their bookings into the archive. Returns ``(options, bookings)`` moved.
+    """
+    option_fields = _copied_fields(TravelOption, ArchivedTravelOption)
+    booking_fields = _copied_fields(Booking, ArchivedBooking)
+
+    with transaction.atomic():
+        ids = list(
+            TravelOption.objects
+            .filter(departure_date__lt=cutoff)
+            .order_by('pk')
+            .select_for_update()
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0, 0
+
+        options = TravelOption.objects.filter(pk__in=ids)
+        bookings = Booking.objects.filter(travel_option_id__in=ids)
+        ArchivedTravelOption.objects.bulk_create(
+            [ArchivedTravelOption(**row) for row in options.values(*option_fields)],
+            batch_size=500,
+        )
+        archived_bookings = [ArchivedBooking(**row) for row in bookings.order_by().values(*booking_fields)]
+        ArchivedBooking.objects.bulk_create(archived_bookings, batch_size=500)
+
+        bookings.delete()
+        options.delete()
+        return len(ids), len(archived_bookings)
+
+
+def archive_departed(retention_days=DEFAULT_RETENTION_DAYS, batch_size=DEFAULT_BATCH_SIZE,
+                     pause=0, max_batches=None, today=None):
+    """Archive everything past the retention window. Returns ``(options, bookings)`` moved."""
+    today = today or timezone.now().date()
+    cutoff = today - timedelta(days=retention_days)
+    moved_options = moved_bookings = batches = 0
+    while max_batches is None or batches < max_batches:
+        options, bookings = archive_batch(cutoff, batch_size)
+        if not options:
+            break
+        moved_options += options
+        moved_bookings += bookings
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return moved_options, moved_bookings
+
+
+def table_sizes(models=(TravelOption, Booking, ArchivedTravelOption, ArchivedBooking)):
+    """
+    ``{table: (rows, bytes)}`` for the given models. On MySQL this reads the
+    cheap estimates from ``information_schema``; elsewhere rows are counted
+    and bytes is ``None``.
+    """
+    tables = [model._meta.db_table for model in models]
+    if connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH + INDEX_LENGTH "
+                "FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN (%s)" % ', '.join(['%s'] * len(tables)),
+                tables,
+            )
+            found = {name: (rows, size) for name, rows, size in cursor.fetchall()}
+        return {table: found.get(table, (0, 0)) for table in tables}
+    return {model._meta.db_table: (model.objects.count(), None) for model in models}
+
+
+class ChainedResults:
+    """
+    Read-only sequence over several querysets, one after the other, that
+    ``Paginator`` can slice. Only the querysets a page touches are queried.
+    """
+
+    def __init__(self, *querysets):
+        self.querysets = querysets
+        self._counts = None
+
+    def counts(self):
+        if self._counts is None:
+            self._counts = [qs.count() for qs in self.querysets]
+        return self._counts
+
+    def count(self):
+        return sum(self.counts())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            items = self[index:index + 1]
+            if not items:
+                raise IndexError(index)
+            return items[0]
+        start, stop = index.start or 0, index.stop
+        results = []
+        offset = 0
+        for qs, size in zip(self.querysets, self.counts()):
+            if stop is not None and stop <= offset:
+                break
+            lo = max(start - offset, 0)
+            hi = size if stop is None else min(stop - offset, size)
+            if lo < hi:
+                results.extend(qs[lo:hi])
+            offset += size
+        return results
@@ -0,0 +1,125 @@
+"""
+Fare display in the visitor's currency.
+
+Prices are stored and charged in ``TRAVEL_BASE_CURRENCY``. For display they
+are converted with the local ``ExchangeRate`` table, which
+``load_exchange_rates`` replaces from a file, stamping every row with a new
+version.
+
+* ``rate_table()`` is read from the cache, so a page view costs one cache
+  lookup; loading new rates clears it.
+* ``Converter`` objects are built once per process for each
+  ``(rate version, currency)`` and remember every amount they convert, so a
+  repeated fare costs a dict lookup. Amounts are converted as ``Decimal``
+  and rounded half up to the currency's minor unit.
+* Views call ``convert_prices`` on a whole page of objects; templates only
+  print the ``display_*`` attributes it sets.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ExchangeRate
+
+SESSION_KEY = 'currency'
+CACHE_KEY = 'currency:rates'
+CACHE_TIMEOUT = 300
+# Converted amounts remembered per converter
+MAX_FORMATTED = 10000
+
+BASE_SYMBOLS = {'USD': '$', 'EUR': '€', 'GBP': '£', 'INR': '₹', 'JPY': '¥'}
+
+
+def base_currency():
+    return getattr(settings, 'TRAVEL_BASE_CURRENCY', 'USD')
+
+
+def rate_table():
+    """``(version, {code: (rate, decimals, symbol)})``, always including the base currency"""
+    table = cache.get(CACHE_KEY)
+    if table is None:
+        base = base_currency()
+        rates = {base: (Decimal(1), 2, BASE_SYMBOLS.get(base, ''))}
+        version = 0
+        for row in ExchangeRate.objects.all():
+            rates[row.currency] = (row.rate, row.decimals, row.symbol)
+            version = max(version, row.version)
+        table = (version, rates)
+        cache.set(CACHE_KEY, table, CACHE_TIMEOUT)
+    return table
+
+
+def clear_cache():
+    cache.delete(CACHE_KEY)
+
+
+class Converter:
+    """Converts base-currency amounts into one currency at one rate version"""
+
+    def __init__(self, version, code, rate, decimals, symbol):
+        self.version = version
+        self.code = code
+        self.rate = rate
+        self.decimals = decimals
+        self.symbol = symbol
+        self.quantum = Decimal(1).scaleb(-decimals)
+        self.is_base = code == base_currency()
+        self._formatted = {}
+
+    def convert(self, amount):
+        return (Decimal(amount) * self.rate).quantize(self.quantum, rounding=ROUND_HALF_UP)
+
+    def format(self, amount):
+        formatted = self._formatted.get(amount)
+        if formatted is None:
+            value = self.convert(amount)
+            formatted = f'{self.symbol}{value}' if self.symbol else f'{value} {self.code}'
+            if len(self._formatted) >= MAX_FORMATTED:
+                self._formatted = {}
+            self._formatted[amount] = formatted
+        return formatted
+
+    @property
+    def cache_key(self):
+        """Part of ETags of pages showing converted prices"""
+        return f'{self.code}:{self.version}'
+
+
+@lru_cache(maxsize=128)
+def _converter(version, code, rate, decimals, symbol):
+    return Converter(version, code, rate, decimals, symbol)
+
+
+def get_converter(code=None):
+    version, rates = rate_table()
+    if code not in rates:
+        code = base_currency()
+    return _converter(version, code, *rates[code])
+
+
+def for_request(request):
+    """The converter for the currency chosen in the session, once per request"""
+    if not hasattr(request, '_currency'):
+        session = getattr(request, 'session', None)
+        request._currency = get_converter(session.get(SESSION_KEY) if session is not None else None)
+    return request._currency
+
+
+def convert_prices(objects, converter, fields=('price',)):
+    """Set ``display_<field>`` on every object; returns the objects"""
+    for obj in objects:
+        for field in fields:
+            setattr(obj, f'display_{field}', converter.format(getattr(obj, field)))
+    return objects
+
+
+def currency_context(request):
+    """Context processor for the currency picker"""
+    converter = for_request(request)
+    _, rates = rate_table()
+    return {
+        'currency': converter,
+        'currencies': sorted(rates) if len(rates) > 1 else [],
+    }
@@ -1,8 +1,13 @@
+import re
+import uuid
+from functools import lru_cache
+
 from django import forms
 from django.core.validators import MinValueValidator, MaxValueValidator
-from .models import TravelOption, Booking
+from .models import TravelOption, Booking, WaitlistEntry
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Fieldset, Submit, Row, Column
+from crispy_forms.utils import render_crispy_form
 
 class TravelSearchForm(forms.Form):
     TRAVEL_TYPES = [
@@ -11,6 +16,11 @@ class TravelSearchForm(forms.Form):
         ('train', 'Train'),
         ('bus', 'Bus'),
     ]
+    SORT_CHOICES = [
+        ('departure', 'Earliest departure'),
+        ('price', 'Lowest price'),
+        ('duration', 'Shortest duration'),
+    ]
     
     type = forms.ChoiceField(choices=TRAVEL_TYPES, required=False)
     source = forms.CharField(max_length=100, required=False)
@@ -18,29 +28,47 @@ class TravelSearchForm(forms.Form):
     departure_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
     min_price = forms.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=0)
     max_price = forms.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=0)
+    depart_after = forms.TimeField(required=False, widget=forms.TimeInput(attrs={'type': 'time'}))
+    depart_before = forms.TimeField(required=False, widget=forms.TimeInput(attrs={'type': 'time'}))
+    max_duration = forms.IntegerField(required=False, min_value=1, label='Max duration (hours)')
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False)
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'get'
-        self.helper.layout = Layout(
-            Row(
-                Column('type', css_class='form-group col-md-6 mb-0'),
-                Column('departure_date', css_class='form-group col-md-6 mb-0'),
-                css_class='form-row'
-            ),
-            Row(
-                Column('source', css_class='form-group col-md-6 mb-0'),
-                Column('destination', css_class='form-group col-md-6 mb-0'),
-                css_class='form-row'
-            ),
-            Row(
-                Column('min_price', css_class='form-group col-md-6 mb-0'),
-                Column('max_price', css_class='form-group col-md-6 mb-0'),
-                css_class='form-row'
-            ),
-            Submit('submit', 'Search', css_class='btn btn-primary')
-        )
+    # Built once per process and shared by every instance; crispy only reads it
+    helper = FormHelper()
+    helper.form_method = 'get'
+    helper.layout = Layout(
+        Row(
+            Column('type', css_class='form-group col-md-6 mb-0'),
+            Column('departure_date', css_class='form-group col-md-6 mb-0'),
+            css_class='form-row'
+        ),
+        Row(
+            Column('source', css_class='form-group col-md-6 mb-0'),
+            Column('destination', css_class='form-group col-md-6 mb-0'),
+            css_class='form-row'
+        ),
+        Row(
+            Column('min_price', css_class='form-group col-md-6 mb-0'),
+            Column('max_price', css_class='form-group col-md-6 mb-0'),
+            css_class='form-row'
+        ),
+        Row(
+            Column('depart_after', css_class='form-group col-md-3 mb-0'),
+            Column('depart_before', css_class='form-group col-md-3 mb-0'),
+            Column('max_duration', css_class='form-group col-md-3 mb-0'),
+            Column('sort', css_class='form-group col-md-3 mb-0'),
+            css_class='form-row'
+        ),
+        Submit('submit', 'Search', css_class='btn btn-primary')
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        depart_after = cleaned_data.get('depart_after')
+        depart_before = cleaned_data.get('depart_before')
+        if depart_after and depart_before and depart_after > depart_before:
+            raise forms.ValidationError("'Depart after' must be earlier than 'depart before'.")
+        return cleaned_data
 
 class BookingForm(forms.ModelForm):
     passenger_names = forms.CharField(
@@ -49,6 +77,13 @@ class BookingForm(forms.ModelForm):
         required=True
     )
     contact_phone = forms.CharField(max_length=15, required=True)
+    seat_selection = forms.CharField(
+        required=False,
+        label='Seats',
+        help_text="Pick seats on the map or leave empty to be seated together automatically",
+    )
+    # Read by the view before validation; see travel/idempotency.py
+    idempotency_key = forms.CharField(required=False, widget=forms.HiddenInput)
     
     class Meta:
         model = Booking
@@ -57,24 +92,30 @@ class BookingForm(forms.ModelForm):
             'number_of_seats': forms.NumberInput(attrs={'min': 1, 'max': 10}),
         }
     
+    helper = FormHelper()
+    helper.layout = Layout(
+        'number_of_seats',
+        'passenger_names',
+        'contact_phone',
+        'seat_selection',
+        'idempotency_key',
+        Submit('submit', 'Confirm Booking', css_class='btn btn-success btn-lg')
+    )
+    
     def __init__(self, *args, **kwargs):
         self.travel_option = kwargs.pop('travel_option', None)
         super().__init__(*args, **kwargs)
         
+        # A fresh key per rendered form; a re-rendered bound form keeps the submitted one
+        if not self.is_bound:
+            self.initial.setdefault('idempotency_key', uuid.uuid4().hex)
+        
         if self.travel_option:
             max_seats = min(10, self.travel_option.available_seats)
             self.fields['number_of_seats'].widget.attrs['max'] = max_seats
             self.fields['number_of_seats'].validators = [
                 MinValueValidator(1)
             ]
-        
-        self.helper = FormHelper()
-        self.helper.layout = Layout(
-            'number_of_seats',
-            'passenger_names',
-            'contact_phone',
-            Submit('submit', 'Confirm Booking', css_class='btn btn-success btn-lg')
-        )
     
     def clean_number_of_seats(self):
         seats = self.cleaned_data['number_of_seats']
@@ -91,4 +132,56 @@ class BookingForm(forms.ModelForm):
             if len(name_list) != required_names:
                 raise forms.ValidationError(f"Please provide exactly {required_names} passenger names.")
         
-        return name_list
\ No newline at end of file
+        return name_list
+    
+    def clean_seat_selection(self):
+        value = self.cleaned_data.get('seat_selection', '')
+        seats = list(dict.fromkeys(
+            seat.strip().upper() for seat in value.replace(' ', ',').split(',') if seat.strip()
+        ))
+        for seat in seats:
+            if not re.fullmatch(r'[0-9]{1,4}[A-Z]', seat):
+                raise forms.ValidationError(f"'{seat}' is not a seat number like 12A.")
+        return seats
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        seats = cleaned_data.get('seat_selection')
+        number_of_seats = cleaned_data.get('number_of_seats')
+        if seats and number_of_seats and len(seats) != number_of_seats:
+            self.add_error('seat_selection', f"Please pick exactly {number_of_seats} seats or none.")
+        return cleaned_data
+
+class WaitlistForm(BookingForm):
+    """Collects the same details as a booking, without checking availability"""
+    
+    class Meta(BookingForm.Meta):
+        model = WaitlistEntry
+    
+    helper = FormHelper()
+    helper.layout = Layout(
+        'number_of_seats',
+        'passenger_names',
+        'contact_phone',
+        Submit('submit', 'Join Waitlist', css_class='btn btn-warning btn-lg')
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Seats are assigned when the waitlist entry is allocated
+        del self.fields['seat_selection']
+        del self.fields['idempotency_key']
+
+@lru_cache(maxsize=None)
+def _unbound_search_form_html():
+    return render_crispy_form(TravelSearchForm())
+
+def render_search_form(form):
+    """
+    Crispy markup of a search form. The empty form (most home page views) is
+    the same for everyone and is rendered once per process.
+    """
+    if not form.is_bound:
+        return _unbound_search_form_html()
+    return render_crispy_form(form)
+
@@ -0,0 +1,141 @@
+"""
+Idempotency keys for booking and cancellation submissions.
+
+Clients send a key with a POST, either as the ``Idempotency-Key`` header or
+as the ``idempotency_key`` form field (the booking and cancellation forms
+embed a fresh one each time they are rendered). The first submission with a
+key records its outcome in ``IdempotencyKey``; any repeat within
+``TRAVEL_IDEMPOTENCY_TTL`` seconds gets that outcome back without touching
+seat inventory.
+
+* ``lookup`` runs before the view does any other work or takes any lock: a
+  cache read, falling back to one read on the ``(user, key)`` unique index.
+* ``claim`` inserts the key as the first statement of the booking
+  transaction. A concurrent duplicate blocks on the unique index until the
+  first commits (and then replays its result) or rolls back (and then goes
+  ahead), so two submissions with the same key never both book.
+
+Expired keys are ignored and overwritten on reuse; ``purge_expired`` (the
+``purge_idempotency_keys`` command) deletes them.
+"""
+import hashlib
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+DEFAULT_TTL = 24 * 60 * 60
+CACHE_PREFIX = 'idempotency'
+
+_KEY_RE = re.compile(r'^[A-Za-z0-9_.:-]{1,64}$')
+
+
+class InvalidKey(ValueError):
+    pass
+
+
+class KeyReused(Exception):
+    """The key was already used for a different request"""
+
+
+class Replay(Exception):
+    """Raised by ``claim`` when the key was completed by another submission"""
+
+    def __init__(self, result):
+        super().__init__('Duplicate submission')
+        self.result = result
+
+
+def get_ttl():
+    return getattr(settings, 'TRAVEL_IDEMPOTENCY_TTL', DEFAULT_TTL)
+
+
+def get_key(request):
+    """The request's idempotency key, or None; raises ``InvalidKey`` for malformed keys"""
+    key = (request.headers.get(HEADER) or request.POST.get(FIELD) or '').strip()
+    if not key:
+        return None
+    if not _KEY_RE.match(key):
+        raise InvalidKey('Idempotency keys are 1-64 letters, digits or "_.:-".')
+    return key
+
+
+def _cache_key(user_id, key):
+    return f'{CACHE_PREFIX}:{user_id}:{hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()}'
+
+
+def _checked(scope, stored_scope, result):
+    if stored_scope != scope:
+        raise KeyReused(f'Idempotency key already used for {stored_scope}.')
+    return result
+
+
+def lookup(user, key, scope):
+    """The recorded result of ``key``, or None if it has not been used (or has expired)"""
+    cached = cache.get(_cache_key(user.pk, key))
+    if cached is not None:
+        return _checked(scope, *cached)
+    row = (
+        IdempotencyKey.objects
+        .filter(user=user, key=key, expires_at__gt=timezone.now())
+        .values_list('scope', 'result', 'expires_at')
+        .first()
+    )
+    if row is None:
+        return None
+    stored_scope, result, expires_at = row
+    timeout = int((expires_at - timezone.now()).total_seconds())
+    if timeout > 0:
+        cache.set(_cache_key(user.pk, key), (stored_scope, result), timeout)
+    return _checked(scope, stored_scope, result)
+
+
+def claim(user, key, scope):
+    """
+    Reserve ``key`` for this submission; must run inside the transaction that
+    does the work. Raises ``Replay`` or ``KeyReused`` if it is already taken.
+    """
+    expires_at = timezone.now() + timedelta(seconds=get_ttl())
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(user=user, key=key, scope=scope, expires_at=expires_at)
+        except IntegrityError:
+            existing = IdempotencyKey.objects.select_for_update().filter(user=user, key=key).first()
+            if existing is None:
+                continue
+            if existing.expires_at <= timezone.now():
+                existing.delete()
+                continue
+            raise Replay(_checked(scope, existing.scope, existing.result))
+    raise IntegrityError(f'Could not claim idempotency key {key}')
+
+
+def complete(record, result):
+    """Store the outcome of a claimed key; cached once the transaction commits"""
+    record.result = result
+    record.save(update_fields=['result'])
+    timeout = int((record.expires_at - timezone.now()).total_seconds())
+    transaction.on_commit(
+        lambda: cache.set(_cache_key(record.user_id, record.key), (record.scope, result), max(timeout, 1))
+    )
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired keys in batches; returns the number deleted"""
+    deleted = 0
+    while True:
+        pks = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .order_by('expires_at').values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
@@ -0,0 +1,409 @@
+"""
+Seat inventory operations.
+
+Every change to ``TravelOption.available_seats`` goes through here so the
+locking rules are in one place:
+
+* seats are taken only from rows locked with ``SELECT ... FOR UPDATE``;
+  several rows are always locked in primary-key order, so two transactions
+  touching the same departures cannot deadlock on each other;
+* seats are given back with a single ``UPDATE ... SET available_seats =
+  available_seats + n``, which needs no prior read;
+* the departure's ``SeatMap`` is locked after its travel option, never
+  before, by both claims and releases.
+
+A departure so popular that bookings queue on its row can be switched to
+sharded mode (``set_seat_shards``): its seats are split over
+``TravelOption.seat_shards`` ``SeatShard`` counters and its row is no longer
+locked or written by bookings.
+
+* A booking takes its seats from a random shard with one conditional
+  ``UPDATE ... WHERE available_seats >= n``, trying the other shards in turn
+  when that one runs dry. An update that matches nothing keeps no lock under
+  READ COMMITTED (Django's MySQL default), so only a booking spread over
+  several shards, near sell-out, locks them, all of them, in shard order.
+* Cancellations give seats back to a random shard.
+* ``available_seats()`` sums the shards. ``TravelOption.available_seats``
+  is brought up to date by ``sync_shard_totals`` (the ``sync_seat_shards``
+  command) for search and listings; live updates sum the shards.
+* Bookings of sharded departures get no seat numbers: the seat map is a
+  single row and would serialize them again.
+
+Seats taken and given back are also recorded as outbox events (see
+``outbox``), in the same transaction.
+
+All functions except ``reconcile_inventory``, ``set_seat_shards`` and
+``sync_shard_totals`` must be called inside ``transaction.atomic()``.
+"""
+import random
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from . import outbox
+from .models import Booking, SeatMap, SeatShard, TravelOption
+from .seatmap import default_layout
+
+MAX_SEAT_SHARDS = 64
+
+
+class InsufficientSeats(Exception):
+    def __init__(self, travel_option, requested):
+        self.travel_option = travel_option
+        self.requested = requested
+        super().__init__(
+            f"Only {travel_option.available_seats} seats available on {travel_option.travel_id}."
+        )
+
+
+class SeatUnavailable(InsufficientSeats):
+    def __init__(self, travel_option, seats):
+        self.travel_option = travel_option
+        self.requested = len(seats)
+        self.seats = seats
+        Exception.__init__(
+            self, f"Seat {', '.join(seats)} is not available on {travel_option.travel_id}."
+            if len(seats) == 1 else
+            f"Seats {', '.join(seats)} are not available on {travel_option.travel_id}."
+        )
+
+
+def lock_travel_options(ids):
+    """
+    Lock the given travel options in primary-key order; returns ``{pk: option}``.
+    Sharded departures are read without a lock, with ``available_seats``
+    summed from their shards.
+    """
+    ids = set(ids)
+    options = TravelOption.objects.select_for_update().filter(pk__in=ids, seat_shards=0).order_by('pk')
+    locked = {option.pk: option for option in options}
+    missing = ids - locked.keys()
+    if missing:
+        totals = _shard_totals(missing)
+        for option in TravelOption.objects.filter(pk__in=missing, seat_shards__gt=0):
+            option.available_seats = totals.get(option.pk, 0)
+            locked[option.pk] = option
+    return locked
+
+
+def lock_seat_shards(travel_option):
+    """
+    Lock every shard of a sharded departure from ``lock_travel_options``, in
+    shard order, and set its ``available_seats`` to their exact sum, for
+    callers that size bookings on that count (waitlist allocation).
+    Bookings of the departure wait until the transaction ends.
+    """
+    if not travel_option.seat_shards:
+        return travel_option
+    locked = list(SeatShard.objects.select_for_update().filter(travel_option_id=travel_option.pk).order_by('shard'))
+    if not locked:
+        # Merged back since it was read
+        current = lock_travel_options([travel_option.pk])[travel_option.pk]
+        travel_option.seat_shards, travel_option.available_seats = current.seat_shards, current.available_seats
+        return travel_option
+    travel_option.available_seats = sum(shard.available_seats for shard in locked)
+    return travel_option
+
+
+def reserve_seats(travel_option, seats):
+    """Take seats from a travel option locked by ``lock_travel_options``"""
+    _take_seats(travel_option, seats)
+    outbox.seats_changed(travel_option.pk, -seats)
+
+
+def _take_seats(travel_option, seats):
+    if travel_option.seat_shards:
+        _take_from_shards(travel_option, seats)
+        return
+    if travel_option.available_seats < seats:
+        raise InsufficientSeats(travel_option, seats)
+    travel_option.available_seats -= seats
+    travel_option.save(update_fields=['available_seats', 'updated_at'])
+
+
+def _take_from_shards(travel_option, seats):
+    shards = SeatShard.objects.filter(travel_option_id=travel_option.pk)
+    count = travel_option.seat_shards
+    start = random.randrange(count)
+    for shard in [*range(start, count), *range(start)]:
+        if shards.filter(shard=shard, available_seats__gte=seats).update(available_seats=F('available_seats') - seats):
+            travel_option.available_seats = max(travel_option.available_seats - seats, 0)
+            return
+    # No single shard has enough: spread the booking over several
+    locked = list(shards.select_for_update().order_by('shard'))
+    if not locked:
+        # Merged back since it was read
+        current = lock_travel_options([travel_option.pk])[travel_option.pk]
+        travel_option.seat_shards, travel_option.available_seats = current.seat_shards, current.available_seats
+        _take_seats(travel_option, seats)
+        return
+    travel_option.available_seats = sum(shard.available_seats for shard in locked)
+    if travel_option.available_seats < seats:
+        raise InsufficientSeats(travel_option, seats)
+    remaining = seats
+    for shard in locked:
+        taken = min(shard.available_seats, remaining)
+        shard.available_seats -= taken
+        remaining -= taken
+    SeatShard.objects.bulk_update(locked, ['available_seats'])
+    travel_option.available_seats -= seats
+
+
+def release_seats(travel_option_id, seats, seat_numbers=()):
+    """Give seats back to a travel option without reading it first"""
+    released = False
+    for _ in range(3):
+        if TravelOption.objects.filter(pk=travel_option_id, seat_shards=0).update(
+            available_seats=F('available_seats') + seats,
+            updated_at=timezone.now(),
+        ):
+            released = True
+            break
+        count = TravelOption.objects.filter(pk=travel_option_id).values_list('seat_shards', flat=True).first()
+        if count is None:
+            break
+        # A count of 0 means it was merged back since the update: try that again
+        if count and SeatShard.objects.filter(
+            travel_option_id=travel_option_id, shard=random.randrange(count),
+        ).update(available_seats=F('available_seats') + seats):
+            released = True
+            break
+    if released:
+        outbox.seats_changed(travel_option_id, seats)
+    if seat_numbers:
+        seat_map = SeatMap.objects.select_for_update().filter(travel_option_id=travel_option_id).first()
+        if seat_map is not None:
+            seat_map.taken_bits = seat_map.taken_bits & ~seat_map.plan.mask(seat_numbers)
+            seat_map.save(update_fields=['taken', 'updated_at'])
+
+
+def get_seat_map(travel_option):
+    """
+    Locked seat map of a travel option locked by ``lock_travel_options``,
+    created on first use. Confirmed bookings made before the departure had a
+    seat map are given seats at that point, oldest first.
+    """
+    seat_map = SeatMap.objects.select_for_update().filter(travel_option=travel_option).first()
+    if seat_map is not None:
+        if seat_map.capacity < travel_option.total_seats:
+            seat_map.capacity = travel_option.total_seats
+            seat_map.taken_bits = seat_map.taken_bits
+            seat_map.save(update_fields=['capacity', 'taken', 'updated_at'])
+        return seat_map
+
+    seat_map = SeatMap(
+        travel_option=travel_option,
+        layout=default_layout(travel_option.type, travel_option.total_seats),
+        capacity=travel_option.total_seats,
+    )
+    plan = seat_map.plan
+    taken = 0
+    seated = []
+    existing = Booking.objects.filter(travel_option=travel_option, status='confirmed').order_by('booking_date', 'pk')
+    for booking in existing:
+        bits = plan.find(taken, booking.number_of_seats)
+        if bits is None:
+            break
+        taken |= bits
+        booking.seat_numbers = plan.labels(bits)
+        booking.updated_at = timezone.now()
+        seated.append(booking)
+    Booking.objects.bulk_update(seated, ['seat_numbers', 'updated_at'], batch_size=500)
+    seat_map.taken_bits = taken
+    seat_map.save(force_insert=True)
+    return seat_map
+
+
+def claim_seats(travel_option, bookings, requested=None):
+    """
+    Give each unsaved booking seats on a travel option locked by
+    ``lock_travel_options``, side by side where possible. ``requested`` is a
+    list of seat labels picked by the user for a single booking. Call it
+    next to ``reserve_seats``; raises ``SeatUnavailable`` or
+    ``InsufficientSeats``. Sharded departures assign no seats.
+    """
+    if travel_option.seat_shards:
+        if requested:
+            raise SeatUnavailable(travel_option, requested)
+        return
+    seat_map = get_seat_map(travel_option)
+    plan = seat_map.plan
+    taken = seat_map.taken_bits
+    for booking in bookings:
+        if requested:
+            try:
+                bits = plan.mask(requested)
+            except ValueError:
+                raise SeatUnavailable(travel_option, requested)
+            if bits & taken:
+                raise SeatUnavailable(travel_option, plan.labels(bits & taken))
+        else:
+            bits = plan.find(taken, booking.number_of_seats)
+            if bits is None:
+                raise InsufficientSeats(travel_option, booking.number_of_seats)
+        taken |= bits
+        booking.seat_numbers = plan.labels(bits)
+    seat_map.taken_bits = taken
+    seat_map.save(update_fields=['taken', 'updated_at'])
+
+
+def _shard_totals(ids):
+    """``{travel option pk: seats left in its shards}``, in one grouped query"""
+    return dict(
+        SeatShard.objects.filter(travel_option_id__in=ids).order_by()
+        .values('travel_option_id').annotate(seats=Sum('available_seats'))
+        .values_list('travel_option_id', 'seats')
+    )
+
+
+def available_seats(travel_option):
+    """Seats left on a departure, summed from its shards in sharded mode"""
+    if not travel_option.seat_shards:
+        return travel_option.available_seats
+    return _shard_totals([travel_option.pk]).get(travel_option.pk, 0)
+
+
+def sum_shards(travel_options):
+    """Set ``available_seats`` of the sharded ones among ``travel_options`` from their shards, in one query"""
+    sharded = {option.pk: option for option in travel_options if getattr(option, 'seat_shards', 0)}
+    if sharded:
+        totals = _shard_totals(sharded)
+        for pk, option in sharded.items():
+            option.available_seats = totals.get(pk, 0)
+    return travel_options
+
+
+def default_shards():
+    return getattr(settings, 'TRAVEL_SEAT_SHARDS', 8)
+
+
+def set_seat_shards(travel_option_id, shards):
+    """
+    Split a departure's seats over ``shards`` counters, or merge them back
+    into ``available_seats`` with ``shards=0``. Safe while bookings are
+    being made: the row and all its shards are locked for the switch.
+    """
+    if not 0 <= shards <= MAX_SEAT_SHARDS:
+        raise ValueError(f'Between 0 and {MAX_SEAT_SHARDS} shards.')
+    with transaction.atomic():
+        option = TravelOption.objects.select_for_update().get(pk=travel_option_id)
+        existing = list(SeatShard.objects.select_for_update().filter(travel_option=option).order_by('shard'))
+        if option.seat_shards:
+            option.available_seats = sum(shard.available_seats for shard in existing)
+        SeatShard.objects.filter(travel_option=option).delete()
+        per_shard, extra = divmod(option.available_seats, shards or 1)
+        SeatShard.objects.bulk_create([
+            SeatShard(travel_option=option, shard=shard, available_seats=per_shard + (shard < extra))
+            for shard in range(shards)
+        ])
+        option.seat_shards = shards
+        option.save(update_fields=['seat_shards', 'available_seats', 'updated_at'])
+    return option
+
+
+def sync_shard_totals():
+    """
+    Copy the shard sums of sharded departures into ``available_seats``
+    where they differ; returns the number of departures updated.
+    """
+    totals = _shard_totals(TravelOption.objects.filter(seat_shards__gt=0).values('pk'))
+    recorded = dict(TravelOption.objects.filter(pk__in=totals).values_list('pk', 'available_seats'))
+    total = Subquery(
+        SeatShard.objects.filter(travel_option=OuterRef('pk')).order_by()
+        .values('travel_option').annotate(seats=Sum('available_seats')).values('seats')
+    )
+    updated = 0
+    for pk, seats in totals.items():
+        if recorded.get(pk, seats) != seats:
+            # Summed again in the statement itself, and only while still sharded
+            updated += TravelOption.objects.filter(pk=pk, seat_shards__gt=0).update(
+                available_seats=total, updated_at=timezone.now(),
+            )
+    return updated
+
+
+def _confirmed_seats(ids):
+    """``{travel option pk: confirmed seats}``, in one grouped query"""
+    return dict(
+        Booking.objects.filter(travel_option_id__in=ids, status='confirmed').order_by()
+        .values('travel_option_id').annotate(seats=Sum('number_of_seats'))
+        .values_list('travel_option_id', 'seats')
+    )
+
+
+def reconcile_inventory(batch_size=1000, dry_run=False, pause=0, today=None):
+    """
+    Check ``available_seats == total_seats - confirmed seats`` for every
+    upcoming departure and repair the ones that drifted. Returns the drift
+    report, one dict per repaired (or, with ``dry_run``, drifted) departure.
+
+    Departures are read in primary-key batches, without locks, and their
+    confirmed seats summed with one grouped query on the bookings' travel
+    option index. Only drifted rows are then locked, in primary-key order
+    like any booking, re-checked under the lock and fixed with one bulk
+    update, so a live booking waits at most for one short transaction.
+    Sharded departures are skipped: their ``available_seats`` is a copy of
+    the shard sums.
+    """
+    today = today or timezone.now().date()
+    report = []
+    last_pk = 0
+    while True:
+        batch = list(
+            TravelOption.objects.filter(pk__gt=last_pk, departure_date__gte=today, seat_shards=0)
+            .order_by('pk').values_list('pk', 'total_seats', 'available_seats')[:batch_size]
+        )
+        if not batch:
+            return report
+        last_pk = batch[-1][0]
+        sold = _confirmed_seats([pk for pk, _, _ in batch])
+        drifted = [
+            pk for pk, total_seats, available_seats in batch
+            if available_seats != max(total_seats - sold.get(pk, 0), 0)
+        ]
+        if drifted:
+            report.extend(_repair(drifted, dry_run))
+        if pause:
+            time.sleep(pause)
+
+
+def _repair(ids, dry_run):
+    report = []
+    with transaction.atomic():
+        options = lock_travel_options(ids) if not dry_run else TravelOption.objects.in_bulk(ids)
+        sold = _confirmed_seats(ids)
+        now = timezone.now()
+        changed = []
+        for pk, option in options.items():
+            if option.seat_shards:
+                # Switched to sharded mode since the batch was read
+                continue
+            expected = option.total_seats - sold.get(pk, 0)
+            if option.available_seats == max(expected, 0):
+                # Fixed by a booking or cancellation since the batch was read
+                continue
+            report.append({
+                'travel_option': pk,
+                'travel_id': option.travel_id,
+                'departure_date': option.departure_date,
+                'recorded': option.available_seats,
+                'expected': expected,
+                'drift': option.available_seats - expected,
+            })
+            option.available_seats = max(expected, 0)
+            option.updated_at = now
+            changed.append(option)
+        if not dry_run:
+            TravelOption.objects.bulk_update(changed, ['available_seats', 'updated_at'])
+            outbox.record(outbox.SEATS_CHANGED, [
+                (row['travel_option'], {
+                    'travel_option_id': row['travel_option'],
+                    'delta': max(row['expected'], 0) - row['recorded'],
+                })
+                for row in report
+            ])
+    return report
+
@@ -0,0 +1,95 @@
+"""
+Atomic multi-option bookings.
+
+An itinerary books the same group of passengers on several travel options
+(a round trip, a multi-leg journey) in a single transaction: every leg
+succeeds or none does. Travel option rows are locked in primary-key order
+(see ``inventory.lock_travel_options``), so concurrent itineraries over
+overlapping departures queue up instead of deadlocking.
+
+``Booking.number_of_seats`` is capped at ``Booking.MAX_SEATS``, so a large
+group is split into several bookings per leg, all written with one bulk
+insert.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .inventory import InsufficientSeats, claim_seats, lock_travel_options, reserve_seats
+from .jobs import enqueue
+from .models import Booking, Itinerary
+from .signals import bookings_created
+
+MAX_LEGS = 6
+MAX_PASSENGERS = 200
+
+
+class ItineraryError(Exception):
+    pass
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def book_itinerary(user, travel_option_ids, passenger_names, contact_phone=''):
+    """
+    Book every passenger on every listed travel option, all or nothing.
+    Returns the ``Itinerary``. Raises ``ItineraryError`` or
+    ``InsufficientSeats`` without changing anything on failure.
+    """
+    if not travel_option_ids:
+        raise ItineraryError('An itinerary needs at least one travel option.')
+    if len(travel_option_ids) > MAX_LEGS:
+        raise ItineraryError(f'An itinerary can have at most {MAX_LEGS} travel options.')
+    if len(set(travel_option_ids)) != len(travel_option_ids):
+        raise ItineraryError('Each travel option can appear only once.')
+    if not passenger_names:
+        raise ItineraryError('At least one passenger is required.')
+    if len(passenger_names) > MAX_PASSENGERS:
+        raise ItineraryError(f'At most {MAX_PASSENGERS} passengers can travel on one itinerary.')
+
+    seats = len(passenger_names)
+    groups = _chunks(list(passenger_names), Booking.MAX_SEATS)
+    today = timezone.now().date()
+
+    with transaction.atomic():
+        options = lock_travel_options(travel_option_ids)
+        missing = [pk for pk in travel_option_ids if pk not in options]
+        if missing:
+            raise ItineraryError(f'Unknown travel option(s): {", ".join(map(str, missing))}.')
+
+        # Validate every leg before touching any inventory
+        for option in options.values():
+            if option.departure_date < today:
+                raise ItineraryError(f'{option.travel_id} has already departed.')
+            if option.available_seats < seats:
+                raise InsufficientSeats(option, seats)
+
+        total_price = sum(options[pk].price * seats for pk in travel_option_ids)
+        itinerary = Itinerary.objects.create(user=user, total_price=total_price)
+
+        bookings = []
+        for pk in travel_option_ids:
+            option = options[pk]
+            reserve_seats(option, seats)
+            leg = [
+                Booking(
+                    booking_id=Booking.generate_booking_id(),
+                    user=user,
+                    travel_option=option,
+                    itinerary=itinerary,
+                    number_of_seats=len(names),
+                    total_price=option.price * len(names),
+                    passenger_details={'names': names, 'contact_phone': contact_phone},
+                )
+                for names in groups
+            ]
+            claim_seats(option, leg)
+            bookings.extend(leg)
+        Booking.objects.bulk_create(bookings, batch_size=500)
+        Booking.assign_missing_pks(bookings)
+        bookings_created.send(sender=Booking, bookings=bookings, source='itinerary')
+        enqueue('travel.send_itinerary_confirmation', {'itinerary_id': itinerary.pk})
+
+    itinerary.booking_list = bookings
+    return itinerary
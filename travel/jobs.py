@@ -0,0 +1,204 @@
+"""
+Database-backed background job queue.
+
+Jobs live in the ``Job`` table of the main database, so enqueueing from a
+view is just an INSERT that commits (or rolls back) together with the rest of
+the request's transaction, and no external broker is needed.
+
+Workers (``run_job_worker`` command) claim jobs in batches. Where the backend
+supports ``SELECT ... FOR UPDATE SKIP LOCKED`` (MySQL 8, PostgreSQL) competing
+workers never block each other; elsewhere a conditional UPDATE on ``status``
+makes sure each job is claimed by exactly one worker. Failed jobs are retried
+with exponential backoff and moved to the ``dead`` status once
+``max_attempts`` is exhausted. Workers put back jobs of crashed workers every
+``STALE_CHECK_SECONDS``, and ``purge_jobs`` deletes finished and dead jobs
+after ``TRAVEL_JOB_RETENTION_DAYS``.
+"""
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import slowlog
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 3600
+STALE_AFTER = timedelta(minutes=15)
+STALE_CHECK_SECONDS = 60
+DEFAULT_RETENTION_DAYS = 7
+
+_registry = {}
+
+
+class UnknownTask(Exception):
+    pass
+
+
+def task(name):
+    """Register a function as the handler for jobs named ``name``"""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(task_name, payload=None, run_at=None, max_attempts=5):
+    """
+    Queue a job. Call it inside the transaction that makes the change the job
+    is about; the job only becomes visible to workers when that commits.
+    """
+    if task_name not in _registry:
+        raise UnknownTask(task_name)
+    return Job.objects.create(
+        task=task_name,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before retry number ``attempts``, with +-10% jitter"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.9, 1.1)
+
+
+def claim_jobs(worker_id, limit=10):
+    """Atomically take up to ``limit`` due jobs for ``worker_id``"""
+    now = timezone.now()
+    due = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+    claim = {
+        'status': 'running',
+        'locked_by': worker_id,
+        'locked_at': now,
+        'attempts': F('attempts') + 1,
+        'updated_at': now,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            if ids:
+                Job.objects.filter(id__in=ids).update(**claim)
+    else:
+        ids = []
+        for job_id in due.values_list('id', flat=True)[:limit * 2]:
+            if Job.objects.filter(id=job_id, status='queued').update(**claim):
+                ids.append(job_id)
+                if len(ids) == limit:
+                    break
+
+    if not ids:
+        return []
+    return list(Job.objects.filter(id__in=ids).order_by('run_at', 'id'))
+
+
+def run_job(job):
+    """Run one claimed job and record the outcome. Returns True on success."""
+    try:
+        handler = _registry.get(job.task)
+        if handler is None:
+            raise UnknownTask(job.task)
+        with transaction.atomic():
+            handler(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s (%s) moved to dead letter after %s attempts', job.pk, job.task, job.attempts)
+            Job.objects.filter(pk=job.pk).update(
+                status='dead', last_error=error, locked_by='', locked_at=None, updated_at=now,
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status='queued',
+                last_error=error,
+                locked_by='',
+                locked_at=None,
+                run_at=now + timedelta(seconds=backoff_delay(job.attempts)),
+                updated_at=now,
+            )
+        return False
+
+    Job.objects.filter(pk=job.pk).update(
+        status='done', last_error='', locked_by='', locked_at=None, updated_at=timezone.now(),
+    )
+    return True
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """
+    Put back jobs whose worker died while running them. Jobs that already
+    used up their attempts go to the dead letter status instead.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', locked_at__lt=now - older_than)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status='dead', last_error='Worker stopped responding', locked_by='', locked_at=None, updated_at=now,
+    )
+    return stale.update(status='queued', locked_by='', locked_at=None, updated_at=now)
+
+
+def get_retention_days():
+    return getattr(settings, 'TRAVEL_JOB_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+
+
+def purge_finished(older_than=None, batch_size=1000):
+    """Delete done and dead jobs last updated before ``older_than`` ago, in batches; returns the number deleted"""
+    if older_than is None:
+        older_than = timedelta(days=get_retention_days())
+    cutoff = timezone.now() - older_than
+    deleted = 0
+    for status in ('done', 'dead'):
+        while True:
+            pks = list(
+                Job.objects.filter(status=status, updated_at__lt=cutoff)
+                .order_by('updated_at').values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            deleted += Job.objects.filter(pk__in=pks).delete()[0]
+    return deleted
+
+
+def work(worker_id=None, batch_size=10, idle_sleep=1.0, burst=False, max_jobs=None):
+    """
+    Worker loop: claim a batch, run it, repeat. With ``burst`` the loop exits
+    as soon as the queue is empty. Returns the number of jobs processed.
+    """
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    next_stale_check = time.monotonic() + STALE_CHECK_SECONDS
+    while max_jobs is None or processed < max_jobs:
+        if time.monotonic() >= next_stale_check:
+            requeued = requeue_stale()
+            if requeued:
+                logger.warning('Requeued %s jobs of workers that stopped responding', requeued)
+            next_stale_check = time.monotonic() + STALE_CHECK_SECONDS
+        limit = batch_size if max_jobs is None else min(batch_size, max_jobs - processed)
+        jobs = claim_jobs(worker_id, limit)
+        if not jobs:
+            if burst:
+                break
+            time.sleep(idle_sleep)
+            continue
+        for job in jobs:
+            with slowlog.capture(f'job:{job.task}'):
+                run_job(job)
+            processed += 1
+    return processed
@@ -0,0 +1,197 @@
+"""
+Live seat availability over Server-Sent Events.
+
+``seat_stream`` (served when the project runs under ``travel_booking.asgi``)
+keeps one connection open per browser tab and pushes ``available_seats`` and
+``price`` of the departures the client watches whenever they change.
+
+All connections of a process share one ``Hub``:
+
+* each subscriber holds only the latest state of every departure it
+  watches and an ``asyncio.Event``; a broadcast overwrites that state and
+  sets the event, so a slow client never builds up a backlog and a change
+  costs one dict write per subscriber;
+* a single watcher task per process polls the database for watched
+  departures whose ``updated_at`` moved, at most every ``POLL_INTERVAL``
+  seconds, however many clients are connected. Seat changes of regular
+  departures and price changes bump ``updated_at`` (see ``inventory``),
+  whichever process made them. Bookings of sharded departures only touch
+  their ``SeatShard`` rows, so watched sharded departures are read on every
+  poll with their shards summed, in one more query; ``publish`` drops the
+  ones that did not change.
+
+The hub lives on the server's event loop and is only touched from it.
+Configuration lives in the ``TRAVEL_LIVE_SEATS`` setting.
+"""
+import asyncio
+import json
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import inventory
+from .models import TravelOption
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'POLL_INTERVAL': 1.0,
+    'KEEPALIVE': 15,
+    'MAX_SUBSCRIBERS': 10000,
+    'MAX_WATCH': 20,
+    # Seconds a client waits before reconnecting, and between snapshots when
+    # the server cannot stream (WSGI)
+    'RETRY': 10,
+}
+
+# Rows committed slightly out of updated_at order are caught by looking back
+POLL_OVERLAP = timedelta(seconds=2)
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TRAVEL_LIVE_SEATS', {}))
+    return config
+
+
+def state_of(row):
+    return {'id': row['pk'], 'available_seats': row['available_seats'], 'price': str(row['price'])}
+
+
+class Subscriber:
+    __slots__ = ('ids', 'pending', 'event')
+
+    def __init__(self, ids):
+        self.ids = frozenset(ids)
+        self.pending = {}
+        self.event = asyncio.Event()
+
+    def push(self, pk, state):
+        self.pending[pk] = state
+        self.event.set()
+
+    async def changes(self, timeout=None):
+        """Wait for changes; returns ``[state, ...]`` (empty on timeout)"""
+        if not self.pending:
+            try:
+                await asyncio.wait_for(self.event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self.event.clear()
+        changes, self.pending = list(self.pending.values()), {}
+        return changes
+
+
+class Hub:
+    """Fan-out of departure state changes to the subscribers of one event loop"""
+
+    def __init__(self, fetch=None, poll_interval=None):
+        self.subscribers = {}
+        self.states = {}
+        self.count = 0
+        self.fetch = fetch or _fetch_changed
+        self.poll_interval = poll_interval
+        self._watcher = None
+
+    def subscribe(self, ids):
+        subscriber = Subscriber(ids)
+        for pk in subscriber.ids:
+            self.subscribers.setdefault(pk, set()).add(subscriber)
+        self.count += 1
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.get_running_loop().create_task(self.watch())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        for pk in subscriber.ids:
+            watchers = self.subscribers.get(pk)
+            if watchers is not None:
+                watchers.discard(subscriber)
+                if not watchers:
+                    del self.subscribers[pk]
+                    self.states.pop(pk, None)
+        self.count -= 1
+
+    def publish(self, state):
+        """Send ``state`` to every subscriber of its departure, if it changed"""
+        pk = state['id']
+        if self.states.get(pk) == state:
+            return 0
+        watchers = self.subscribers.get(pk)
+        if not watchers:
+            return 0
+        self.states[pk] = state
+        for subscriber in watchers:
+            subscriber.push(pk, state)
+        return len(watchers)
+
+    async def watch(self):
+        """Poll for changed departures while anyone is subscribed"""
+        since = timezone.now()
+        interval = self.poll_interval or get_config()['POLL_INTERVAL']
+        while self.subscribers:
+            await asyncio.sleep(interval)
+            ids = list(self.subscribers)
+            if not ids:
+                break
+            try:
+                rows, latest = await self.fetch(ids, since - POLL_OVERLAP)
+            except Exception:
+                logger.warning('Live seat poll failed', exc_info=True)
+                continue
+            since = max(since, latest or since)
+            for row in rows:
+                self.publish(state_of(row))
+
+
+def _rows(travel_options):
+    """Rows of ``travel_options``, with the seats of sharded ones summed from their shards"""
+    options = inventory.sum_shards(list(
+        travel_options.only('pk', 'available_seats', 'price', 'updated_at', 'seat_shards')
+    ))
+    return [
+        {'pk': option.pk, 'available_seats': option.available_seats, 'price': option.price,
+         'updated_at': option.updated_at}
+        for option in options
+    ]
+
+
+@sync_to_async
+def _fetch_changed(ids, since):
+    rows = _rows(TravelOption.objects.filter(Q(updated_at__gt=since) | Q(seat_shards__gt=0), pk__in=ids))
+    return rows, max((row['updated_at'] for row in rows), default=None)
+
+
+@sync_to_async
+def fetch_states(ids):
+    return [state_of(row) for row in _rows(TravelOption.objects.filter(pk__in=ids))]
+
+
+hub = Hub()
+
+
+def format_event(state):
+    return f'event: seats\ndata: {json.dumps(state)}\n\n'
+
+
+async def event_stream(ids, config, subscriber_hub=None):
+    """Initial states, then changes as they happen, with keepalive comments"""
+    subscriber_hub = subscriber_hub or hub
+    subscriber = subscriber_hub.subscribe(ids)
+    try:
+        yield f'retry: {config["RETRY"] * 1000}\n\n'
+        for state in await fetch_states(ids):
+            subscriber_hub.states.setdefault(state['id'], state)
+            yield format_event(state)
+        while True:
+            changes = await subscriber.changes(timeout=config['KEEPALIVE'])
+            if not changes:
+                yield ': keepalive\n\n'
+            for state in changes:
+                yield format_event(state)
+    finally:
+        subscriber_hub.unsubscribe(subscriber)
@@ -0,0 +1,131 @@
+"""
+Batch lookup of travel options and bookings for API clients.
+
+A client that shows a list of trips sends every id it needs in one request
+instead of fetching detail pages one by one. Each kind of object costs one
+query on the hot table, plus one on the archive table for the ids not found
+there, whatever the number of ids. Results come back in the order asked,
+with an ``"error": "not found"`` entry for ids that do not exist or, for
+bookings, belong to someone else: the same rule as ``booking_detail``.
+"""
+from django.urls import reverse
+
+from . import currency
+from .inventory import sum_shards
+from .models import ArchivedBooking, ArchivedTravelOption, Booking, TravelOption
+
+MAX_ITEMS = 300
+NOT_FOUND = 'not found'
+# Largest BigAutoField value; bigger ids overflow in the query
+MAX_PK = 2 ** 63 - 1
+
+
+class InvalidLookup(ValueError):
+    pass
+
+
+def pk_value(part):
+    """Primary key from a string; ``ValueError`` outside the BigAutoField range"""
+    value = int(part)
+    if not 1 <= value <= MAX_PK:
+        raise ValueError(part)
+    return value
+
+
+def parse_ids(value, convert=str):
+    """Unique ids from a comma-separated string, in order"""
+    ids = []
+    for part in (value or '').split(','):
+        part = part.strip()
+        if part:
+            try:
+                ids.append(convert(part))
+            except ValueError:
+                raise InvalidLookup(f'Invalid id: {part}')
+    return list(dict.fromkeys(ids))
+
+
+def _fetch(queryset, archive_queryset, lookup, values):
+    """``{value: object}`` from the hot table, then the archive for what is missing"""
+    found = {getattr(obj, lookup): obj for obj in queryset.filter(**{f'{lookup}__in': values})}
+    missing = [value for value in values if value not in found]
+    if missing:
+        found.update(
+            (getattr(obj, lookup), obj) for obj in archive_queryset.filter(**{f'{lookup}__in': missing})
+        )
+    return found
+
+
+def travel_option_data(option, converter):
+    archived = isinstance(option, ArchivedTravelOption)
+    return {
+        'id': option.pk,
+        'travel_id': option.travel_id,
+        'type': option.type,
+        'source': option.source,
+        'destination': option.destination,
+        'departure_date': option.departure_date.isoformat(),
+        'departure_time': option.departure_time.isoformat(),
+        'arrival_date': option.arrival_date.isoformat(),
+        'arrival_time': option.arrival_time.isoformat(),
+        'price': str(option.price),
+        'display_price': converter.format(option.price),
+        'available_seats': option.available_seats,
+        'total_seats': option.total_seats,
+        'archived': archived,
+        'url': None if archived else reverse('travel:travel_detail', kwargs={'pk': option.pk}),
+    }
+
+
+def booking_data(booking, converter):
+    return {
+        'id': booking.pk,
+        'booking_id': booking.booking_id,
+        'status': booking.status,
+        'number_of_seats': booking.number_of_seats,
+        'seat_numbers': getattr(booking, 'seat_numbers', []),
+        'total_price': str(booking.total_price),
+        'display_total_price': converter.format(booking.total_price),
+        'booking_date': booking.booking_date.isoformat(),
+        'can_be_cancelled': booking.can_be_cancelled,
+        'archived': isinstance(booking, ArchivedBooking),
+        'url': reverse('travel:booking_detail', kwargs={'pk': booking.pk}),
+        'travel_option': travel_option_data(booking.travel_option, converter),
+    }
+
+
+def lookup_travel_options(ids, converter):
+    found = _fetch(TravelOption.objects.all(), ArchivedTravelOption.objects.all(), 'pk', ids)
+    sum_shards(list(found.values()))
+    return [
+        travel_option_data(found[pk], converter) if pk in found else {'id': pk, 'error': NOT_FOUND}
+        for pk in ids
+    ]
+
+
+def lookup_bookings(user, booking_ids, converter):
+    """The user's bookings among ``booking_ids``; others' bookings are not found"""
+    found = _fetch(
+        Booking.objects.select_related('travel_option').filter(user=user),
+        ArchivedBooking.objects.select_related('travel_option').filter(user=user),
+        'booking_id', booking_ids,
+    )
+    sum_shards([booking.travel_option for booking in found.values() if isinstance(booking, Booking)])
+    return [
+        booking_data(found[booking_id], converter) if booking_id in found
+        else {'booking_id': booking_id, 'error': NOT_FOUND}
+        for booking_id in booking_ids
+    ]
+
+
+def lookup_many(user, travel_option_ids, booking_ids, converter=None):
+    """``{"travel_options": [...], "bookings": [...]}`` for the requested ids"""
+    if len(travel_option_ids) + len(booking_ids) > MAX_ITEMS:
+        raise InvalidLookup(f'At most {MAX_ITEMS} ids per request.')
+    converter = converter or currency.get_converter()
+    result = {}
+    if travel_option_ids:
+        result['travel_options'] = lookup_travel_options(travel_option_ids, converter)
+    if booking_ids:
+        result['bookings'] = lookup_bookings(user, booking_ids, converter)
+    return result
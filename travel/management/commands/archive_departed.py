@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+from travel.archive import (
+    DEFAULT_BATCH_SIZE, DEFAULT_RETENTION_DAYS, archive_departed, table_sizes,
+)
+
+class Command(BaseCommand):
+    help = 'Move departed travel options and their bookings into the archive tables'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=DEFAULT_RETENTION_DAYS,
+            help='Keep departures this many days after departure in the hot tables'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Travel options moved per transaction'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Seconds to sleep between batches to leave room for live traffic'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches'
+        )
+    
+    def handle(self, *args, **options):
+        before = table_sizes()
+        started = time.monotonic()
+        moved_options, moved_bookings = archive_departed(
+            retention_days=options['retention_days'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            max_batches=options['max_batches'],
+        )
+        elapsed = time.monotonic() - started
+        after = table_sizes()
+        
+        self.stdout.write(f'{"Table":<32}{"Rows before":>14}{"Rows after":>14}{"Size before":>14}{"Size after":>14}')
+        for table, (rows_before, size_before) in before.items():
+            rows_after, size_after = after[table]
+            self.stdout.write(
+                f'{table:<32}{rows_before:>14}{rows_after:>14}'
+                f'{_format_size(size_before):>14}{_format_size(size_after):>14}'
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Archived {moved_options} travel options and {moved_bookings} bookings in {elapsed:.1f}s'
+            )
+        )
+
+def _format_size(size):
+    if size is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TB'
@@ -0,0 +1,91 @@
+import time
+from datetime import time as dtime, timedelta
+from decimal import Decimal
+
+from accounts.forms import CustomUserCreationForm, UserProfileForm
+from accounts.models import UserProfile
+from crispy_forms.utils import render_crispy_form
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import timezone
+from travel import views
+from travel.forms import BookingForm, TravelSearchForm, render_search_form
+from travel.models import TravelOption
+
+class Command(BaseCommand):
+    help = 'Measure form construction, crispy rendering and full view time for the form-heavy pages'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=500,
+            help='Repetitions per measurement'
+        )
+    
+    def handle(self, *args, **options):
+        n = options['iterations']
+        user, _ = User.objects.get_or_create(username='bench-forms')
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+        travel_option = self._create_option()
+        try:
+            cases = [
+                ('home (no search)', lambda: TravelSearchForm(None),
+                 lambda: views.home(self._request('/', AnonymousUser()))),
+                ('home (search)', lambda: TravelSearchForm({'source': 'Bench', 'sort': 'price'}),
+                 lambda: views.home(self._request('/?source=Bench&sort=price', AnonymousUser()))),
+                ('book_travel', lambda: BookingForm(travel_option=travel_option),
+                 lambda: views.book_travel(self._request(f'/travel/{travel_option.pk}/book/', user),
+                                           pk=travel_option.pk)),
+                ('signup', lambda: CustomUserCreationForm(), None),
+                ('profile', lambda: UserProfileForm(instance=profile), None),
+            ]
+            self.stdout.write(f'{"":<18} {"construct":>12} {"render":>12} {"view":>12}   (per request)')
+            for name, build, view in cases:
+                construct = self._time(n, build)
+                render = self._time(n, lambda: self._render(build()), subtract=construct)
+                view_time = self._time(n, view) if view else None
+                self.stdout.write(
+                    f'{name:<18} {construct:>10.1f}us {render:>10.1f}us '
+                    + (f'{view_time:>10.1f}us' if view_time is not None else f'{"-":>12}')
+                )
+        finally:
+            travel_option.delete()
+    
+    def _render(self, form):
+        if isinstance(form, TravelSearchForm):
+            return render_search_form(form)
+        return render_crispy_form(form, context={'csrf_token': 'bench'})
+    
+    def _time(self, n, func, subtract=0.0):
+        func()
+        started = time.perf_counter()
+        for _ in range(n):
+            func()
+        return (time.perf_counter() - started) / n * 1e6 - subtract
+    
+    def _request(self, path, user):
+        request = RequestFactory().get(path)
+        request.user = user
+        request.session = SessionBase()
+        request._messages = FallbackStorage(request)
+        return request
+    
+    def _create_option(self):
+        departure = timezone.now().date() + timedelta(days=30)
+        return TravelOption.objects.create(
+            travel_id=f'BF{int(time.time() * 1000) % 10 ** 8}',
+            type='bus',
+            source='Bench',
+            destination='Forms',
+            departure_date=departure,
+            departure_time=dtime(8, 0),
+            arrival_date=departure,
+            arrival_time=dtime(10, 0),
+            price=Decimal('10.00'),
+            available_seats=40,
+            total_seats=40,
+        )
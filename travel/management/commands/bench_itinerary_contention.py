@@ -0,0 +1,120 @@
+import random
+import threading
+import time
+from datetime import time as dtime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+from django.utils import timezone
+from travel.inventory import InsufficientSeats
+from travel.itinerary import book_itinerary
+from travel.models import Booking, Itinerary, Job, TravelOption
+
+class Command(BaseCommand):
+    help = 'Book overlapping itineraries from concurrent threads and report throughput and consistency'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            default='1,2,4,8',
+            help='Comma separated writer thread counts to run'
+        )
+        parser.add_argument(
+            '--itineraries',
+            type=int,
+            default=50,
+            help='Itineraries each thread books'
+        )
+        parser.add_argument(
+            '--options',
+            type=int,
+            default=4,
+            help='Number of hot travel options shared by all threads'
+        )
+        parser.add_argument(
+            '--seats',
+            type=int,
+            default=100000,
+            help='Seats per hot travel option'
+        )
+    
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bench-itinerary')
+        for threads in [int(n) for n in options['threads'].split(',')]:
+            hot = self._create_options(options['options'], options['seats'])
+            try:
+                self._run(user, hot, threads, options['itineraries'])
+            finally:
+                self._cleanup(user, hot)
+    
+    def _create_options(self, count, seats):
+        departure = timezone.now().date() + timedelta(days=30)
+        stamp = int(time.time() * 1000) % 10 ** 8
+        return [
+            TravelOption.objects.create(
+                travel_id=f'BN{stamp}{i:02d}'[:20],
+                type='train',
+                source='Bench',
+                destination=f'Hot {i}',
+                departure_date=departure,
+                departure_time=dtime(8, 0),
+                arrival_date=departure,
+                arrival_time=dtime(10, 0),
+                price=Decimal('10.00'),
+                available_seats=seats,
+                total_seats=seats,
+            )
+            for i in range(count)
+        ]
+    
+    def _run(self, user, hot, threads, per_thread):
+        ids = [option.pk for option in hot]
+        results = {'ok': 0, 'sold_out': 0, 'db_errors': 0}
+        lock = threading.Lock()
+        
+        def writer():
+            local = dict.fromkeys(results, 0)
+            for _ in range(per_thread):
+                # Legs in random order; the service must still lock them in pk order
+                legs = random.sample(ids, k=min(2, len(ids)))
+                names = [f'P{i}' for i in range(random.randint(1, 4))]
+                try:
+                    book_itinerary(user, legs, names)
+                    local['ok'] += 1
+                except InsufficientSeats:
+                    local['sold_out'] += 1
+                except DatabaseError:
+                    local['db_errors'] += 1
+            connection.close()
+            with lock:
+                for key, value in local.items():
+                    results[key] += value
+        
+        workers = [threading.Thread(target=writer) for _ in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        
+        consistent = all(
+            option.total_seats - option.available_seats == (option.sold or 0)
+            for option in TravelOption.objects.filter(pk__in=ids).annotate(sold=Sum('bookings__number_of_seats'))
+        )
+        self.stdout.write(
+            f'{threads:>3} threads: {results["ok"]} itineraries in {elapsed:.2f}s '
+            f'({results["ok"] / elapsed:,.1f}/s), sold out {results["sold_out"]}, '
+            f'database errors {results["db_errors"]}, inventory consistent: {consistent}'
+        )
+    
+    def _cleanup(self, user, hot):
+        itinerary_ids = list(Itinerary.objects.filter(user=user).values_list('pk', flat=True))
+        Job.objects.filter(task='travel.send_itinerary_confirmation',
+                           payload__itinerary_id__in=itinerary_ids).delete()
+        Booking.objects.filter(travel_option__in=hot).delete()
+        Itinerary.objects.filter(pk__in=itinerary_ids).delete()
+        TravelOption.objects.filter(pk__in=[option.pk for option in hot]).delete()
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from travel import jobs
+from travel.models import Job
+
+class Command(BaseCommand):
+    help = 'Measure enqueue and dequeue throughput of the database job queue'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=2000,
+            help='Number of jobs to push through the queue'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Jobs claimed per worker round trip'
+        )
+        parser.add_argument(
+            '--per-transaction',
+            type=int,
+            default=1,
+            help='Jobs enqueued per transaction (1 mimics one job per booking)'
+        )
+    
+    def handle(self, *args, **options):
+        count = options['jobs']
+        per_tx = max(1, options['per_transaction'])
+        
+        started = time.perf_counter()
+        created_ids = []
+        for offset in range(0, count, per_tx):
+            with transaction.atomic():
+                for i in range(offset, min(count, offset + per_tx)):
+                    created_ids.append(jobs.enqueue('jobs.noop', {'n': i}).pk)
+        enqueue_elapsed = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        processed = jobs.work(worker_id='bench', batch_size=options['batch_size'],
+                              burst=True, max_jobs=count)
+        dequeue_elapsed = time.perf_counter() - started
+        
+        Job.objects.filter(pk__in=created_ids).delete()
+        
+        self.stdout.write(
+            f'Enqueued {count} jobs in {enqueue_elapsed:.2f}s '
+            f'({count / enqueue_elapsed:,.0f} jobs/s, {per_tx} per transaction)'
+        )
+        self.stdout.write(
+            f'Claimed and ran {processed} jobs in {dequeue_elapsed:.2f}s '
+            f'({processed / dequeue_elapsed:,.0f} jobs/s, batch size {options["batch_size"]})'
+        )
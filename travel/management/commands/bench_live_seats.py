@@ -0,0 +1,83 @@
+import asyncio
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from travel.live import Hub, format_event
+
+class Command(BaseCommand):
+    help = 'Measure memory per live seat connection and broadcast latency of the in-process hub'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--subscribers',
+            type=int,
+            default=10000,
+            help='Simulated connections'
+        )
+        parser.add_argument(
+            '--departures',
+            type=int,
+            default=50,
+            help='Departures the connections are spread over (each watches one)'
+        )
+        parser.add_argument(
+            '--broadcasts',
+            type=int,
+            default=20,
+            help='Changes published to the most watched departure'
+        )
+    
+    def handle(self, *args, **options):
+        asyncio.run(self._bench(options['subscribers'], options['departures'], options['broadcasts']))
+    
+    async def _bench(self, subscribers, departures, broadcasts):
+        async def no_changes(ids, since):
+            return [], None
+        
+        hub = Hub(fetch=no_changes, poll_interval=3600)
+        received = {}
+        done = asyncio.Event()
+        
+        async def connection(pk):
+            # What event_stream does for each open response
+            subscriber = hub.subscribe([pk])
+            try:
+                while True:
+                    for state in await subscriber.changes():
+                        format_event(state)
+                        received[state['available_seats']] = received.get(state['available_seats'], 0) + 1
+                        if received[state['available_seats']] == watchers:
+                            done.set()
+            finally:
+                hub.unsubscribe(subscriber)
+        
+        watchers = len(range(0, subscribers, departures))
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tasks = [asyncio.create_task(connection(i % departures)) for i in range(subscribers)]
+        await asyncio.sleep(0)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{subscribers} connections: {(after - before) / subscribers:.0f} bytes each '
+            f'(hub, subscriber and consumer task; excludes the server\'s socket buffers)'
+        )
+        
+        latencies = []
+        for seats in range(broadcasts):
+            done.clear()
+            started = time.perf_counter()
+            hub.publish({'id': 0, 'available_seats': seats, 'price': '10.00'})
+            await done.wait()
+            latencies.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(
+            f'Broadcast to {watchers} watchers of one departure: '
+            f'median {statistics.median(latencies):.2f} ms, max {max(latencies):.2f} ms until the last one received it'
+        )
+        
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.stdout.write(self.style.SUCCESS(f'Subscribers left after disconnect: {hub.count}'))
@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+from datetime import time as dtime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from travel.inventory import InsufficientSeats, claim_seats, lock_travel_options, reserve_seats
+from travel.models import Booking, SeatMap, TravelOption
+from travel.seatmap import SeatPlan, default_layout
+
+class Command(BaseCommand):
+    help = 'Measure adjacent-seat search on large seat maps and concurrent seat claims on one departure'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seats',
+            type=int,
+            default=1200,
+            help='Seats on the benchmark departure'
+        )
+        parser.add_argument(
+            '--searches',
+            type=int,
+            default=20000,
+            help='In-memory searches per fill level'
+        )
+        parser.add_argument(
+            '--threads',
+            default='1,4,16',
+            help='Comma separated claiming thread counts to run'
+        )
+        parser.add_argument(
+            '--claims',
+            type=int,
+            default=100,
+            help='Claims each thread makes'
+        )
+    
+    def handle(self, *args, **options):
+        self._bench_search(options['seats'], options['searches'])
+        user, _ = User.objects.get_or_create(username='bench-seats')
+        for threads in [int(n) for n in options['threads'].split(',')]:
+            option = self._create_option(options['seats'])
+            try:
+                self._bench_claims(user, option, threads, options['claims'])
+            finally:
+                Booking.objects.filter(travel_option=option).delete()
+                option.delete()
+    
+    def _bench_search(self, seats, searches):
+        plan = SeatPlan(default_layout('train', seats), seats)
+        for fill in (0.0, 0.5, 0.9, 0.98):
+            taken = 0
+            for index in random.sample(range(seats), int(seats * fill)):
+                taken |= 1 << index
+            started = time.perf_counter()
+            together = 0
+            for _ in range(searches):
+                n = random.randint(1, 4)
+                bits = plan.find(taken, n)
+                if bits is not None and bits.bit_length() - (bits & -bits).bit_length() == n - 1:
+                    together += 1
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{seats} seats {fill:>4.0%} full: {searches / elapsed:,.0f} searches/s, '
+                f'{together / searches:.0%} of groups seated together'
+            )
+    
+    def _create_option(self, seats):
+        departure = timezone.now().date() + timedelta(days=30)
+        return TravelOption.objects.create(
+            travel_id=f'BS{int(time.time() * 1000) % 10 ** 8}',
+            type='train',
+            source='Bench',
+            destination='Seats',
+            departure_date=departure,
+            departure_time=dtime(8, 0),
+            arrival_date=departure,
+            arrival_time=dtime(10, 0),
+            price=Decimal('10.00'),
+            available_seats=seats,
+            total_seats=seats,
+        )
+    
+    def _bench_claims(self, user, option, threads, per_thread):
+        results = {'ok': 0, 'sold_out': 0, 'db_errors': 0}
+        lock = threading.Lock()
+        
+        def claimer():
+            local = dict.fromkeys(results, 0)
+            for _ in range(per_thread):
+                seats = random.randint(1, 4)
+                try:
+                    with transaction.atomic():
+                        locked = lock_travel_options([option.pk])[option.pk]
+                        reserve_seats(locked, seats)
+                        booking = Booking(user=user, travel_option=locked, number_of_seats=seats,
+                                          total_price=locked.price * seats)
+                        claim_seats(locked, [booking])
+                        booking.save()
+                    local['ok'] += 1
+                except InsufficientSeats:
+                    local['sold_out'] += 1
+                except DatabaseError:
+                    local['db_errors'] += 1
+            connection.close()
+            with lock:
+                for key, value in local.items():
+                    results[key] += value
+        
+        workers = [threading.Thread(target=claimer) for _ in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        
+        option.refresh_from_db()
+        seat_map = SeatMap.objects.get(travel_option=option)
+        seat_numbers = [seat for seats in Booking.objects.filter(travel_option=option)
+                        .values_list('seat_numbers', flat=True) for seat in seats]
+        consistent = (
+            len(seat_numbers) == len(set(seat_numbers))
+            and seat_map.free_count == option.available_seats
+        )
+        self.stdout.write(
+            f'{threads:>3} threads: {results["ok"]} claims in {elapsed:.2f}s '
+            f'({results["ok"] / elapsed:,.1f}/s), sold out {results["sold_out"]}, '
+            f'database errors {results["db_errors"]}, seat map consistent: {consistent}'
+        )
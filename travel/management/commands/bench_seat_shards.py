@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+from datetime import time as dtime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from travel.inventory import (
+    InsufficientSeats, available_seats, claim_seats, default_shards, lock_travel_options, reserve_seats,
+    set_seat_shards,
+)
+from travel.models import Booking, TravelOption
+
+class Command(BaseCommand):
+    help = (
+        'Measure booking throughput on one departure with a single seat counter and with sharded '
+        'counters as writers increase. Run against MySQL: SQLite serializes all writers anyway.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--writers',
+            default='1,4,16,32',
+            help='Comma separated concurrent writer counts to run'
+        )
+        parser.add_argument(
+            '--bookings',
+            type=int,
+            default=100,
+            help='Bookings each writer makes'
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=None,
+            help='Seat shards in sharded mode (default TRAVEL_SEAT_SHARDS)'
+        )
+    
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bench-shards')
+        shards = options['shards'] or default_shards()
+        for writers in [int(n) for n in options['writers'].split(',')]:
+            for mode_shards in (0, shards):
+                # Enough seats that nobody runs out mid-run
+                option = self._create_option(writers * options['bookings'] * 4)
+                try:
+                    if mode_shards:
+                        set_seat_shards(option.pk, mode_shards)
+                    self._bench(user, option, writers, options['bookings'], mode_shards)
+                finally:
+                    Booking.objects.filter(travel_option=option).delete()
+                    option.delete()
+    
+    def _create_option(self, seats):
+        departure = timezone.now().date() + timedelta(days=30)
+        return TravelOption.objects.create(
+            travel_id=f'SH{int(time.time() * 1000) % 10 ** 8}',
+            type='train',
+            source='Bench',
+            destination='Shards',
+            departure_date=departure,
+            departure_time=dtime(8, 0),
+            arrival_date=departure,
+            arrival_time=dtime(10, 0),
+            price=Decimal('10.00'),
+            available_seats=seats,
+            total_seats=seats,
+        )
+    
+    def _bench(self, user, option, writers, per_writer, shards):
+        results = {'ok': 0, 'sold_out': 0, 'db_errors': 0}
+        lock = threading.Lock()
+        
+        def writer():
+            local = dict.fromkeys(results, 0)
+            for _ in range(per_writer):
+                seats = random.randint(1, 4)
+                try:
+                    with transaction.atomic():
+                        locked = lock_travel_options([option.pk])[option.pk]
+                        reserve_seats(locked, seats)
+                        booking = Booking(user=user, travel_option=locked, number_of_seats=seats,
+                                          total_price=locked.price * seats)
+                        claim_seats(locked, [booking])
+                        booking.save()
+                    local['ok'] += 1
+                except InsufficientSeats:
+                    local['sold_out'] += 1
+                except DatabaseError:
+                    local['db_errors'] += 1
+            connection.close()
+            with lock:
+                for key, value in local.items():
+                    results[key] += value
+        
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        
+        option.refresh_from_db()
+        sold = Booking.objects.filter(travel_option=option, status='confirmed').aggregate(
+            seats=Sum('number_of_seats'))['seats'] or 0
+        consistent = available_seats(option) == option.total_seats - sold
+        mode = f'{shards} shards' if shards else 'single row'
+        self.stdout.write(
+            f'{writers:>3} writers, {mode:>10}: {results["ok"]} bookings in {elapsed:.2f}s '
+            f'({results["ok"] / elapsed:,.1f}/s), sold out {results["sold_out"]}, '
+            f'database errors {results["db_errors"]}, seats consistent: {consistent}'
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from travel.trending import compact, rebuild
+
+class Command(BaseCommand):
+    help = 'Rebase time-decayed route popularity scores and drop routes that decayed away'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recompute all scores from recent bookings instead (first deployment or after changing the half-life)'
+        )
+    
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            routes = rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt popularity of {routes} route{"s" if routes != 1 else ""}'))
+        else:
+            dropped = compact()
+            self.stdout.write(self.style.SUCCESS(f'Compacted route popularity, dropped {dropped} route{"s" if dropped != 1 else ""}'))
@@ -0,0 +1,74 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from travel.currency import base_currency, clear_cache
+from travel.models import ExchangeRate
+
+class Command(BaseCommand):
+    help = 'Replace the display exchange-rate table from a CSV or JSON file'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='CSV with currency,rate[,decimals,symbol] rows, or JSON {"base": "USD", "rates": {"EUR": "0.92", ...}}'
+        )
+    
+    def handle(self, *args, **options):
+        rows = self._read(options['path'])
+        if not rows:
+            raise CommandError('No rates found.')
+        
+        with transaction.atomic():
+            # Serialize concurrent loads on the version
+            list(ExchangeRate.objects.select_for_update().values_list('pk', flat=True))
+            version = (ExchangeRate.objects.aggregate(version=Max('version'))['version'] or 0) + 1
+            ExchangeRate.objects.exclude(currency__in=[row.currency for row in rows]).delete()
+            for row in rows:
+                row.version = version
+            ExchangeRate.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['currency'],
+                update_fields=['rate', 'decimals', 'symbol', 'version', 'updated_at'],
+            )
+        transaction.on_commit(clear_cache)
+        self.stdout.write(self.style.SUCCESS(f'Loaded {len(rows)} exchange rates (version {version})'))
+    
+    def _read(self, path):
+        try:
+            with open(path, newline='', encoding='utf-8') as f:
+                if path.endswith('.json'):
+                    data = json.load(f)
+                    if data.get('base', base_currency()) != base_currency():
+                        raise CommandError(f'Rates must be quoted against {base_currency()}, not {data["base"]}.')
+                    entries = [
+                        {'currency': code, **(value if isinstance(value, dict) else {'rate': value})}
+                        for code, value in data.get('rates', {}).items()
+                    ]
+                else:
+                    entries = [
+                        dict(zip(['currency', 'rate', 'decimals', 'symbol'], line))
+                        for line in csv.reader(f)
+                        if line and not line[0].startswith('#') and line[0].strip().lower() != 'currency'
+                    ]
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {path}: {e}')
+        
+        rows = []
+        for entry in entries:
+            code = str(entry['currency']).strip().upper()
+            try:
+                rate = Decimal(str(entry['rate']).strip())
+                decimals = int(entry.get('decimals') or 2)
+            except (InvalidOperation, ValueError, KeyError):
+                raise CommandError(f'Invalid rate for {code}: {entry}')
+            if len(code) != 3 or not code.isalpha() or rate <= 0 or not 0 <= decimals <= 4:
+                raise CommandError(f'Invalid rate for {code}: {entry}')
+            rows.append(ExchangeRate(
+                currency=code, rate=rate, decimals=decimals, symbol=str(entry.get('symbol') or '').strip(),
+            ))
+        return rows
@@ -0,0 +1,98 @@
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from travel import ratelimit
+from travel.models import TravelOption
+
+class Command(BaseCommand):
+    help = 'Hammer the booking path from abusive clients and measure latency seen by a regular user'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10,
+            help='Length of the test in seconds'
+        )
+        parser.add_argument(
+            '--abusers',
+            type=int,
+            default=8,
+            help='Number of abusive client threads (each with its own IP)'
+        )
+        parser.add_argument(
+            '--legit-interval',
+            type=float,
+            default=1.0,
+            help='Seconds between requests of the regular user'
+        )
+    
+    def handle(self, *args, **options):
+        travel_option = TravelOption.objects.filter(
+            departure_date__gte=timezone.now().date(), available_seats__gt=0
+        ).first()
+        if travel_option is None:
+            raise CommandError('Needs at least one upcoming travel option with free seats.')
+        
+        user, _ = User.objects.get_or_create(username='loadtest-user')
+        book_url = reverse('travel:book_travel', kwargs={'pk': travel_option.pk})
+        home_url = reverse('travel:home')
+        deadline = time.monotonic() + options['duration']
+        ratelimit.stats.reset()
+        
+        abuser_statuses = Counter()
+        legit_latencies = []
+        legit_statuses = Counter()
+        lock = threading.Lock()
+        
+        def abuser(n):
+            client = Client(HTTP_HOST='localhost', REMOTE_ADDR=f'203.0.113.{n + 1}')
+            client.force_login(user)
+            local = Counter()
+            while time.monotonic() < deadline:
+                for url in (book_url, home_url):
+                    local[client.get(url).status_code] += 1
+            connection.close()
+            with lock:
+                abuser_statuses.update(local)
+        
+        def legit():
+            client = Client(HTTP_HOST='localhost', REMOTE_ADDR='198.51.100.7')
+            client.force_login(user)
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                status = client.get(book_url).status_code
+                legit_latencies.append((time.perf_counter() - started) * 1000)
+                legit_statuses[status] += 1
+                time.sleep(options['legit_interval'])
+            connection.close()
+        
+        threads = [threading.Thread(target=abuser, args=(n,)) for n in range(options['abusers'])]
+        threads.append(threading.Thread(target=legit))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        snapshot = ratelimit.stats.snapshot()
+        self.stdout.write(f'Abusive requests by status: {dict(abuser_statuses)}')
+        self.stdout.write(f'Rejections: {snapshot["rejected"]}')
+        self.stdout.write(f'Max requests in flight: {snapshot["max_in_flight"]}')
+        self.stdout.write(f'Regular user requests by status: {dict(legit_statuses)}')
+        if legit_latencies:
+            legit_latencies.sort()
+            p95 = legit_latencies[int(0.95 * (len(legit_latencies) - 1))]
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Regular user latency: p50 {statistics.median(legit_latencies):.1f} ms, '
+                    f'p95 {p95:.1f} ms, max {legit_latencies[-1]:.1f} ms'
+                )
+            )
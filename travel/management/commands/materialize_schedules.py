@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from travel.recurring import get_horizon_days, materialize_all
+
+class Command(BaseCommand):
+    help = 'Create the departures of recurring schedules up to the rolling horizon'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horizon-days',
+            type=int,
+            default=None,
+            help='Days ahead to create departures for (default TRAVEL_SCHEDULE_HORIZON_DAYS)'
+        )
+    
+    def handle(self, *args, **options):
+        horizon_days = options['horizon_days'] if options['horizon_days'] is not None else get_horizon_days()
+        created = materialize_all(horizon_days=horizon_days)
+        self.stdout.write(
+            self.style.SUCCESS(f'Created {created} departure{"s" if created != 1 else ""} up to {horizon_days} days ahead')
+        )
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from travel.waitlist import process_waitlists
+
+class Command(BaseCommand):
+    help = 'Assign released seats to waitlisted users, first come first served'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and process waitlists every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30,
+            help='Seconds to sleep between runs in --loop mode'
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            created = process_waitlists()
+            if created or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Allocated {created} booking{"s" if created != 1 else ""} from waitlists')
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
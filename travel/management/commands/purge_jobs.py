@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from travel.jobs import get_retention_days, purge_finished
+
+class Command(BaseCommand):
+    help = 'Delete finished and dead background jobs older than the retention period'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Keep jobs updated within this many days (default: TRAVEL_JOB_RETENTION_DAYS)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Jobs deleted per statement'
+        )
+    
+    def handle(self, *args, **options):
+        days = get_retention_days() if options['days'] is None else options['days']
+        deleted = purge_finished(timedelta(days=days), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} finished job{"s" if deleted != 1 else ""}'))
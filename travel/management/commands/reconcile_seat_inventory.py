@@ -0,0 +1,62 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand
+from travel.inventory import reconcile_inventory
+
+class Command(BaseCommand):
+    help = 'Check available seats of upcoming departures against confirmed bookings and repair drift'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Departures checked per query'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Seconds to sleep between batches'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without changing anything'
+        )
+        parser.add_argument(
+            '--report',
+            help='Write the drift report to this CSV file'
+        )
+    
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        report = reconcile_inventory(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            pause=options['pause'],
+        )
+        elapsed = time.monotonic() - started
+        
+        for row in report[:20]:
+            self.stdout.write(
+                f"{row['travel_id']} ({row['departure_date']}): available {row['recorded']}, "
+                f"expected {row['expected']} ({row['drift']:+d})"
+            )
+        if len(report) > 20:
+            self.stdout.write(f'... and {len(report) - 20} more')
+        if options['report']:
+            with open(options['report'], 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=[
+                    'travel_option', 'travel_id', 'departure_date', 'recorded', 'expected', 'drift',
+                ])
+                writer.writeheader()
+                writer.writerows(report)
+        
+        oversold = sum(1 for row in report if row['expected'] < 0)
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(report)} departure{"s" if len(report) != 1 else ""} with drift '
+            f'({oversold} oversold) in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+from travel.reports import refresh
+
+class Command(BaseCommand):
+    help = 'Update the daily occupancy and revenue rollup behind the admin report'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every day instead of only the days changed since the last run'
+        )
+    
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        days = refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {days} day(s) in {time.monotonic() - started:.2f}s'
+        ))
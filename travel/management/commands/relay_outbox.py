@@ -0,0 +1,50 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from travel import outbox
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Deliver outbox events (seat, price and booking changes) to the configured sink'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Events read, compacted and delivered at a time (default: TRAVEL_OUTBOX BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and relay new events every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Seconds to sleep when the outbox is empty or the sink failed, in --loop mode'
+        )
+    
+    def handle(self, *args, **options):
+        sink = outbox.get_sink()
+        try:
+            while True:
+                try:
+                    events, messages = outbox.relay_pending(sink, options['batch_size'])
+                except Exception:
+                    if not options['loop']:
+                        raise
+                    # Nothing was deleted; the same events are relayed on the next try
+                    logger.warning('Outbox relay failed', exc_info=True)
+                    events = messages = 0
+                if events or not options['loop']:
+                    self.stdout.write(
+                        self.style.SUCCESS(f'Relayed {events} event{"s" if events != 1 else ""} as {messages} message{"s" if messages != 1 else ""}')
+                    )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            sink.close()
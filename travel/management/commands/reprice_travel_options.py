@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from travel.pricing import PricingEngine, reprice_upcoming
+
+class Command(BaseCommand):
+    help = 'Recompute fares of all upcoming travel options from the configured fare curves'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of travel options priced per batch'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Compute prices without writing them'
+        )
+        parser.add_argument(
+            '--no-history',
+            action='store_true',
+            help='Do not record price history rows'
+        )
+    
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        scanned, changed = reprice_upcoming(
+            engine=PricingEngine(),
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+            record_history=not options['no_history'],
+        )
+        elapsed = time.monotonic() - started
+        
+        verb = 'Would change' if options['dry_run'] else 'Changed'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{verb} {changed} of {scanned} upcoming travel options in {elapsed:.1f}s'
+            )
+        )
@@ -0,0 +1,71 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from travel import jobs
+
+def _work(options):
+    connections.close_all()
+    jobs.work(
+        batch_size=options['batch_size'],
+        idle_sleep=options['idle_sleep'],
+        burst=options['burst'],
+    )
+
+class Command(BaseCommand):
+    help = 'Run background job workers against the database job queue'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help='Number of worker processes to start'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Number of jobs each worker claims at a time'
+        )
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty'
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs'
+        )
+    
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale job{"s" if requeued != 1 else ""}')
+        
+        if options['processes'] <= 1:
+            processed = jobs.work(
+                batch_size=options['batch_size'],
+                idle_sleep=options['idle_sleep'],
+                burst=options['burst'],
+            )
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
+            return
+        
+        # Child processes must not share the parent's database connection
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=_work, args=(options,), daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(self.style.SUCCESS(f'Started {len(workers)} workers'))
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from travel.inventory import MAX_SEAT_SHARDS, default_shards, set_seat_shards
+from travel.models import TravelOption
+
+class Command(BaseCommand):
+    help = 'Switch departures into or out of sharded seat inventory, while they are being booked'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'travel_ids',
+            nargs='+',
+            help='Travel ids of the departures to switch'
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=None,
+            help=f'Seat counters to split into (up to {MAX_SEAT_SHARDS}, default TRAVEL_SEAT_SHARDS); 0 merges them back'
+        )
+    
+    def handle(self, *args, **options):
+        shards = default_shards() if options['shards'] is None else options['shards']
+        if not 0 <= shards <= MAX_SEAT_SHARDS:
+            raise CommandError(f'--shards must be between 0 and {MAX_SEAT_SHARDS}.')
+        options_by_id = dict(
+            TravelOption.objects.filter(travel_id__in=options['travel_ids']).values_list('travel_id', 'pk')
+        )
+        missing = sorted(set(options['travel_ids']) - set(options_by_id))
+        if missing:
+            raise CommandError(f'Unknown travel id(s): {", ".join(missing)}')
+        for travel_id, pk in sorted(options_by_id.items()):
+            option = set_seat_shards(pk, shards)
+            mode = f'{shards} shards' if shards else 'a single counter'
+            self.stdout.write(
+                self.style.SUCCESS(f'{travel_id}: {option.available_seats} seats in {mode}')
+            )
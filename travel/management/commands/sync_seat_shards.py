@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from travel.inventory import sync_shard_totals
+
+class Command(BaseCommand):
+    help = 'Copy the seat shard sums of sharded departures into their available seats'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and sync every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help='Seconds to sleep between runs in --loop mode'
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            updated = sync_shard_totals()
+            if updated or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Updated available seats of {updated} sharded departure{"s" if updated != 1 else ""}')
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
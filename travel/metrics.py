@@ -0,0 +1,353 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are kept in a process-wide ``registry`` and
+are safe to update from any thread. Each worker process has its own
+registry; when ``TRAVEL_METRICS_DIR`` is set, processes periodically write a
+snapshot there (one file per pid) and the metrics endpoint merges all
+snapshots, so a scrape sees the whole server and not just the worker that
+happened to answer it.
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.dispatch import receiver
+
+from . import signals
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+FLUSH_INTERVAL = 5
+STALE_GAUGE_AFTER = 300
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f'Expected labels {labelnames}, got {tuple(labels)}')
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), self._copy(value)] for key, value in self._values.items()]
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(values):
+        return sum(values)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @staticmethod
+    def merge(values):
+        return sum(values)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+            state['count'] += 1
+            state['sum'] += value
+
+    def _copy(self, value):
+        return {'buckets': list(value['buckets']), 'count': value['count'], 'sum': value['sum']}
+
+    @staticmethod
+    def merge(values):
+        values = list(values)
+        merged = {'buckets': [0] * len(values[0]['buckets']), 'count': 0, 'sum': 0.0}
+        for value in values:
+            merged['buckets'] = [a + b for a, b in zip(merged['buckets'], value['buckets'])]
+            merged['count'] += value['count']
+            merged['sum'] += value['sum']
+        return merged
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+        self._last_flush = 0
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f'Metric {name} is already registered as a {metric.kind}')
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, func):
+        """``func()`` is called on every snapshot and updates metrics it owns"""
+        if func not in self._collectors:
+            self._collectors.append(func)
+        return func
+
+    def snapshot(self):
+        for collector in self._collectors:
+            collector()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            'pid': os.getpid(),
+            'time': time.time(),
+            'metrics': {
+                metric.name: {
+                    'kind': metric.kind,
+                    'help': metric.documentation,
+                    'labelnames': list(metric.labelnames),
+                    'buckets': list(getattr(metric, 'buckets', ())),
+                    'values': metric.snapshot(),
+                }
+                for metric in metrics
+            },
+        }
+
+    # Multi-process support
+
+    def flush(self, directory=None, force=False):
+        """Write this process's snapshot to the metrics directory, at most every FLUSH_INTERVAL s"""
+        directory = directory or getattr(settings, 'TRAVEL_METRICS_DIR', None)
+        now = time.monotonic()
+        if not directory or (not force and now - self._last_flush < FLUSH_INTERVAL):
+            return
+        self._last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(self.snapshot(), fh)
+        os.replace(tmp, os.path.join(directory, f'metrics-{os.getpid()}.json'))
+
+    def collect(self, directory=None):
+        """Snapshots of all processes: this one live, others from the metrics directory"""
+        directory = directory or getattr(settings, 'TRAVEL_METRICS_DIR', None)
+        snapshots = [self.snapshot()]
+        if directory and os.path.isdir(directory):
+            own = f'metrics-{os.getpid()}.json'
+            for filename in os.listdir(directory):
+                if not filename.startswith('metrics-') or not filename.endswith('.json') or filename == own:
+                    continue
+                try:
+                    with open(os.path.join(directory, filename)) as fh:
+                        snapshots.append(json.load(fh))
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+    def render(self, directory=None):
+        """Prometheus text format of the merged snapshots"""
+        return render_snapshots(self.collect(directory))
+
+
+_KINDS = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+
+
+def render_snapshots(snapshots):
+    merged = {}
+    now = time.time()
+    for snapshot in snapshots:
+        stale = now - snapshot['time'] > STALE_GAUGE_AFTER
+        for name, metric in snapshot['metrics'].items():
+            # Counters of exited processes still count; their gauges do not
+            if stale and metric['kind'] == 'gauge':
+                continue
+            entry = merged.setdefault(name, dict(metric, values={}))
+            for key, value in metric['values']:
+                entry['values'].setdefault(tuple(key), []).append(value)
+
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        kind = metric['kind']
+        merge = _KINDS[kind].merge
+        labelnames = metric['labelnames']
+        lines.append(f'# HELP {name} {metric["help"]}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key in sorted(metric['values']):
+            value = merge(metric['values'][key])
+            if kind == 'histogram':
+                for bound, count in zip(metric['buckets'], value['buckets']):
+                    labels = _format_labels(labelnames, key, [('le', _format_value(bound))])
+                    lines.append(f'{name}_bucket{labels} {count}')
+                labels = _format_labels(labelnames, key, [('le', '+Inf')])
+                lines.append(f'{name}_bucket{labels} {value["count"]}')
+                labels = _format_labels(labelnames, key)
+                lines.append(f'{name}_sum{labels} {_format_value(value["sum"])}')
+                lines.append(f'{name}_count{labels} {value["count"]}')
+            else:
+                lines.append(f'{name}{_format_labels(labelnames, key)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Request metrics
+request_latency = registry.histogram(
+    'travel_request_duration_seconds', 'View latency in seconds', ['view', 'method'])
+request_db_time = registry.histogram(
+    'travel_request_db_seconds', 'Time spent in database queries per request', ['view'])
+request_queries = registry.histogram(
+    'travel_request_queries', 'Database queries per request', ['view'], buckets=QUERY_COUNT_BUCKETS)
+responses = registry.counter(
+    'travel_responses_total', 'Responses by view and status code', ['view', 'status'])
+requests_in_flight = registry.gauge(
+    'travel_requests_in_flight', 'Requests currently being processed')
+
+# Business metrics
+bookings_created = registry.counter(
+    'travel_bookings_created_total', 'Bookings created', ['source'])
+bookings_cancelled = registry.counter(
+    'travel_bookings_cancelled_total', 'Bookings cancelled')
+seats_sold = registry.counter(
+    'travel_seats_sold_total', 'Seats sold', ['type'])
+seats_released = registry.counter(
+    'travel_seats_released_total', 'Seats returned by cancellations', ['type'])
+search_cache = registry.counter(
+    'travel_search_cache_total', 'Search result requests answered from the client cache (304) or rendered',
+    ['result'])
+admission_rejected = registry.counter(
+    'travel_admission_rejected_total', 'Requests rejected by admission control', ['view', 'reason'])
+admission_in_flight = registry.gauge(
+    'travel_admission_in_flight', 'Requests admitted to protected views and still running')
+
+
+class MetricsMiddleware:
+    """Records latency, database time and query count of every view"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        db = {'time': 0.0, 'queries': 0}
+
+        def timed(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db['time'] += time.perf_counter() - started
+                db['queries'] += 1
+
+        requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timed):
+                response = self.get_response(request)
+        finally:
+            requests_in_flight.dec()
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        request_latency.observe(elapsed, view=view, method=request.method)
+        request_db_time.observe(db['time'], view=view)
+        request_queries.observe(db['queries'], view=view)
+        responses.inc(view=view, status=response.status_code)
+        if view == 'travel:home' and request.method == 'GET':
+            search_cache.inc(result='hit' if response.status_code == 304 else 'miss')
+        registry.flush()
+        return response
+
+
+@receiver(signals.bookings_created)
+def count_bookings_created(sender, bookings, source, **kwargs):
+    def record():
+        bookings_created.inc(len(bookings), source=source)
+        for booking in bookings:
+            seats_sold.inc(booking.number_of_seats, type=booking.travel_option.type)
+    transaction.on_commit(record)
+
+
+@receiver(signals.bookings_cancelled)
+def count_bookings_cancelled(sender, bookings, **kwargs):
+    def record():
+        bookings_cancelled.inc(len(bookings))
+        for booking in bookings:
+            seats_released.inc(booking.number_of_seats, type=booking.travel_option.type)
+    transaction.on_commit(record)
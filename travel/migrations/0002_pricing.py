@@ -0,0 +1,43 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:17
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def copy_price_to_base_price(apps, schema_editor):
+    TravelOption = apps.get_model('travel', 'TravelOption')
+    TravelOption.objects.filter(base_price__isnull=True).update(base_price=models.F('price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveloption',
+            name='base_price',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Reference fare the pricing engine scales; defaults to price', max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))]),
+        ),
+        migrations.RunPython(copy_price_to_base_price, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('new_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('load_factor', models.DecimalField(decimal_places=4, max_digits=5)),
+                ('days_to_departure', models.IntegerField()),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+                ('travel_option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='travel.traveloption')),
+            ],
+            options={
+                'verbose_name_plural': 'price history',
+                'ordering': ['-changed_at'],
+            },
+        ),
+    ]
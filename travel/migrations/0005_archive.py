@@ -0,0 +1,66 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0004_job_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTravelOption',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('travel_id', models.CharField(max_length=20, unique=True)),
+                ('type', models.CharField(choices=[('flight', 'Flight'), ('train', 'Train'), ('bus', 'Bus')], max_length=10)),
+                ('source', models.CharField(max_length=100)),
+                ('destination', models.CharField(max_length=100)),
+                ('departure_date', models.DateField()),
+                ('departure_time', models.TimeField()),
+                ('arrival_date', models.DateField()),
+                ('arrival_time', models.TimeField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('base_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('available_seats', models.PositiveIntegerField()),
+                ('total_seats', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['departure_date', 'departure_time'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='pricehistory',
+            name='travel_option',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='price_history', to='travel.traveloption'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('booking_id', models.CharField(max_length=20, unique=True)),
+                ('number_of_seats', models.PositiveIntegerField()),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('booking_date', models.DateTimeField()),
+                ('status', models.CharField(choices=[('confirmed', 'Confirmed'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('passenger_details', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to=settings.AUTH_USER_MODEL)),
+                ('travel_option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='travel.archivedtraveloption')),
+            ],
+            options={
+                'ordering': ['-booking_date'],
+                'indexes': [models.Index(fields=['user', '-booking_date'], name='archived_booking_user_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:33
+
+from datetime import datetime
+
+from django.db import migrations, models, transaction
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+def backfill_schedule_datetimes(apps, schema_editor):
+    """Fill the derived columns in pk-ordered batches, one short transaction each"""
+    TravelOption = apps.get_model('travel', 'TravelOption')
+    tz = timezone.get_default_timezone()
+    rows = TravelOption.objects.filter(departure_at__isnull=True).order_by('pk').values_list(
+        'pk', 'departure_date', 'departure_time', 'arrival_date', 'arrival_time'
+    )
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        options = []
+        for pk, departure_date, departure_time, arrival_date, arrival_time in batch:
+            departure_at = timezone.make_aware(datetime.combine(departure_date, departure_time), tz)
+            arrival_at = timezone.make_aware(datetime.combine(arrival_date, arrival_time), tz)
+            options.append(TravelOption(
+                pk=pk, departure_at=departure_at, arrival_at=arrival_at, duration=arrival_at - departure_at,
+            ))
+        with transaction.atomic():
+            TravelOption.objects.bulk_update(options, ['departure_at', 'arrival_at', 'duration'])
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own instead of one long transaction
+    atomic = False
+
+    dependencies = [
+        ('travel', '0007_slow_query_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveloption',
+            name='arrival_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='departure_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='duration',
+            field=models.DurationField(editable=False, null=True),
+        ),
+        # Indexes are built after the backfill so they are not updated row by row
+        migrations.RunPython(backfill_schedule_datetimes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['departure_at'], name='travel_departure_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['price', 'departure_at'], name='travel_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['duration', 'departure_at'], name='travel_duration_idx'),
+        ),
+    ]
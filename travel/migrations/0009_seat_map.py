@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0008_schedule_datetimes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatMap',
+            fields=[
+                ('travel_option', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seat_map', serialize=False, to='travel.traveloption')),
+                ('layout', models.CharField(max_length=20)),
+                ('capacity', models.PositiveIntegerField()),
+                ('taken', models.BinaryField(default=bytes)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='seat_numbers',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
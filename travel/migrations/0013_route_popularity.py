@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-19 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0012_exchange_rates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutePopularity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=100)),
+                ('destination', models.CharField(max_length=100)),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'route popularity',
+                'indexes': [models.Index(fields=['-score'], name='route_popularity_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='routepopularity',
+            constraint=models.UniqueConstraint(fields=('source', 'destination'), name='route_popularity_unique'),
+        ),
+    ]
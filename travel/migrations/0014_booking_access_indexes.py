@@ -0,0 +1,36 @@
+# Generated by Django 5.0.14 on 2026-10-19 15:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+from travel.operations import AddIndexOnline
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0013_route_popularity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Built online, one index at a time, so bookings keep flowing on large tables
+    atomic = False
+
+    operations = [
+        AddIndexOnline(
+            model_name='booking',
+            index=models.Index(fields=['user', '-booking_date'], name='booking_user_date_idx'),
+        ),
+        AddIndexOnline(
+            model_name='booking',
+            index=models.Index(fields=['user', 'status', '-booking_date'], name='booking_user_status_idx'),
+        ),
+        AddIndexOnline(
+            model_name='booking',
+            index=models.Index(fields=['-booking_date', '-id'], name='booking_date_idx'),
+        ),
+        AddIndexOnline(
+            model_name='booking',
+            index=models.Index(fields=['status', '-booking_date', '-id'], name='booking_status_date_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.14 on 2026-10-19 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0014_booking_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveloption',
+            name='seat_shards',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='SeatShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('available_seats', models.PositiveIntegerField()),
+                ('travel_option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='travel.traveloption')),
+            ],
+            options={
+                'ordering': ['travel_option', 'shard'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='seatshard',
+            constraint=models.UniqueConstraint(fields=('travel_option', 'shard'), name='seat_shard_unique'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.14 on 2026-10-19 15:26
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0015_seat_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(help_text='Its departures get travel ids CODE-YYMMDD', max_length=12, unique=True)),
+                ('type', models.CharField(choices=[('flight', 'Flight'), ('train', 'Train'), ('bus', 'Bus')], max_length=10)),
+                ('source', models.CharField(max_length=100)),
+                ('destination', models.CharField(max_length=100)),
+                ('weekdays', models.CharField(default='1234567', help_text='Days it runs on, 1 = Monday to 7 = Sunday, e.g. 12345 for weekdays', max_length=7)),
+                ('departure_time', models.TimeField()),
+                ('arrival_time', models.TimeField()),
+                ('arrival_day_offset', models.PositiveSmallIntegerField(default=0, help_text='Days after departure the arrival falls on')),
+                ('valid_from', models.DateField()),
+                ('valid_until', models.DateField(blank=True, null=True)),
+                ('total_seats', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('base_price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))])),
+                ('active', models.BooleanField(default=True)),
+                ('materialized_until', models.DateField(blank=True, editable=False, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='recurring_schedule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='departures', to='travel.recurringschedule'),
+        ),
+        migrations.AddConstraint(
+            model_name='traveloption',
+            constraint=models.UniqueConstraint(fields=('recurring_schedule', 'departure_date'), name='travel_schedule_day_unique'),
+        ),
+    ]
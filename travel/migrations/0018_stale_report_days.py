@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-19 15:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0017_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleReportDay',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('marked_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
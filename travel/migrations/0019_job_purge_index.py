@@ -0,0 +1,22 @@
+# Generated by Django 5.0.14 on 2026-10-19 15:53
+
+from django.db import migrations, models
+
+from travel.operations import AddIndexOnline
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0018_stale_report_days'),
+    ]
+
+    # Built online so workers keep claiming jobs while it is added
+    atomic = False
+
+    operations = [
+        AddIndexOnline(
+            model_name='job',
+            index=models.Index(fields=['status', 'updated_at'], name='job_purge_idx'),
+        ),
+    ]
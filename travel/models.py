@@ -1,9 +1,75 @@
-from django.db import models
+from datetime import datetime, timedelta
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.urls import reverse
+from django.utils import timezone
 from decimal import Decimal
 
+from .seatmap import SeatPlan, from_bytes, to_bytes
+
+def schedule_datetimes(departure_date, departure_time, arrival_date, arrival_time):
+    """``(departure_at, arrival_at, duration)`` for a schedule in the default time zone"""
+    tz = timezone.get_default_timezone()
+    departure_at = timezone.make_aware(datetime.combine(departure_date, departure_time), tz)
+    arrival_at = timezone.make_aware(datetime.combine(arrival_date, arrival_time), tz)
+    return departure_at, arrival_at, arrival_at - departure_at
+
+class TravelOptionQuerySet(models.QuerySet):
+    """
+    Keeps ``departure_at``, ``arrival_at`` and ``duration`` in step with the
+    split date/time columns on bulk writes, which bypass ``save()``.
+    """
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        for obj in objs:
+            obj.sync_schedule()
+        return super().bulk_create(objs, *args, **kwargs)
+    
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        fields = list(fields)
+        if set(fields) & set(TravelOption.SCHEDULE_FIELDS):
+            for obj in objs:
+                obj.sync_schedule()
+            fields += [f for f in TravelOption.DERIVED_SCHEDULE_FIELDS if f not in fields]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+    
+    def update(self, **kwargs):
+        if not set(kwargs) & set(TravelOption.SCHEDULE_FIELDS):
+            return super().update(**kwargs)
+        # The new values may be expressions, so recompute from the stored rows.
+        # Collect pks first: the filter may no longer match after the update.
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            self.model._default_manager.using(self.db).filter(pk__in=pks).sync_schedule()
+        return rows
+    
+    update.alters_data = True
+    
+    def sync_schedule(self, batch_size=1000):
+        """Recompute the derived schedule columns of every row, in pk-ordered batches"""
+        fields = ['pk', *TravelOption.SCHEDULE_FIELDS]
+        rows = self.order_by('pk').values_list(*fields)
+        last_pk = 0
+        updated = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return updated
+            options = []
+            for pk, *schedule in batch:
+                departure_at, arrival_at, duration = schedule_datetimes(*schedule)
+                options.append(TravelOption(pk=pk, departure_at=departure_at,
+                                            arrival_at=arrival_at, duration=duration))
+            self.bulk_update(options, TravelOption.DERIVED_SCHEDULE_FIELDS)
+            updated += len(options)
+            last_pk = batch[-1][0]
+    
+    sync_schedule.alters_data = True
+
 class TravelOption(models.Model):
     TRAVEL_TYPES = [
         ('flight', 'Flight'),
@@ -20,17 +86,67 @@ class TravelOption(models.Model):
     arrival_date = models.DateField()
     arrival_time = models.TimeField()
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
+    base_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True,
+                                     validators=[MinValueValidator(Decimal('0.01'))],
+                                     help_text="Reference fare the pricing engine scales; defaults to price")
     available_seats = models.PositiveIntegerField(validators=[MinValueValidator(1)])
     total_seats = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    # Derived from the four schedule fields above so sorting and time-window
+    # filters can use a single index; kept in sync by save() and the queryset
+    departure_at = models.DateTimeField(null=True, editable=False)
+    arrival_at = models.DateTimeField(null=True, editable=False)
+    duration = models.DurationField(null=True, editable=False)
+    # Number of SeatShard counters holding the seats, 0 when available_seats
+    # itself is the counter (see travel/inventory.py)
+    seat_shards = models.PositiveSmallIntegerField(default=0, editable=False)
+    recurring_schedule = models.ForeignKey('RecurringSchedule', on_delete=models.SET_NULL, null=True, blank=True,
+                                           related_name='departures')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    SCHEDULE_FIELDS = ['departure_date', 'departure_time', 'arrival_date', 'arrival_time']
+    DERIVED_SCHEDULE_FIELDS = ['departure_at', 'arrival_at', 'duration']
+    
+    objects = TravelOptionQuerySet.as_manager()
+    
     class Meta:
         ordering = ['departure_date', 'departure_time']
+        indexes = [
+            models.Index(fields=['departure_at'], name='travel_departure_at_idx'),
+            models.Index(fields=['price', 'departure_at'], name='travel_price_idx'),
+            models.Index(fields=['duration', 'departure_at'], name='travel_duration_idx'),
+            models.Index(fields=['updated_at'], name='travel_updated_idx'),
+        ]
+        constraints = [
+            # One departure per recurring schedule and day, however often it is expanded
+            models.UniqueConstraint(fields=['recurring_schedule', 'departure_date'], name='travel_schedule_day_unique'),
+        ]
         
     def __str__(self):
         return f"{self.travel_id} - {self.get_type_display()} from {self.source} to {self.destination}"
     
+    def save(self, *args, **kwargs):
+        if self.base_price is None:
+            self.base_price = self.price
+        self.sync_schedule()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(self.SCHEDULE_FIELDS):
+            kwargs['update_fields'] = {*update_fields, *self.DERIVED_SCHEDULE_FIELDS}
+        super().save(*args, **kwargs)
+    
+    def sync_schedule(self):
+        self.departure_at, self.arrival_at, self.duration = schedule_datetimes(
+            self.departure_date, self.departure_time, self.arrival_date, self.arrival_time
+        )
+    
+    @property
+    def duration_display(self):
+        if self.duration is None:
+            return ''
+        minutes = int(self.duration.total_seconds()) // 60
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m"
+    
     def get_absolute_url(self):
         return reverse('travel:travel_detail', kwargs={'pk': self.pk})
     
@@ -55,19 +171,47 @@ class Booking(models.Model):
     booking_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=BOOKING_STATUS, default='confirmed')
     passenger_details = models.JSONField(default=dict, blank=True)
+    itinerary = models.ForeignKey('Itinerary', on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='bookings')
+    seat_numbers = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    MAX_SEATS = 10
+    is_archived = False
+    
     class Meta:
         ordering = ['-booking_date']
+        # Built around the actual access paths; see travel/queryplan.py and the tests
+        indexes = [
+            models.Index(fields=['updated_at'], name='booking_updated_idx'),
+            # booking_list: a user's bookings, newest first, optionally by status
+            models.Index(fields=['user', '-booking_date'], name='booking_user_date_idx'),
+            models.Index(fields=['user', 'status', '-booking_date'], name='booking_user_status_idx'),
+            # BookingAdmin: newest first (the changelist adds -pk), optionally by status or date range
+            models.Index(fields=['-booking_date', '-id'], name='booking_date_idx'),
+            models.Index(fields=['status', '-booking_date', '-id'], name='booking_status_date_idx'),
+        ]
         
     def __str__(self):
         return f"Booking {self.booking_id} - {self.user.username}"
     
+    @staticmethod
+    def generate_booking_id():
+        import uuid
+        return f"BK{str(uuid.uuid4())[:8].upper()}"
+    
+    @classmethod
+    def assign_missing_pks(cls, bookings):
+        """Fill in pks after ``bulk_create`` on backends that cannot return them"""
+        missing = {b.booking_id: b for b in bookings if b.pk is None}
+        if missing:
+            for booking_id, pk in cls.objects.filter(booking_id__in=missing).values_list('booking_id', 'pk'):
+                missing[booking_id].pk = pk
+    
     def save(self, *args, **kwargs):
         if not self.booking_id:
-            import uuid
-            self.booking_id = f"BK{str(uuid.uuid4())[:8].upper()}"
+            self.booking_id = self.generate_booking_id()
         
         if not self.total_price:
             self.total_price = self.travel_option.price * self.number_of_seats
@@ -75,17 +219,462 @@ class Booking(models.Model):
         super().save(*args, **kwargs)
     
     def cancel_booking(self):
-        if self.status == 'confirmed':
+        from django.db import transaction
+        from .inventory import release_seats
+        from .jobs import enqueue
+        from .signals import bookings_cancelled
+        
+        if self.status != 'confirmed':
+            return False
+        with transaction.atomic():
+            # Re-check under lock so a repeated cancel cannot release seats twice
+            current = Booking.objects.select_for_update().filter(pk=self.pk).values_list('status', flat=True).first()
+            if current != 'confirmed':
+                self.status = current or self.status
+                return False
             self.status = 'cancelled'
+            self.save(update_fields=['status', 'updated_at'])
             # Return seats to travel option
-            self.travel_option.available_seats += self.number_of_seats
-            self.travel_option.save()
-            self.save()
-            return True
-        return False
+            release_seats(self.travel_option_id, self.number_of_seats, self.seat_numbers)
+            bookings_cancelled.send(sender=Booking, bookings=[self])
+            # Hand the released seats to the waitlist in the background
+            if WaitlistEntry.objects.filter(travel_option_id=self.travel_option_id, status='waiting').exists():
+                enqueue('travel.allocate_waitlist', {'travel_option_id': self.travel_option_id})
+        return True
     
     @property
     def can_be_cancelled(self):
         from django.utils import timezone
         return (self.status == 'confirmed' and 
-                self.travel_option.departure_date > timezone.now().date())
\ No newline at end of file
+                self.travel_option.departure_date > timezone.now().date())
+
+class Itinerary(models.Model):
+    """Several bookings made together, e.g. a round trip or a group"""
+    reference = models.CharField(max_length=20, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='itineraries')
+    total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'itineraries'
+        
+    def __str__(self):
+        return f"Itinerary {self.reference} - {self.user.username}"
+    
+    def save(self, *args, **kwargs):
+        if not self.reference:
+            import uuid
+            self.reference = f"IT{str(uuid.uuid4())[:8].upper()}"
+        super().save(*args, **kwargs)
+
+class PriceHistory(models.Model):
+    # No database constraint: history outlives the departure when it is moved
+    # to ArchivedTravelOption, which keeps the same primary key.
+    travel_option = models.ForeignKey(TravelOption, on_delete=models.DO_NOTHING, db_constraint=False,
+                                      related_name='price_history')
+    old_price = models.DecimalField(max_digits=10, decimal_places=2)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2)
+    load_factor = models.DecimalField(max_digits=5, decimal_places=4)
+    days_to_departure = models.IntegerField()
+    changed_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-changed_at']
+        verbose_name_plural = 'price history'
+        
+    def __str__(self):
+        return f"{self.travel_option_id}: {self.old_price} -> {self.new_price}"
+
+class WaitlistEntry(models.Model):
+    WAITLIST_STATUS = [
+        ('waiting', 'Waiting'),
+        ('allocated', 'Allocated'),
+        ('cancelled', 'Cancelled'),
+        ('expired', 'Expired'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries')
+    travel_option = models.ForeignKey(TravelOption, on_delete=models.CASCADE, related_name='waitlist_entries')
+    number_of_seats = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(10)])
+    passenger_details = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=WAITLIST_STATUS, default='waiting')
+    booking = models.OneToOneField(Booking, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='waitlist_entry')
+    created_at = models.DateTimeField(auto_now_add=True)
+    allocated_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = 'waitlist entries'
+        indexes = [
+            models.Index(fields=['travel_option', 'status', 'id'], name='waitlist_queue_idx'),
+            models.Index(fields=['status', 'travel_option'], name='waitlist_status_idx'),
+        ]
+        
+    def __str__(self):
+        return f"Waitlist {self.travel_option_id} - {self.user.username} ({self.number_of_seats})"
+    
+    @property
+    def position(self):
+        if self.status != 'waiting':
+            return None
+        return WaitlistEntry.objects.filter(
+            travel_option_id=self.travel_option_id,
+            status='waiting',
+            id__lt=self.id,
+        ).count() + 1
+
+class Job(models.Model):
+    JOB_STATUS = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('dead', 'Dead'),
+    ]
+    
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=JOB_STATUS, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'run_at', 'id'], name='job_claim_idx'),
+            models.Index(fields=['status', 'locked_at'], name='job_stale_idx'),
+            models.Index(fields=['status', 'updated_at'], name='job_purge_idx'),
+        ]
+        
+    def __str__(self):
+        return f"Job {self.pk} {self.task} ({self.status})"
+
+class ArchivedTravelOption(models.Model):
+    """Departed travel option moved out of the hot table; keeps its original id"""
+    id = models.BigIntegerField(primary_key=True)
+    travel_id = models.CharField(max_length=20, unique=True)
+    type = models.CharField(max_length=10, choices=TravelOption.TRAVEL_TYPES)
+    source = models.CharField(max_length=100)
+    destination = models.CharField(max_length=100)
+    departure_date = models.DateField()
+    departure_time = models.TimeField()
+    arrival_date = models.DateField()
+    arrival_time = models.TimeField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    base_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    available_seats = models.PositiveIntegerField()
+    total_seats = models.PositiveIntegerField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['departure_date', 'departure_time']
+        
+    def __str__(self):
+        return f"{self.travel_id} - {self.get_type_display()} from {self.source} to {self.destination} (archived)"
+    
+    @property
+    def is_fully_booked(self):
+        return self.available_seats == 0
+
+class ArchivedBooking(models.Model):
+    """Booking of an archived departure; keeps its original id"""
+    id = models.BigIntegerField(primary_key=True)
+    booking_id = models.CharField(max_length=20, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bookings')
+    travel_option = models.ForeignKey(ArchivedTravelOption, on_delete=models.CASCADE, related_name='bookings')
+    number_of_seats = models.PositiveIntegerField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    booking_date = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=Booking.BOOKING_STATUS)
+    passenger_details = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    is_archived = True
+    can_be_cancelled = False
+    
+    class Meta:
+        ordering = ['-booking_date']
+        indexes = [
+            models.Index(fields=['user', '-booking_date'], name='archived_booking_user_idx'),
+        ]
+        
+    def __str__(self):
+        return f"Booking {self.booking_id} - {self.user.username} (archived)"
+
+class SlowQuery(models.Model):
+    """Slow queries aggregated by normalized statement (see travel/slowlog.py)"""
+    fingerprint = models.CharField(max_length=32, unique=True)
+    statement = models.TextField()
+    sample_params = models.JSONField(default=list, blank=True)
+    origin = models.CharField(max_length=200, blank=True)
+    location = models.CharField(max_length=255, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    explain = models.TextField(blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-total_ms']
+        verbose_name_plural = 'slow queries'
+        
+    def __str__(self):
+        return f"{self.fingerprint[:8]} ({self.count}x, {self.total_ms:.0f} ms)"
+    
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0
+
+class SeatMap(models.Model):
+    """Taken seats of a departure, one bit per seat (see travel/seatmap.py)"""
+    travel_option = models.OneToOneField(TravelOption, on_delete=models.CASCADE, primary_key=True,
+                                         related_name='seat_map')
+    layout = models.CharField(max_length=20)
+    capacity = models.PositiveIntegerField()
+    taken = models.BinaryField(default=bytes)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Seat map of {self.travel_option_id}"
+    
+    @property
+    def plan(self):
+        return SeatPlan(self.layout, self.capacity)
+    
+    @property
+    def taken_bits(self):
+        return from_bytes(self.taken)
+    
+    @taken_bits.setter
+    def taken_bits(self, bits):
+        self.taken = to_bytes(bits, self.capacity)
+    
+    @property
+    def free_count(self):
+        return self.plan.free_count(self.taken_bits)
+
+class SeatShard(models.Model):
+    """
+    One of the seat counters of a departure in sharded inventory mode (see
+    travel/inventory.py); its seats are the sum of its shards.
+    """
+    travel_option = models.ForeignKey(TravelOption, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    available_seats = models.PositiveIntegerField()
+    
+    class Meta:
+        ordering = ['travel_option', 'shard']
+        constraints = [
+            models.UniqueConstraint(fields=['travel_option', 'shard'], name='seat_shard_unique'),
+        ]
+    
+    def __str__(self):
+        return f"Shard {self.shard} of {self.travel_option_id}"
+
+class DailyRouteStats(models.Model):
+    """Occupancy and revenue of one route, travel type and departure day (see travel/reports.py)"""
+    day = models.DateField()
+    source = models.CharField(max_length=100)
+    destination = models.CharField(max_length=100)
+    type = models.CharField(max_length=10, choices=TravelOption.TRAVEL_TYPES)
+    departures = models.PositiveIntegerField(default=0)
+    total_seats = models.PositiveIntegerField(default=0)
+    seats_sold = models.PositiveIntegerField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['day', 'source', 'destination', 'type']
+        verbose_name_plural = 'daily route stats'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'source', 'destination', 'type'], name='daily_route_stats_unique'),
+        ]
+        
+    def __str__(self):
+        return f"{self.day} {self.source} → {self.destination} ({self.type})"
+    
+    @property
+    def occupancy(self):
+        return round(100 * self.seats_sold / self.total_seats, 1) if self.total_seats else 0
+
+class ReportWatermark(models.Model):
+    """Point up to which a rollup has seen changes"""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
+
+class StaleReportDay(models.Model):
+    """
+    Day whose rollup must be recomputed although no row departs on it any
+    more: a departure moved away from it or was deleted (see travel/reports.py)
+    """
+    day = models.DateField(primary_key=True)
+    marked_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return str(self.day)
+
+
+class IdempotencyKey(models.Model):
+    """Outcome of a booking or cancellation submitted with an idempotency key (see travel/idempotency.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=64)
+    scope = models.CharField(max_length=50)
+    result = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_unique'),
+        ]
+        
+    def __str__(self):
+        return f"{self.key} ({self.scope})"
+
+class ExchangeRate(models.Model):
+    """Display rate of one currency against the base currency (see travel/currency.py)"""
+    currency = models.CharField(max_length=3, primary_key=True)
+    # Units of this currency per unit of the base currency
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+    decimals = models.PositiveSmallIntegerField(default=2)
+    symbol = models.CharField(max_length=5, blank=True)
+    # Every row loaded by one load_exchange_rates run shares a version
+    version = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['currency']
+    
+    def __str__(self):
+        return f"{self.currency} {self.rate}"
+
+class RoutePopularity(models.Model):
+    """
+    Time-decayed booking score of a route (see travel/trending.py). Scores
+    are stored relative to the epoch kept in ``ReportWatermark``, so decay
+    never requires rewriting rows.
+    """
+    source = models.CharField(max_length=100)
+    destination = models.CharField(max_length=100)
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'route popularity'
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'destination'], name='route_popularity_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['-score'], name='route_popularity_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.source} → {self.destination}"
+
+class RecurringSchedule(models.Model):
+    """
+    A service that runs on the same weekdays and times, expanded into
+    ``TravelOption`` departures a rolling horizon ahead (see travel/recurring.py)
+    """
+    WEEKDAYS = '1234567'
+    
+    code = models.CharField(max_length=12, unique=True,
+                            help_text="Its departures get travel ids CODE-YYMMDD")
+    type = models.CharField(max_length=10, choices=TravelOption.TRAVEL_TYPES)
+    source = models.CharField(max_length=100)
+    destination = models.CharField(max_length=100)
+    weekdays = models.CharField(max_length=7, default=WEEKDAYS,
+                                help_text="Days it runs on, 1 = Monday to 7 = Sunday, e.g. 12345 for weekdays")
+    departure_time = models.TimeField()
+    arrival_time = models.TimeField()
+    arrival_day_offset = models.PositiveSmallIntegerField(default=0,
+                                                          help_text="Days after departure the arrival falls on")
+    valid_from = models.DateField()
+    valid_until = models.DateField(null=True, blank=True)
+    total_seats = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    base_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
+    active = models.BooleanField(default=True)
+    # Last day departures have been created for
+    materialized_until = models.DateField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['code']
+    
+    def __str__(self):
+        return f"{self.code}: {self.source} → {self.destination} at {self.departure_time:%H:%M}"
+    
+    def clean(self):
+        errors = {}
+        if not self.weekdays or set(self.weekdays) - set(self.WEEKDAYS):
+            errors['weekdays'] = "Use the digits 1 (Monday) to 7 (Sunday)."
+        if self.valid_until and self.valid_from and self.valid_until < self.valid_from:
+            errors['valid_until'] = "Must not be before valid from."
+        if (self.arrival_day_offset == 0 and self.arrival_time and self.departure_time
+                and self.arrival_time <= self.departure_time):
+            errors['arrival_time'] = "Must be after the departure time, or set an arrival day offset."
+        if errors:
+            raise ValidationError(errors)
+    
+    @property
+    def iso_weekdays(self):
+        return sorted({int(day) for day in self.weekdays if day in self.WEEKDAYS})
+    
+    def runs_on(self, day):
+        return (
+            str(day.isoweekday()) in self.weekdays
+            and self.valid_from <= day
+            and (self.valid_until is None or day <= self.valid_until)
+        )
+    
+    def departure_on(self, day):
+        """The unsaved departure of ``day``"""
+        return TravelOption(
+            travel_id=f"{self.code}-{day:%y%m%d}",
+            type=self.type,
+            source=self.source,
+            destination=self.destination,
+            departure_date=day,
+            departure_time=self.departure_time,
+            arrival_date=day + timedelta(days=self.arrival_day_offset),
+            arrival_time=self.arrival_time,
+            price=self.base_price,
+            base_price=self.base_price,
+            total_seats=self.total_seats,
+            available_seats=self.total_seats,
+            recurring_schedule=self,
+        )
+
+class OutboxEvent(models.Model):
+    """
+    Change event written in the transaction that made the change, for the
+    relay to deliver downstream (see travel/outbox.py)
+    """
+    topic = models.CharField(max_length=50)
+    # Travel option or booking the event is about
+    key = models.BigIntegerField()
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.pk} {self.topic} {self.key}"
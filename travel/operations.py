@@ -0,0 +1,39 @@
+"""
+Migration operations for large, live tables.
+
+``AddIndexOnline`` builds an index without blocking writes to the table:
+
+* on MySQL the statement carries ``ALGORITHM=INPLACE LOCK=NONE``, so InnoDB
+  builds the index while inserts and updates continue, and MySQL refuses
+  the statement outright rather than silently falling back to a copying,
+  table-locking build;
+* an index that already exists (a previous run was interrupted after
+  building some of them: MySQL DDL is not transactional) is skipped
+  instead of failing the migration.
+
+Other backends use the plain ``CREATE INDEX``.
+"""
+from django.db import migrations
+
+
+def index_exists(schema_editor, model, name):
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, model._meta.db_table)
+    return name in constraints
+
+
+class AddIndexOnline(migrations.AddIndex):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if index_exists(schema_editor, model, self.index.name):
+            return
+        if schema_editor.connection.vendor == 'mysql':
+            statement = self.index.create_sql(model, schema_editor)
+            schema_editor.execute(f'{statement} ALGORITHM=INPLACE LOCK=NONE', params=None)
+        else:
+            schema_editor.add_index(model, self.index)
+
+    def describe(self):
+        return f'{super().describe()} (online)'
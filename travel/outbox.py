@@ -0,0 +1,232 @@
+"""
+Transactional outbox of inventory and booking changes.
+
+Downstream systems (pricing, analytics, partner feeds) learn about changes
+from events instead of polling our tables. Each change writes
+``OutboxEvent`` rows in the transaction that makes it, so an event exists
+if and only if its change committed:
+
+* ``travel_option.seats``: seats taken or given back (``inventory``,
+  reconciliation, schedule edits, the admin), as ``delta``;
+* ``travel_option.price``: price changes by repricing, schedule edits and
+  the admin, with ``old_price`` where it is known;
+* ``booking.created`` and ``booking.cancelled``, from the booking signals.
+
+``relay`` (the ``relay_outbox`` command) reads the oldest events in id
+order, a batch at a time, hands them to the configured sink and deletes
+them once the sink accepted them. Within a batch the seat events of a
+departure are compacted into one, in place of the last of them, with the
+deltas summed and ``available_seats`` read once for the whole batch, so a
+burst of bookings on one departure costs consumers one message.
+
+Delivery is at least once: a batch delivered just before the relay died is
+delivered again, possibly merged with newer seat events, so consumers skip
+ids they have seen and take ``available_seats``, not a sum of deltas, as
+the seat count. Changes to one departure are serialized by its row lock, so
+its events are in order; an event of a transaction that committed after a
+later id was relayed goes out with the next batch.
+
+The sink is ``file`` (JSON lines appended to ``PATH``), ``socket`` (JSON
+lines to the Unix socket or ``host:port`` in ``ADDRESS``) or the dotted path
+of a class taking the config and providing ``deliver(messages)`` and
+``close()``, set in ``TRAVEL_OUTBOX``.
+"""
+import json
+import os
+import socket
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from . import inventory, signals
+from .models import OutboxEvent, TravelOption
+
+SEATS_CHANGED = 'travel_option.seats'
+PRICE_CHANGED = 'travel_option.price'
+BOOKING_CREATED = 'booking.created'
+BOOKING_CANCELLED = 'booking.cancelled'
+
+DEFAULTS = {
+    'SINK': 'file',
+    'PATH': 'outbox.jsonl',
+    'ADDRESS': '',
+    'BATCH_SIZE': 500,
+    'TIMEOUT': 10,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TRAVEL_OUTBOX', {}))
+    return config
+
+
+def record(topic, events):
+    """Write ``[(key, payload), ...]`` events of one topic; call inside the change's transaction"""
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(topic=topic, key=key, payload=payload) for key, payload in events], batch_size=500,
+    )
+
+
+def seats_changed(travel_option_id, delta):
+    record(SEATS_CHANGED, [(travel_option_id, {'travel_option_id': travel_option_id, 'delta': delta})])
+
+
+def prices_changed(changes):
+    """Record ``[(travel option pk, old price or None, new price), ...]``"""
+    record(PRICE_CHANGED, [
+        (pk, {'travel_option_id': pk, 'old_price': None if old is None else str(old), 'price': str(new)})
+        for pk, old, new in changes
+    ])
+
+
+def booking_payload(booking):
+    return {
+        'booking_id': booking.booking_id,
+        'user_id': booking.user_id,
+        'travel_option_id': booking.travel_option_id,
+        'number_of_seats': booking.number_of_seats,
+        'total_price': str(booking.total_price),
+        'status': booking.status,
+    }
+
+
+@receiver(signals.bookings_created)
+def record_bookings_created(sender, bookings, source, **kwargs):
+    record(BOOKING_CREATED, [(booking.pk, {**booking_payload(booking), 'source': source}) for booking in bookings])
+
+
+@receiver(signals.bookings_cancelled)
+def record_bookings_cancelled(sender, bookings, **kwargs):
+    record(BOOKING_CANCELLED, [(booking.pk, booking_payload(booking)) for booking in bookings])
+
+
+def current_seats(ids):
+    """``{pk: available seats}`` of the given departures; archived ones are left out"""
+    options = list(TravelOption.objects.filter(pk__in=ids).only('pk', 'available_seats', 'seat_shards'))
+    inventory.sum_shards(options)
+    return {option.pk: option.available_seats for option in options}
+
+
+def message(event, payload=None):
+    return {
+        'id': event.pk,
+        'topic': event.topic,
+        'key': event.key,
+        'payload': event.payload if payload is None else payload,
+        'created_at': event.created_at.isoformat(),
+    }
+
+
+def compact(events):
+    """Messages for ``events``, the seat events of each departure merged into its last"""
+    last = {event.key: event.pk for event in events if event.topic == SEATS_CHANGED}
+    seats = current_seats(last) if last else {}
+    deltas = {}
+    messages = []
+    for event in events:
+        if event.topic != SEATS_CHANGED:
+            messages.append(message(event))
+            continue
+        deltas[event.key] = deltas.get(event.key, 0) + event.payload.get('delta', 0)
+        if event.pk == last[event.key]:
+            messages.append(message(event, {
+                'travel_option_id': event.key,
+                'delta': deltas[event.key],
+                'available_seats': seats.get(event.key),
+            }))
+    return messages
+
+
+def relay(sink, batch_size=None):
+    """
+    Deliver the oldest batch of events to ``sink`` and delete them; returns
+    ``(events, messages)`` delivered. If the sink raises, nothing is deleted.
+    """
+    batch_size = batch_size or get_config()['BATCH_SIZE']
+    with transaction.atomic():
+        # Locked so that a second relay waits instead of sending them again
+        events = list(OutboxEvent.objects.select_for_update().order_by('id')[:batch_size])
+        if not events:
+            return 0, 0
+        messages = compact(events)
+        sink.deliver(messages)
+        # By id, not by range: a lower id may belong to a transaction still open
+        OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).delete()
+    return len(events), len(messages)
+
+
+def relay_pending(sink, batch_size=None):
+    """Relay batches until the outbox is empty; returns ``(events, messages)``"""
+    events = messages = 0
+    while True:
+        batch, sent = relay(sink, batch_size)
+        if not batch:
+            return events, messages
+        events += batch
+        messages += sent
+
+
+def encode(messages):
+    return ''.join(json.dumps(item, separators=(',', ':')) + '\n' for item in messages).encode()
+
+
+class FileSink:
+    """Appends messages as JSON lines to a file, synced to disk before they count as delivered"""
+
+    def __init__(self, config):
+        self.path = config['PATH']
+
+    def deliver(self, messages):
+        with open(self.path, 'ab') as f:
+            f.write(encode(messages))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        pass
+
+
+class SocketSink:
+    """Streams messages as JSON lines to a Unix socket path or ``host:port``"""
+
+    def __init__(self, config):
+        self.address = config['ADDRESS']
+        self.timeout = config['TIMEOUT']
+        self.sock = None
+
+    def connect(self):
+        host, _, port = self.address.rpartition(':')
+        if host and port.isdigit():
+            return socket.create_connection((host, int(port)), timeout=self.timeout)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.address)
+        return sock
+
+    def deliver(self, messages):
+        if self.sock is None:
+            self.sock = self.connect()
+        try:
+            self.sock.sendall(encode(messages))
+        except OSError:
+            # Reconnect on the next batch; this one is relayed again
+            self.close()
+            raise
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+SINKS = {'file': FileSink, 'socket': SocketSink}
+
+
+def get_sink(config=None):
+    config = config or get_config()
+    name = config['SINK']
+    sink_class = SINKS[name] if name in SINKS else import_string(name)
+    return sink_class(config)
@@ -0,0 +1,177 @@
+"""
+Dynamic fare computation for travel options.
+
+A fare is ``base_price`` scaled by three multipliers:
+
+* the load factor curve, where load factor is the share of seats already sold
+  (``1 - available_seats / total_seats``),
+* the days-to-departure curve,
+* a flat multiplier per travel type.
+
+Curves are lists of ``(x, multiplier)`` points that are linearly interpolated
+and clamped at both ends. Any part of ``DEFAULT_FARE_CURVES`` can be
+overridden with the ``TRAVEL_FARE_CURVES`` setting.
+"""
+from bisect import bisect_right
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import outbox
+from .models import TravelOption, PriceHistory
+
+DEFAULT_FARE_CURVES = {
+    'load_factor': [
+        (0.0, 0.85),
+        (0.5, 1.0),
+        (0.8, 1.25),
+        (0.95, 1.6),
+        (1.0, 1.8),
+    ],
+    'days_to_departure': [
+        (0, 1.5),
+        (3, 1.3),
+        (7, 1.15),
+        (21, 1.0),
+        (60, 0.9),
+    ],
+    'type': {
+        'flight': 1.0,
+        'train': 1.0,
+        'bus': 1.0,
+    },
+    'min_multiplier': 0.5,
+    'max_multiplier': 3.0,
+}
+
+CENT = Decimal('0.01')
+
+
+class FareCurve:
+    """Piecewise-linear curve over sorted ``(x, multiplier)`` points"""
+
+    def __init__(self, points):
+        points = sorted(points)
+        if not points:
+            raise ValueError('A fare curve needs at least one point.')
+        self.xs = [float(x) for x, _ in points]
+        self.ys = [float(y) for _, y in points]
+
+    def __call__(self, x):
+        xs, ys = self.xs, self.ys
+        if x <= xs[0]:
+            return ys[0]
+        if x >= xs[-1]:
+            return ys[-1]
+        i = bisect_right(xs, x)
+        x0, x1 = xs[i - 1], xs[i]
+        y0, y1 = ys[i - 1], ys[i]
+        return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+
+class PricingEngine:
+    """Computes fares from the configured fare curves"""
+
+    def __init__(self, curves=None):
+        config = dict(DEFAULT_FARE_CURVES)
+        config.update(getattr(settings, 'TRAVEL_FARE_CURVES', {}))
+        if curves:
+            config.update(curves)
+        self.load_factor_curve = FareCurve(config['load_factor'])
+        self.days_curve = FareCurve(config['days_to_departure'])
+        self.type_multipliers = dict(config['type'])
+        self.min_multiplier = float(config['min_multiplier'])
+        self.max_multiplier = float(config['max_multiplier'])
+
+    @staticmethod
+    def load_factor(available_seats, total_seats):
+        if not total_seats:
+            return 1.0
+        return min(1.0, max(0.0, 1 - available_seats / total_seats))
+
+    def multiplier(self, travel_type, load_factor, days_to_departure):
+        m = (self.load_factor_curve(load_factor)
+             * self.days_curve(days_to_departure)
+             * self.type_multipliers.get(travel_type, 1.0))
+        return min(self.max_multiplier, max(self.min_multiplier, m))
+
+    def fare(self, base_price, travel_type, load_factor, days_to_departure):
+        m = Decimal(repr(self.multiplier(travel_type, load_factor, days_to_departure)))
+        return max(CENT, (base_price * m).quantize(CENT, rounding=ROUND_HALF_UP))
+
+    def price_for(self, travel_option, today=None):
+        today = today or timezone.now().date()
+        return self.fare(
+            travel_option.base_price or travel_option.price,
+            travel_option.type,
+            self.load_factor(travel_option.available_seats, travel_option.total_seats),
+            (travel_option.departure_date - today).days,
+        )
+
+    def price_rows(self, rows, today):
+        """
+        Price a chunk of ``(pk, type, base_price, price, available, total,
+        departure_date)`` tuples in one pass. Returns ``(pk, old, new,
+        load_factor, days)`` for the rows whose price changes.
+        """
+        fare = self.fare
+        load_factor = self.load_factor
+        changes = []
+        for pk, travel_type, base_price, price, available, total, departure_date in rows:
+            lf = load_factor(available, total)
+            days = (departure_date - today).days
+            new_price = fare(base_price or price, travel_type, lf, days)
+            if new_price != price:
+                changes.append((pk, price, new_price, lf, days))
+        return changes
+
+
+def reprice_upcoming(engine=None, chunk_size=5000, today=None, dry_run=False, record_history=True):
+    """
+    Reprice every upcoming travel option in primary-key ordered chunks.
+
+    Each chunk is read with a single narrow ``values_list`` query, priced in
+    memory and written back with one ``bulk_update`` covering only the rows
+    whose price changed. Returns ``(scanned, changed)``.
+    """
+    engine = engine or PricingEngine()
+    today = today or timezone.now().date()
+    upcoming = TravelOption.objects.filter(departure_date__gte=today).order_by('pk')
+    columns = ('pk', 'type', 'base_price', 'price', 'available_seats',
+               'total_seats', 'departure_date')
+    scanned = changed = 0
+    last_pk = 0
+
+    while True:
+        rows = list(upcoming.filter(pk__gt=last_pk).values_list(*columns)[:chunk_size])
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        scanned += len(rows)
+        changes = engine.price_rows(rows, today)
+        changed += len(changes)
+        if changes and not dry_run:
+            _apply_price_changes(changes, record_history)
+
+    return scanned, changed
+
+
+def _apply_price_changes(changes, record_history):
+    now = timezone.now()
+    options = [TravelOption(pk=pk, price=new, updated_at=now) for pk, _, new, _, _ in changes]
+    with transaction.atomic():
+        TravelOption.objects.bulk_update(options, ['price', 'updated_at'], batch_size=1000)
+        outbox.prices_changed([(pk, old, new) for pk, old, new, _, _ in changes])
+        if record_history:
+            PriceHistory.objects.bulk_create([
+                PriceHistory(
+                    travel_option_id=pk,
+                    old_price=old,
+                    new_price=new,
+                    load_factor=Decimal(repr(round(lf, 4))),
+                    days_to_departure=days,
+                )
+                for pk, old, new, lf, days in changes
+            ], batch_size=1000)
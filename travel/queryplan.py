@@ -0,0 +1,98 @@
+"""
+Query plans for tests and diagnostics.
+
+``query_plan(queryset)`` runs ``EXPLAIN`` and reduces the backend's output
+to what the index tests care about: which indexes are used, which tables
+are read in full and whether the rows are sorted after the fact. SQLite's
+``EXPLAIN QUERY PLAN`` text and MySQL's ``EXPLAIN FORMAT=JSON`` are
+parsed (``PLAN_VENDORS``); on other backends the plan comes back unparsed,
+with only the raw ``EXPLAIN`` output. ``assert_uses_index`` turns that into
+a test assertion; tests using it skip other backends.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+
+from django.db import connections
+
+_SQLITE_INDEX = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+PLAN_VENDORS = ('mysql', 'sqlite')
+
+
+@dataclass
+class QueryPlan:
+    indexes: set = field(default_factory=set)
+    # Tables read row by row without an index
+    full_scans: set = field(default_factory=set)
+    # Rows sorted after reading instead of read in index order
+    sorts: bool = False
+    raw: str = ''
+    # False when the backend's output is not understood: the fields above are empty
+    parsed: bool = True
+
+
+def _sqlite_plan(raw):
+    plan = QueryPlan(raw=raw)
+    for line in raw.splitlines():
+        # "<id> <parent> <notused> <detail>"
+        detail = line.split(' ', 3)[-1].strip()
+        plan.indexes.update(_SQLITE_INDEX.findall(detail))
+        match = _SQLITE_SCAN.match(detail)
+        if match:
+            plan.full_scans.add(match.group(1))
+        if 'USE TEMP B-TREE FOR' in detail and 'ORDER BY' in detail:
+            plan.sorts = True
+    return plan
+
+
+def _walk(node, plan):
+    if isinstance(node, dict):
+        table = node.get('table')
+        if isinstance(table, dict):
+            if table.get('key'):
+                plan.indexes.add(table['key'])
+            if table.get('access_type') == 'ALL':
+                plan.full_scans.add(table.get('table_name'))
+        if node.get('using_filesort'):
+            plan.sorts = True
+        for value in node.values():
+            _walk(value, plan)
+    elif isinstance(node, list):
+        for value in node:
+            _walk(value, plan)
+
+
+def query_plan(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor == 'mysql':
+        raw = queryset.explain(format='json')
+        plan = QueryPlan(raw=raw)
+        _walk(json.loads(raw), plan)
+        return plan
+    if connection.vendor == 'sqlite':
+        return _sqlite_plan(queryset.explain())
+    raw = queryset.explain() if connection.features.supports_explaining_query_execution else ''
+    return QueryPlan(raw=raw, parsed=False)
+
+
+def assert_uses_index(queryset, index, allow_scans=()):
+    """
+    Fail unless the plan uses ``index``, reads no table (other than
+    ``allow_scans``) in full and needs no separate sort.
+    """
+    plan = query_plan(queryset)
+    if not plan.parsed:
+        raise AssertionError(f'No plan parser for {connections[queryset.db].vendor}; see PLAN_VENDORS')
+    problems = []
+    if index not in plan.indexes:
+        problems.append(f'does not use {index} (uses {sorted(plan.indexes) or "no index"})')
+    scans = plan.full_scans - set(allow_scans)
+    if scans:
+        problems.append(f'scans {", ".join(sorted(scans))}')
+    if plan.sorts:
+        problems.append('sorts rows after reading them')
+    if problems:
+        raise AssertionError(f'Query {"; ".join(problems)}:\n{queryset.query}\n{plan.raw}')
+    return plan
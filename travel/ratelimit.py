@@ -0,0 +1,215 @@
+"""
+Admission control for the public booking endpoints.
+
+``AdmissionControlMiddleware`` sits at the top of the middleware stack, ahead
+of sessions and authentication, so a request rejected by the in-flight cap
+or its IP's bucket costs one URL resolve and a few cache lookups: no ORM
+query, no session load, no form. It applies
+
+* a per-process cap on requests in flight for the protected views; above it
+  the request is shed immediately,
+* a token bucket per client IP, checked on the way in, and
+* token buckets per logged-in user (``user.pk``, so clearing cookies does
+  not reset it) and per ``TravelOption`` (the ``pk`` URL kwarg), checked in
+  ``process_view`` once authentication has run, just before the view.
+
+Rejected requests get ``429 Too Many Requests`` with ``Retry-After``.
+Configuration lives in the ``TRAVEL_ADMISSION_CONTROL`` setting; buckets are
+``(tokens per second, burst size)`` pairs.
+
+Behind reverse proxies or a load balancer ``REMOTE_ADDR`` is the proxy's
+address, shared by every client. Set ``PROXY_HEADER`` (the ``META`` name,
+e.g. ``HTTP_X_FORWARDED_FOR``) and ``PROXY_HOPS``, the number of proxies we
+run in front of the app: the client is the address the outermost of them
+appended, ``PROXY_HOPS`` entries from the end of the header. Entries before
+it are supplied by the client and ignored. A header with fewer entries did
+not come through our proxies, and ``REMOTE_ADDR`` is used.
+
+Buckets live in the ``CACHE`` alias. With the default ``LocMemCache`` each
+worker process has its own buckets, so the effective limit is the
+configured one times the number of processes; use a shared cache (Redis,
+Memcached) for site-wide limits.
+"""
+import math
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+from . import metrics
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'KEY_PREFIX': 'admission',
+    'MAX_IN_FLIGHT': 64,
+    'PROXY_HEADER': None,
+    'PROXY_HOPS': 0,
+    'VIEWS': {},
+}
+
+LOCK_STRIPES = 64
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TRAVEL_ADMISSION_CONTROL', {}))
+    return config
+
+
+class TokenBucket:
+    """
+    Token bucket stored in a Django cache as ``(tokens, timestamp)``. Updates
+    of one key are serialized per process, by one of ``LOCK_STRIPES`` locks;
+    across processes a race can at worst let a handful of extra requests
+    through, which is acceptable for load shedding.
+    """
+    _locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def __init__(self, cache, rate, burst, timeout=None):
+        self.cache = cache
+        self.rate = float(rate)
+        self.burst = float(burst)
+        # Keep a bucket around until it would have refilled completely
+        self.timeout = timeout or max(1, math.ceil(self.burst / self.rate))
+
+    def take(self, key, cost=1, now=None):
+        """Returns ``(allowed, retry_after_seconds)``"""
+        now = time.time() if now is None else now
+        with self._locks[hash(key) % LOCK_STRIPES]:
+            tokens, stamp = self.cache.get(key) or (self.burst, now)
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            if tokens >= cost:
+                self.cache.set(key, (tokens - cost, now), self.timeout)
+                return True, 0
+            self.cache.set(key, (tokens, now), self.timeout)
+        return False, max(1, math.ceil((cost - tokens) / self.rate))
+
+
+class AdmissionStats:
+    """Process-local counters for rejections and requests in flight"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.admitted = Counter()
+        self.rejected = Counter()
+
+    def enter(self, view_name):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.admitted[view_name] += 1
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def reject(self, view_name, reason):
+        with self._lock:
+            self.rejected[(view_name, reason)] += 1
+        metrics.admission_rejected.inc(view=view_name, reason=reason)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'admitted': dict(self.admitted),
+                'rejected': [
+                    {'view': view, 'reason': reason, 'count': count}
+                    for (view, reason), count in sorted(self.rejected.items())
+                ],
+            }
+
+    def reset(self):
+        with self._lock:
+            self.max_in_flight = self.in_flight
+            self.admitted.clear()
+            self.rejected.clear()
+
+
+stats = AdmissionStats()
+
+
+@metrics.registry.register_collector
+def _collect_in_flight():
+    metrics.admission_in_flight.set(stats.in_flight)
+
+
+def client_address(request, config):
+    """The client's IP, through ``PROXY_HOPS`` trusted proxies"""
+    hops = config['PROXY_HOPS']
+    header = request.META.get(config['PROXY_HEADER']) if config['PROXY_HEADER'] and hops else None
+    if header:
+        addresses = [address.strip() for address in header.split(',')]
+        if len(addresses) >= hops and addresses[-hops]:
+            return addresses[-hops]
+    return request.META.get('REMOTE_ADDR')
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse('Too many requests, please retry shortly.\n',
+                            status=429, content_type='text/plain')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        if not config['ENABLED'] or not config['VIEWS']:
+            return self.get_response(request)
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return self.get_response(request)
+        policy = config['VIEWS'].get(match.view_name)
+        if policy is None:
+            return self.get_response(request)
+
+        view_name = match.view_name
+        if stats.in_flight >= config['MAX_IN_FLIGHT']:
+            stats.reject(view_name, 'saturated')
+            return too_many_requests(1)
+
+        request._admission = (view_name, policy, caches[config['CACHE']], f"{config['KEY_PREFIX']}:{view_name}")
+        rejected = self._check(request, [('ip', client_address(request, config))])
+        if rejected is not None:
+            return rejected
+
+        stats.enter(view_name)
+        try:
+            return self.get_response(request)
+        finally:
+            stats.leave()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not hasattr(request, '_admission'):
+            return None
+        user = getattr(request, 'user', None)
+        return self._check(request, [
+            ('user', user.pk if user is not None and user.is_authenticated else None),
+            # Shared by every client of the departure, so only spend it last
+            ('travel_option', view_kwargs.get('pk')),
+        ])
+
+    def _check(self, request, identities):
+        view_name, policy, cache, prefix = request._admission
+        for scope, identity in identities:
+            limit = policy.get(scope)
+            if limit is None or identity is None:
+                continue
+            allowed, retry_after = TokenBucket(cache, *limit).take(f'{prefix}:{scope}:{identity}')
+            if not allowed:
+                stats.reject(view_name, scope)
+                return too_many_requests(retry_after)
+        return None
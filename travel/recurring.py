@@ -0,0 +1,152 @@
+"""
+Recurring schedules.
+
+A ``RecurringSchedule`` describes a service once (route, weekdays, times,
+validity window, seats and base price) instead of as one ``TravelOption``
+row per day. Its departures are created lazily:
+
+* ``materialize`` creates the departures from the schedule's last expanded
+  day up to ``TRAVEL_SCHEDULE_HORIZON_DAYS`` ahead, in batched inserts, so
+  only a rolling window of rows exists. The ``materialize_schedules``
+  command runs it for every schedule daily. A day is only expanded once, so
+  a departure deleted in the admin (a cancelled service day) stays deleted,
+  until the schedule itself is edited.
+* ``apply_changes`` pushes an edited schedule to its upcoming departures
+  with a single ``UPDATE`` of those that have no bookings; departures with
+  bookings keep the times, seats and price their passengers booked.
+  Unbooked departures on days the schedule no longer runs are deleted and
+  newly added days are filled in.
+
+Departures get travel ids ``CODE-YYMMDD`` and are unique per schedule and
+day, so expanding the same days twice is harmless.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateField, Exists, ExpressionWrapper, F, OuterRef, Q
+from django.utils import timezone
+
+from . import outbox
+from .models import Booking, RecurringSchedule, TravelOption
+
+DEFAULT_HORIZON_DAYS = 60
+BATCH_SIZE = 500
+
+
+def get_horizon_days():
+    return getattr(settings, 'TRAVEL_SCHEDULE_HORIZON_DAYS', DEFAULT_HORIZON_DAYS)
+
+
+def service_days(schedule, start, end):
+    """Days between ``start`` and ``end`` (inclusive) the schedule runs on"""
+    days = []
+    day = start
+    while day <= end:
+        if schedule.runs_on(day):
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def materialize(schedule, today=None, horizon_days=None):
+    """Create the schedule's departures up to the horizon; returns the number created"""
+    today = today or timezone.now().date()
+    end = today + timedelta(days=get_horizon_days() if horizon_days is None else horizon_days)
+    if schedule.valid_until:
+        end = min(end, schedule.valid_until)
+    start = max(today, schedule.valid_from)
+    if schedule.materialized_until:
+        start = max(start, schedule.materialized_until + timedelta(days=1))
+    if not schedule.active or start > end:
+        return 0
+    days = service_days(schedule, start, end)
+    existing = set(
+        schedule.departures.filter(departure_date__range=(start, end)).values_list('departure_date', flat=True)
+    )
+    missing = [day for day in days if day not in existing]
+    for i in range(0, len(missing), BATCH_SIZE):
+        TravelOption.objects.bulk_create(
+            [schedule.departure_on(day) for day in missing[i:i + BATCH_SIZE]], ignore_conflicts=True,
+        )
+    schedule.materialized_until = end
+    RecurringSchedule.objects.filter(pk=schedule.pk).update(materialized_until=end)
+    return len(missing)
+
+
+def materialize_all(today=None, horizon_days=None):
+    """Expand every active schedule that is behind the horizon; returns departures created"""
+    today = today or timezone.now().date()
+    horizon = today + timedelta(days=get_horizon_days() if horizon_days is None else horizon_days)
+    behind = RecurringSchedule.objects.filter(active=True).filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=horizon),
+    ).exclude(valid_until__lt=today)
+    return sum(materialize(schedule, today, horizon_days) for schedule in behind)
+
+
+def _unbooked(schedule, today):
+    return schedule.departures.filter(departure_date__gte=today, seat_shards=0).exclude(
+        Exists(Booking.objects.filter(travel_option=OuterRef('pk'))),
+    )
+
+
+def apply_changes(schedule, today=None):
+    """
+    Bring the upcoming departures of an edited schedule in line with it.
+    Returns ``{'updated', 'removed', 'created', 'kept'}``: departures updated,
+    deleted because the schedule no longer runs that day, newly created, and
+    left as they were because they have bookings.
+    """
+    today = today or timezone.now().date()
+    with transaction.atomic():
+        not_running = ~Q(departure_date__iso_week_day__in=schedule.iso_weekdays) | Q(
+            departure_date__lt=schedule.valid_from,
+        )
+        if schedule.valid_until:
+            not_running |= Q(departure_date__gt=schedule.valid_until)
+        if not schedule.active:
+            not_running = Q()
+        # Locked, then checked again, so that a booking committed in between
+        # cannot be deleted along with its departure
+        candidates = list(
+            _unbooked(schedule, today).filter(not_running).select_for_update().order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        _, deleted = _unbooked(schedule, today).filter(pk__in=candidates).delete()
+        removed = deleted.get(TravelOption._meta.label, 0)
+        # Locked so no booking slips in between reading and updating them
+        before = list(
+            _unbooked(schedule, today).select_for_update().order_by('pk')
+            .values_list('pk', 'available_seats', 'price')
+        )
+        updated = TravelOption.objects.filter(pk__in=[pk for pk, _, _ in before]).update(
+            type=schedule.type,
+            source=schedule.source,
+            destination=schedule.destination,
+            departure_time=schedule.departure_time,
+            arrival_date=ExpressionWrapper(
+                F('departure_date') + timedelta(days=schedule.arrival_day_offset), output_field=DateField(),
+            ),
+            arrival_time=schedule.arrival_time,
+            total_seats=schedule.total_seats,
+            available_seats=schedule.total_seats,
+            base_price=schedule.base_price,
+            price=schedule.base_price,
+            updated_at=timezone.now(),
+        )
+        outbox.record(outbox.SEATS_CHANGED, [
+            (pk, {'travel_option_id': pk, 'delta': schedule.total_seats - seats})
+            for pk, seats, _ in before if seats != schedule.total_seats
+        ])
+        outbox.prices_changed([
+            (pk, price, schedule.base_price) for pk, _, price in before if price != schedule.base_price
+        ])
+        kept = schedule.departures.filter(departure_date__gte=today).count() - updated
+        # Fill in days added to the schedule, up to where it was expanded
+        horizon_days = None
+        if schedule.materialized_until:
+            horizon_days = max((schedule.materialized_until - today).days, 0)
+        schedule.materialized_until = None
+        RecurringSchedule.objects.filter(pk=schedule.pk).update(materialized_until=None)
+        created = materialize(schedule, today, horizon_days)
+    return {'updated': updated, 'removed': removed, 'created': created, 'kept': kept}
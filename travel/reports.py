@@ -0,0 +1,203 @@
+"""
+Daily occupancy and revenue rollups.
+
+``DailyRouteStats`` holds one row per departure day, route and travel type
+with seats offered, seats sold and confirmed revenue. The admin report reads
+only that table, and through the cache, so ops never aggregate the live
+``TravelOption``/``Booking`` tables.
+
+``refresh()`` keeps the rollup current incrementally: every seat or booking
+change bumps ``updated_at`` on the travel option or booking, so the days to
+recompute are the departure days of rows updated since the last run's
+watermark. Each such day is recomputed from scratch, from the hot and the
+archive tables, in its own short transaction. The watermark is moved back by
+``WATERMARK_LAG`` to catch transactions that committed after the previous
+run even though their ``updated_at`` is older.
+
+A departure moved to another date, or deleted (archiving included), leaves
+its old day behind; the ``pre_save``/``post_delete`` receivers below mark
+that day in ``StaleReportDay`` for the next run. Dates changed with
+``QuerySet.update()`` are not seen; rebuild with ``refresh(full=True)``.
+
+Seats sold count each departure's ``total_seats - available_seats`` (never
+below zero), with sharded departures' seats summed from their shards.
+"""
+import hashlib
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, Sum, When
+from django.db.models.signals import post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import inventory
+from .models import (
+    ArchivedBooking, ArchivedTravelOption, Booking, DailyRouteStats, ReportWatermark, StaleReportDay,
+    TravelOption,
+)
+
+WATERMARK_NAME = 'daily_route_stats'
+WATERMARK_LAG = timedelta(minutes=5)
+DAYS_PER_TRANSACTION = 7
+CACHE_TIMEOUT = 600
+CACHE_PREFIX = 'reports:daily'
+
+COLUMNS = ['day', 'source', 'destination', 'type', 'departures', 'total_seats', 'seats_sold',
+           'occupancy', 'bookings', 'revenue']
+
+
+def changed_days(since):
+    """Departure days touched by travel option or booking updates after ``since``"""
+    days = set(TravelOption.objects.filter(updated_at__gt=since).values_list('departure_date', flat=True).distinct())
+    days.update(
+        Booking.objects.filter(updated_at__gt=since)
+        .values_list('travel_option__departure_date', flat=True).distinct()
+    )
+    return days
+
+
+def mark_stale(days):
+    now = timezone.now()
+    StaleReportDay.objects.bulk_create(
+        [StaleReportDay(day=day, marked_at=now) for day in set(days)],
+        update_conflicts=True, unique_fields=['day'], update_fields=['marked_at'],
+    )
+
+
+@receiver(pre_save, sender=TravelOption)
+def mark_old_departure_day(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields is not None and 'departure_date' not in update_fields):
+        return
+    old = TravelOption.objects.filter(pk=instance.pk).values_list('departure_date', flat=True).first()
+    if old is not None and old != instance.departure_date:
+        mark_stale([old])
+
+
+@receiver(post_delete, sender=TravelOption)
+def mark_deleted_departure_day(sender, instance, **kwargs):
+    mark_stale([instance.departure_date])
+
+
+def _sold(total, available):
+    return max(total - available, 0)
+
+
+def all_days():
+    days = set(TravelOption.objects.values_list('departure_date', flat=True).distinct())
+    days.update(ArchivedTravelOption.objects.values_list('departure_date', flat=True).distinct())
+    return days
+
+
+def compute_days(days):
+    """``{(day, source, destination, type): values}`` from the hot and archive tables"""
+    rollup = defaultdict(lambda: {
+        'departures': 0, 'total_seats': 0, 'seats_sold': 0, 'bookings': 0, 'revenue': Decimal('0.00'),
+    })
+    for option_model, booking_model in ((TravelOption, Booking), (ArchivedTravelOption, ArchivedBooking)):
+        options = option_model.objects.filter(departure_date__in=days).order_by()
+        for row in options.values('departure_date', 'source', 'destination', 'type').annotate(
+            departures=Count('pk'), seats=Sum('total_seats'),
+            # Per departure, without ever subtracting a larger unsigned value
+            sold=Sum(Case(
+                When(available_seats__lt=F('total_seats'), then=F('total_seats') - F('available_seats')),
+                default=0,
+            )),
+        ):
+            entry = rollup[(row['departure_date'], row['source'], row['destination'], row['type'])]
+            entry['departures'] += row['departures']
+            entry['total_seats'] += row['seats']
+            entry['seats_sold'] += row['sold']
+        if option_model is TravelOption:
+            # available_seats of sharded departures lags behind their shards
+            sharded = list(options.filter(seat_shards__gt=0).only(
+                'departure_date', 'source', 'destination', 'type', 'total_seats', 'available_seats', 'seat_shards',
+            ))
+            recorded = {option.pk: option.available_seats for option in sharded}
+            for option in inventory.sum_shards(sharded):
+                entry = rollup[(option.departure_date, option.source, option.destination, option.type)]
+                entry['seats_sold'] += (_sold(option.total_seats, option.available_seats)
+                                        - _sold(option.total_seats, recorded[option.pk]))
+        bookings = booking_model.objects.filter(
+            status='confirmed', travel_option__departure_date__in=days,
+        ).order_by()
+        for row in bookings.values(
+            'travel_option__departure_date', 'travel_option__source',
+            'travel_option__destination', 'travel_option__type',
+        ).annotate(bookings=Count('pk'), revenue=Sum('total_price')):
+            entry = rollup[(row['travel_option__departure_date'], row['travel_option__source'],
+                            row['travel_option__destination'], row['travel_option__type'])]
+            entry['bookings'] += row['bookings']
+            entry['revenue'] += row['revenue'] or 0
+    return rollup
+
+
+def refresh_days(days):
+    """Recompute the rollup rows of ``days``, a few days per transaction"""
+    days = sorted(days)
+    for i in range(0, len(days), DAYS_PER_TRANSACTION):
+        chunk = days[i:i + DAYS_PER_TRANSACTION]
+        rows = [
+            DailyRouteStats(day=day, source=source, destination=destination, type=travel_type, **values)
+            for (day, source, destination, travel_type), values in compute_days(chunk).items()
+        ]
+        with transaction.atomic():
+            DailyRouteStats.objects.filter(day__in=chunk).delete()
+            DailyRouteStats.objects.bulk_create(rows, batch_size=500)
+    return len(days)
+
+
+def refresh(full=False):
+    """Bring the rollup up to date; returns the number of days recomputed"""
+    started = timezone.now()
+    watermark = ReportWatermark.objects.filter(name=WATERMARK_NAME).first()
+    if full or watermark is None:
+        days = all_days()
+        # Days that no longer have any departures
+        days.update(DailyRouteStats.objects.values_list('day', flat=True).distinct())
+    else:
+        days = changed_days(watermark.value - WATERMARK_LAG)
+    stale = StaleReportDay.objects.filter(marked_at__lte=started)
+    days.update(stale.values_list('day', flat=True))
+    refreshed = refresh_days(days)
+    # Days marked again while this ran stay for the next run
+    stale.delete()
+    ReportWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': started})
+    return refreshed
+
+
+def _version():
+    value = ReportWatermark.objects.filter(name=WATERMARK_NAME).values_list('value', flat=True).first()
+    return value.timestamp() if value else 0
+
+
+def report_rows(start, end, travel_type=None, route=None):
+    """
+    Rollup rows between ``start`` and ``end`` (inclusive) as dicts, served
+    from the cache until the next refresh.
+    """
+    filters = hashlib.md5(f'{start}|{end}|{travel_type or ""}|{route or ""}'.encode(), usedforsecurity=False)
+    key = f'{CACHE_PREFIX}:{_version()}:{filters.hexdigest()}'
+    rows = cache.get(key)
+    if rows is None:
+        queryset = DailyRouteStats.objects.filter(day__range=(start, end))
+        if travel_type:
+            queryset = queryset.filter(type=travel_type)
+        if route:
+            queryset = queryset.filter(source__icontains=route) | queryset.filter(destination__icontains=route)
+        rows = [
+            {column: getattr(stats, column) for column in COLUMNS}
+            for stats in queryset.order_by('day', 'source', 'destination', 'type')
+        ]
+        cache.set(key, rows, CACHE_TIMEOUT)
+    return rows
+
+
+def totals(rows):
+    result = {column: sum(row[column] for row in rows)
+              for column in ('departures', 'total_seats', 'seats_sold', 'bookings', 'revenue')}
+    result['occupancy'] = round(100 * result['seats_sold'] / result['total_seats'], 1) if result['total_seats'] else 0
+    return result
@@ -0,0 +1,151 @@
+"""
+Seat maps stored as bitmaps.
+
+A departure's seats are numbered row by row (``1A, 1B, ... 2A, ...``) and
+stored in ``SeatMap.taken`` as one bit per seat, so a 1,000-seat train is a
+125-byte column rather than a thousand rows. All searches are done with
+integer bit operations on the whole map at once:
+
+* ``free >> k`` shifted and AND-ed ``n - 1`` times leaves a bit set at every
+  position where ``n`` consecutive seats are free;
+* AND-ing that with a precomputed mask of positions where a run of ``n``
+  stays inside one block of seats (between aisles) or one row picks the
+  first group that really sits together.
+
+The map row is only read and written while the departure's
+``TravelOption`` row is locked (see ``inventory``), so claims for the same
+departure are serialized by the lock the booking already takes and each
+claim is a single short UPDATE.
+"""
+import math
+from functools import lru_cache
+
+# Seat letters per row; '-' is an aisle. Groups are kept within a block.
+LAYOUTS = {
+    'flight': 'ABC-DEF',
+    'train': 'AB-CD',
+    'bus': 'AB-CD',
+}
+WIDEBODY_LAYOUT = 'ABC-DEFG-HJK'
+WIDEBODY_MIN_SEATS = 300
+
+
+def default_layout(travel_type, total_seats):
+    if travel_type == 'flight' and total_seats >= WIDEBODY_MIN_SEATS:
+        return WIDEBODY_LAYOUT
+    return LAYOUTS.get(travel_type, LAYOUTS['bus'])
+
+
+class SeatPlan:
+    """Numbering of ``capacity`` seats in rows of ``layout``"""
+
+    def __init__(self, layout, capacity):
+        self.layout = layout
+        self.capacity = capacity
+        self.letters = layout.replace('-', '')
+        self.width = len(self.letters)
+        self.rows = math.ceil(capacity / self.width)
+        self.blocks = []
+        start = 0
+        for block in layout.split('-'):
+            self.blocks.append((start, start + len(block)))
+            start += len(block)
+
+    @property
+    def all_seats(self):
+        return (1 << self.capacity) - 1
+
+    def label(self, index):
+        row, column = divmod(index, self.width)
+        return f'{row + 1}{self.letters[column]}'
+
+    def index(self, label):
+        """Bit index of a label like ``12C``; raises ``ValueError`` for unknown seats"""
+        row, letter = label[:-1], label[-1:].upper()
+        if not row.isdigit() or letter not in self.letters:
+            raise ValueError(f'Unknown seat {label}')
+        index = (int(row) - 1) * self.width + self.letters.index(letter)
+        if not 0 <= index < self.capacity:
+            raise ValueError(f'Unknown seat {label}')
+        return index
+
+    def mask(self, labels):
+        bits = 0
+        for label in labels:
+            bits |= 1 << self.index(label)
+        return bits
+
+    def labels(self, bits):
+        labels = []
+        while bits:
+            lowest = bits & -bits
+            labels.append(self.label(lowest.bit_length() - 1))
+            bits ^= lowest
+        return labels
+
+    def free_count(self, taken):
+        return self.capacity - (taken & self.all_seats).bit_count()
+
+    def find(self, taken, n):
+        """
+        Bit mask of ``n`` free seats: side by side within a block if possible,
+        then within a row, otherwise the ``n`` lowest free seats. ``None`` when
+        fewer than ``n`` seats are free.
+        """
+        free = ~taken & self.all_seats
+        if n <= 0 or free.bit_count() < n:
+            return None
+        runs = free
+        for k in range(1, n):
+            runs &= free >> k
+        group = (1 << n) - 1
+        for within in ('block', 'row'):
+            candidates = runs & _start_mask(self.layout, self.capacity, n, within)
+            if candidates:
+                start = (candidates & -candidates).bit_length() - 1
+                return group << start
+        bits = 0
+        for _ in range(n):
+            lowest = free & -free
+            bits |= lowest
+            free ^= lowest
+        return bits
+
+    def grid(self, taken):
+        """Rows of ``(label, is_free)`` cells, ``None`` marking aisles, for templates"""
+        rows = []
+        for row in range(self.rows):
+            cells = []
+            for block_number, (start, end) in enumerate(self.blocks):
+                if block_number:
+                    cells.append(None)
+                for column in range(start, end):
+                    index = row * self.width + column
+                    if index < self.capacity:
+                        cells.append((self.label(index), not taken >> index & 1))
+            rows.append(cells)
+        return rows
+
+
+@lru_cache(maxsize=256)
+def _start_mask(layout, capacity, n, within):
+    """Positions where a run of ``n`` seats fits inside one block (or row)"""
+    plan = SeatPlan(layout, capacity)
+    spans = plan.blocks if within == 'block' else [(0, plan.width)]
+    row_mask = 0
+    for start, end in spans:
+        for position in range(start, end - n + 1):
+            row_mask |= 1 << position
+    mask = 0
+    for row in range(plan.rows):
+        mask |= row_mask << (row * plan.width)
+    # Runs must not extend past the last seat
+    return mask & ((1 << max(0, capacity - n + 1)) - 1)
+
+
+def to_bytes(bits, capacity):
+    return bits.to_bytes(math.ceil(capacity / 8), 'little')
+
+
+def from_bytes(data):
+    return int.from_bytes(bytes(data or b''), 'little')
@@ -0,0 +1,15 @@
+"""
+Booking lifecycle signals.
+
+Bookings are created by several code paths (``book_travel``, waitlist
+allocation, itineraries), some of them with ``bulk_create`` which fires no
+model signals. Each path sends these instead, inside its transaction, with
+the list of affected bookings.
+"""
+from django.dispatch import Signal
+
+# Sent with ``bookings`` (list of Booking) and ``source`` (str)
+bookings_created = Signal()
+
+# Sent with ``bookings`` (list of Booking)
+bookings_cancelled = Signal()
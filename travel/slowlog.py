@@ -0,0 +1,217 @@
+"""
+Slow-query log.
+
+``capture(origin)`` installs a database execute wrapper that notes every
+query slower than ``THRESHOLD_MS`` together with where in our code it was
+issued. When the block ends the notes are written to ``SlowQuery``, one row
+per normalized statement (literals and placeholders replaced by ``?``, ``IN``
+lists and multi-row ``VALUES`` collapsed), with a running count, total and
+maximum time. The first time a statement shape is seen its ``EXPLAIN``
+output is stored with it.
+
+Parameter values are never stored, only their types (and lengths for
+strings), since they may hold names and phone numbers.
+
+``SlowQueryMiddleware`` captures every request, using the view name as
+origin; the job worker captures every job. Configuration lives in the
+``TRAVEL_SLOW_QUERY_LOG`` setting.
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'THRESHOLD_MS': 200,
+    'EXPLAIN': True,
+    # Slow queries noted per request or job at most
+    'MAX_RECORDS': 50,
+}
+
+_NORMALIZE = [
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+'), r'\1, ...'),
+    (re.compile(r'\s+'), ' '),
+]
+
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TRAVEL_SLOW_QUERY_LOG', {}))
+    return config
+
+
+def normalize(sql):
+    for pattern, replacement in _NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(sql):
+    """Returns ``(digest, normalized statement)``"""
+    statement = normalize(sql)
+    return hashlib.md5(statement.encode(), usedforsecurity=False).hexdigest(), statement
+
+
+def redact(params, many=False):
+    """Describe query parameters without their values"""
+    if many:
+        return [f'{len(params)} rows']
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        params = params.values()
+    described = []
+    for value in params:
+        if value is None:
+            described.append(None)
+        elif isinstance(value, (str, bytes)):
+            described.append(f'{type(value).__name__}({len(value)})')
+        else:
+            described.append(type(value).__name__)
+    return described
+
+
+def caller_location():
+    """``path:line in function`` of the innermost project frame on the stack"""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename == _THIS_FILE or not filename.startswith(base_dir) or 'site-packages' in filename:
+            continue
+        return f'{os.path.relpath(filename, base_dir)}:{frame.lineno} in {frame.name}'
+    return ''
+
+
+def explain(sql, params):
+    """The backend's plan for a SELECT, or '' when it cannot be explained"""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            header = [column[0] for column in cursor.description or ()]
+            rows = cursor.fetchall()
+    except DatabaseError:
+        logger.warning('Could not explain slow query', exc_info=True)
+        return ''
+    lines = [' | '.join(header)] if header else []
+    lines.extend(' | '.join('' if value is None else str(value) for value in row) for row in rows)
+    return '\n'.join(lines)
+
+
+class SlowQueryLog:
+    """Execute wrapper collecting queries slower than ``threshold_ms``"""
+
+    def __init__(self, origin, threshold_ms, max_records):
+        self.origin = origin
+        self.threshold_ms = threshold_ms
+        self.max_records = max_records
+        self.records = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= self.threshold_ms and len(self.records) < self.max_records:
+                self.records.append((sql, params, many, elapsed_ms, caller_location()))
+
+    def save(self, with_explain=True):
+        """Fold the collected queries into ``SlowQuery``, one UPDATE per statement shape"""
+        grouped = {}
+        for sql, params, many, elapsed_ms, location in self.records:
+            digest, statement = fingerprint(sql)
+            entry = grouped.setdefault(digest, {
+                'statement': statement, 'sql': sql, 'params': params, 'many': many,
+                'location': location, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            })
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        self.records = []
+
+        now = timezone.now()
+        for digest, entry in grouped.items():
+            changes = {
+                'count': F('count') + entry['count'],
+                'total_ms': F('total_ms') + entry['total_ms'],
+                'max_ms': Greatest('max_ms', Value(entry['max_ms'], output_field=FloatField())),
+                'origin': self.origin[:200],
+                'location': entry['location'][:255],
+                'last_seen': now,
+            }
+            if SlowQuery.objects.filter(fingerprint=digest).update(**changes):
+                continue
+            plan = ''
+            if with_explain and not entry['many']:
+                plan = explain(entry['sql'], entry['params'])
+            try:
+                with transaction.atomic():
+                    SlowQuery.objects.create(
+                        fingerprint=digest,
+                        statement=entry['statement'],
+                        sample_params=redact(entry['params'], entry['many']),
+                        origin=self.origin[:200],
+                        location=entry['location'][:255],
+                        count=entry['count'],
+                        total_ms=entry['total_ms'],
+                        max_ms=entry['max_ms'],
+                        explain=plan,
+                        last_seen=now,
+                    )
+            except IntegrityError:
+                # Another process recorded the same statement first
+                SlowQuery.objects.filter(fingerprint=digest).update(**changes)
+
+
+@contextmanager
+def capture(origin):
+    """Record slow queries run inside the block; yields the log (or None when disabled)"""
+    config = get_config()
+    if not config['ENABLED']:
+        yield None
+        return
+    log = SlowQueryLog(origin, config['THRESHOLD_MS'], config['MAX_RECORDS'])
+    try:
+        with connection.execute_wrapper(log):
+            yield log
+    finally:
+        if log.records:
+            try:
+                log.save(with_explain=config['EXPLAIN'])
+            except DatabaseError:
+                logger.warning('Could not save slow query log', exc_info=True)
+
+
+class SlowQueryMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with capture(request.path_info) as log:
+            response = self.get_response(request)
+            match = getattr(request, 'resolver_match', None)
+            if log is not None and match is not None:
+                log.origin = match.view_name
+        return response
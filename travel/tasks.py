@@ -0,0 +1,57 @@
+"""
+Background job handlers. Imported by ``TravelConfig.ready`` so every process
+that can enqueue or run jobs knows about them.
+"""
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from .jobs import task
+from .models import Booking, Itinerary
+from .waitlist import allocate_waitlist
+
+
+@task('travel.send_booking_confirmation')
+def send_booking_confirmation(booking_id):
+    booking = (
+        Booking.objects
+        .select_related('user', 'travel_option')
+        .filter(pk=booking_id)
+        .first()
+    )
+    if booking is None or not booking.user.email:
+        return
+    send_mail(
+        subject=f'Booking confirmed: {booking.booking_id}',
+        message=render_to_string('travel/email/booking_confirmation.txt', {'booking': booking}),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[booking.user.email],
+    )
+
+
+
+@task('travel.send_itinerary_confirmation')
+def send_itinerary_confirmation(itinerary_id):
+    itinerary = Itinerary.objects.select_related('user').filter(pk=itinerary_id).first()
+    if itinerary is None or not itinerary.user.email:
+        return
+    bookings = itinerary.bookings.select_related('travel_option').order_by('travel_option__departure_date', 'pk')
+    send_mail(
+        subject=f'Itinerary confirmed: {itinerary.reference}',
+        message=render_to_string('travel/email/itinerary_confirmation.txt', {
+            'itinerary': itinerary,
+            'bookings': bookings,
+        }),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[itinerary.user.email],
+    )
+
+
+@task('travel.allocate_waitlist')
+def allocate_waitlist_job(travel_option_id):
+    allocate_waitlist(travel_option_id)
+
+
+@task('jobs.noop')
+def noop(**payload):
+    """Does nothing; used by the job queue benchmark"""
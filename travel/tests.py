@@ -1,11 +1,44 @@
-from django.test import TestCase, Client
+import asyncio
+import json
+import os
+import socket
+import tempfile
+from datetime import date, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, models, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
-from decimal import Decimal
-from datetime import date, time, timedelta
-from .models import TravelOption, Booking
-from .forms import TravelSearchForm, BookingForm
+
+from . import currency, idempotency, inventory, jobs, live, lookup, metrics, outbox, recurring, reports, slowlog, trending
+from .archive import ChainedResults, archive_departed
+from .forms import BookingForm, TravelSearchForm, WaitlistForm, render_search_form
+from .inventory import InsufficientSeats, reconcile_inventory
+from .itinerary import ItineraryError, book_itinerary
+from .models import (
+    ArchivedBooking, ArchivedTravelOption, Booking, DailyRouteStats, ExchangeRate, IdempotencyKey, Itinerary, Job,
+    OutboxEvent, PriceHistory, RecurringSchedule, ReportWatermark, RoutePopularity, SeatMap, SeatShard, SlowQuery,
+    StaleReportDay, TravelOption, WaitlistEntry,
+)
+from .operations import AddIndexOnline, index_exists
+from .pricing import FareCurve, PricingEngine, reprice_upcoming
+from .queryplan import PLAN_VENDORS, assert_uses_index, query_plan
+from .ratelimit import TokenBucket, stats as admission_stats
+from .seatmap import SeatPlan
+from .waitlist import allocate_waitlist, process_waitlists
 
 class TravelOptionModelTest(TestCase):
     def setUp(self):
@@ -250,4 +283,1885 @@ class TravelFormsTest(TestCase):
         }
         form = BookingForm(data=form_data, travel_option=self.travel_option)
         self.assertFalse(form.is_valid())
-        self.assertIn('Please provide exactly 2 passenger names', str(form.errors))
\ No newline at end of file
+        self.assertIn('Please provide exactly 2 passenger names', str(form.errors))
+    
+    def test_form_helpers_are_shared(self):
+        self.assertIs(TravelSearchForm().helper, TravelSearchForm().helper)
+        self.assertIs(BookingForm().helper, BookingForm(travel_option=self.travel_option).helper)
+        self.assertIsNot(WaitlistForm().helper, BookingForm().helper)
+    
+    def test_search_form_markup(self):
+        html = render_search_form(TravelSearchForm())
+        self.assertIs(html, render_search_form(TravelSearchForm()))
+        self.assertIn('name="depart_after"', html)
+        bound = render_search_form(TravelSearchForm({'source': 'Miami'}))
+        self.assertIn('value="Miami"', bound)
+        response = self.client.get(reverse('travel:home'))
+        self.assertContains(response, 'name="max_duration"')
+
+class PricingEngineTest(TestCase):
+    def setUp(self):
+        self.engine = PricingEngine(curves={
+            'load_factor': [(0.0, 1.0), (1.0, 2.0)],
+            'days_to_departure': [(0, 1.0)],
+            'type': {'flight': 1.0, 'bus': 0.5},
+        })
+        self.travel_option = TravelOption.objects.create(
+            travel_id='PR001',
+            type='flight',
+            source='Seattle',
+            destination='Denver',
+            departure_date=date.today() + timedelta(days=10),
+            departure_time=time(9, 00),
+            arrival_date=date.today() + timedelta(days=10),
+            arrival_time=time(12, 00),
+            price=Decimal('100.00'),
+            available_seats=50,
+            total_seats=100
+        )
+    
+    def test_fare_curve_interpolates_and_clamps(self):
+        curve = FareCurve([(0, 1.0), (10, 2.0)])
+        self.assertEqual(curve(-5), 1.0)
+        self.assertAlmostEqual(curve(5), 1.5)
+        self.assertEqual(curve(50), 2.0)
+    
+    def test_base_price_defaults_to_price(self):
+        self.assertEqual(self.travel_option.base_price, Decimal('100.00'))
+    
+    def test_price_for(self):
+        self.assertEqual(self.engine.price_for(self.travel_option), Decimal('150.00'))
+    
+    def test_reprice_updates_only_changed_rows(self):
+        TravelOption.objects.create(
+            travel_id='PR002',
+            type='flight',
+            source='Seattle',
+            destination='Denver',
+            departure_date=date.today() + timedelta(days=10),
+            departure_time=time(15, 00),
+            arrival_date=date.today() + timedelta(days=10),
+            arrival_time=time(18, 00),
+            price=Decimal('100.00'),
+            available_seats=100,
+            total_seats=100
+        )
+        scanned, changed = reprice_upcoming(engine=self.engine, chunk_size=1)
+        self.assertEqual((scanned, changed), (2, 1))
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.price, Decimal('150.00'))
+        history = PriceHistory.objects.get()
+        self.assertEqual(history.travel_option, self.travel_option)
+        self.assertEqual(history.old_price, Decimal('100.00'))
+        self.assertEqual(history.new_price, Decimal('150.00'))
+        
+        # A second run finds nothing left to change
+        self.assertEqual(reprice_upcoming(engine=self.engine), (2, 0))
+    
+    def test_reprice_dry_run(self):
+        self.assertEqual(reprice_upcoming(engine=self.engine, dry_run=True), (1, 1))
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.price, Decimal('100.00'))
+        self.assertFalse(PriceHistory.objects.exists())
+
+class WaitlistTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='waiter', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            travel_id='WL001',
+            type='bus',
+            source='Austin',
+            destination='Dallas',
+            departure_date=date.today() + timedelta(days=4),
+            departure_time=time(7, 00),
+            arrival_date=date.today() + timedelta(days=4),
+            arrival_time=time(10, 00),
+            price=Decimal('30.00'),
+            available_seats=0,
+            total_seats=40
+        )
+    
+    def _join(self, username, seats):
+        user = User.objects.create_user(username=username, password='testpass123')
+        return WaitlistEntry.objects.create(
+            user=user,
+            travel_option=self.travel_option,
+            number_of_seats=seats,
+            passenger_details={'names': [username] * seats, 'contact_phone': '555'}
+        )
+    
+    def test_book_fully_booked_redirects_to_waitlist(self):
+        self.client.login(username='waiter', password='testpass123')
+        response = self.client.get(
+            reverse('travel:book_travel', kwargs={'pk': self.travel_option.pk})
+        )
+        self.assertRedirects(response, reverse('travel:join_waitlist', kwargs={'pk': self.travel_option.pk}))
+    
+    def test_join_waitlist_view(self):
+        self.client.login(username='waiter', password='testpass123')
+        response = self.client.post(
+            reverse('travel:join_waitlist', kwargs={'pk': self.travel_option.pk}),
+            {
+                'number_of_seats': 1,
+                'passenger_names': 'Wait Er',
+                'contact_phone': '+1234567890'
+            }
+        )
+        self.assertRedirects(response, reverse('travel:booking_list'))
+        entry = WaitlistEntry.objects.get(user=self.user)
+        self.assertEqual(entry.status, 'waiting')
+        self.assertEqual(entry.position, 1)
+    
+    def test_allocation_is_fifo_and_stops_at_blocked_head(self):
+        first = self._join('first', 2)
+        second = self._join('second', 3)
+        third = self._join('third', 1)
+        self.travel_option.available_seats = 4
+        self.travel_option.save()
+        
+        bookings = allocate_waitlist(self.travel_option.pk, page_size=1)
+        self.assertEqual(len(bookings), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual(first.status, 'allocated')
+        self.assertEqual(first.booking.number_of_seats, 2)
+        self.assertEqual(first.booking.total_price, Decimal('60.00'))
+        self.assertEqual(second.status, 'waiting')
+        self.assertEqual(third.status, 'waiting')
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 2)
+    
+    def test_cancellation_frees_seats_for_waitlist(self):
+        booking = Booking.objects.create(
+            user=self.user,
+            travel_option=self.travel_option,
+            number_of_seats=3
+        )
+        entry = self._join('next', 3)
+        booking.cancel_booking()
+        self.assertTrue(Job.objects.filter(
+            task='travel.allocate_waitlist',
+            payload={'travel_option_id': self.travel_option.pk}
+        ).exists())
+        
+        self.assertEqual(process_waitlists(), 1)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'allocated')
+        self.assertEqual(entry.booking.user, entry.user)
+        self.assertTrue(Job.objects.filter(
+            task='travel.send_booking_confirmation',
+            payload={'booking_id': entry.booking.pk}
+        ).exists())
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 0)
+        self.assertEqual(process_waitlists(), 0)
+    
+    def test_sharded_departure_allocates_from_locked_shards(self):
+        first = self._join('first', 1)
+        second = self._join('second', 2)
+        TravelOption.objects.filter(pk=self.travel_option.pk).update(available_seats=4)
+        inventory.set_seat_shards(self.travel_option.pk, 2)
+        # Shard bookings since the recorded count was last synced
+        SeatShard.objects.filter(travel_option=self.travel_option).update(available_seats=0)
+        SeatShard.objects.filter(travel_option=self.travel_option, shard=0).update(available_seats=1)
+        
+        self.assertEqual(len(allocate_waitlist(self.travel_option.pk)), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('allocated', 'waiting'))
+        self.assertEqual(inventory.available_seats(TravelOption.objects.get(pk=self.travel_option.pk)), 0)
+    
+    def test_seats_released_to_shards_are_allocated_before_sync(self):
+        self.travel_option.available_seats = 2
+        self.travel_option.save()
+        inventory.set_seat_shards(self.travel_option.pk, 2)
+        booking = Booking.objects.create(user=self.user, travel_option=self.travel_option, number_of_seats=2)
+        with transaction.atomic():
+            locked = inventory.lock_travel_options([self.travel_option.pk])[self.travel_option.pk]
+            inventory.reserve_seats(locked, 2)
+        inventory.sync_shard_totals()
+        entry = self._join('next', 2)
+        self.assertEqual(process_waitlists(), 0)
+        
+        booking.cancel_booking()
+        # Given back to a shard; the recorded count waits for the next sync
+        self.assertEqual(TravelOption.objects.get(pk=self.travel_option.pk).available_seats, 0)
+        self.assertEqual(process_waitlists(), 1)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'allocated')
+    
+    def test_failed_departure_does_not_stop_the_others(self):
+        self._join('first', 1)
+        self.travel_option.available_seats = 1
+        self.travel_option.save()
+        other = TravelOption.objects.create(
+            travel_id='WL002', type='bus', source='Austin', destination='Houston',
+            departure_date=self.travel_option.departure_date, departure_time=time(8, 0),
+            arrival_date=self.travel_option.departure_date, arrival_time=time(11, 0),
+            price=Decimal('30.00'), available_seats=1, total_seats=40,
+        )
+        WaitlistEntry.objects.create(user=self.user, travel_option=other, number_of_seats=1,
+                                     passenger_details={'names': ['waiter'], 'contact_phone': '555'})
+        reserve = inventory.reserve_seats
+        
+        def flaky_reserve(travel_option, seats):
+            if travel_option.pk == self.travel_option.pk:
+                raise InsufficientSeats(travel_option, seats)
+            return reserve(travel_option, seats)
+        
+        with mock.patch('travel.waitlist.reserve_seats', flaky_reserve):
+            self.assertEqual(process_waitlists(), 1)
+        self.assertFalse(Booking.objects.filter(travel_option=self.travel_option).exists())
+        self.assertTrue(Booking.objects.filter(travel_option=other).exists())
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.calls = []
+        
+        @jobs.task('tests.record')
+        def record(value):
+            self.calls.append(value)
+        
+        @jobs.task('tests.fail')
+        def fail():
+            raise RuntimeError('boom')
+    
+    def test_enqueue_rolls_back_with_transaction(self):
+        try:
+            with transaction.atomic():
+                jobs.enqueue('tests.record', {'value': 1})
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Job.objects.exists())
+    
+    def test_enqueue_unknown_task(self):
+        with self.assertRaises(jobs.UnknownTask):
+            jobs.enqueue('tests.missing')
+    
+    def test_claim_and_run(self):
+        jobs.enqueue('tests.record', {'value': 1})
+        jobs.enqueue('tests.record', {'value': 2})
+        claimed = jobs.claim_jobs('w1', limit=10)
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(jobs.claim_jobs('w2', limit=10), [])
+        for job in claimed:
+            self.assertTrue(jobs.run_job(job))
+        self.assertEqual(self.calls, [1, 2])
+        self.assertEqual(Job.objects.filter(status='done').count(), 2)
+    
+    def test_retry_with_backoff_then_dead_letter(self):
+        job = jobs.enqueue('tests.fail', max_attempts=2)
+        self.assertFalse(jobs.run_job(jobs.claim_jobs('w1')[0]))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('boom', job.last_error)
+        
+        # Not due yet
+        self.assertEqual(jobs.claim_jobs('w1'), [])
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertFalse(jobs.run_job(jobs.claim_jobs('w1')[0]))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'dead')
+        self.assertEqual(job.attempts, 2)
+    
+    def test_requeue_stale(self):
+        job = jobs.enqueue('tests.record', {'value': 1})
+        jobs.claim_jobs('w1')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+    
+    def test_worker_requeues_stale_jobs_while_running(self):
+        job = jobs.enqueue('tests.record', {'value': 1})
+        jobs.claim_jobs('crashed')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        with mock.patch.object(jobs, 'STALE_CHECK_SECONDS', 0):
+            self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+    
+    def test_purge_finished_jobs(self):
+        done = jobs.enqueue('tests.record', {'value': 1})
+        dead = jobs.enqueue('tests.record', {'value': 2})
+        recent = jobs.enqueue('tests.record', {'value': 3})
+        queued = jobs.enqueue('tests.record', {'value': 4})
+        old = timezone.now() - timedelta(days=30)
+        Job.objects.filter(pk=done.pk).update(status='done', updated_at=old)
+        Job.objects.filter(pk=dead.pk).update(status='dead', updated_at=old)
+        Job.objects.filter(pk=recent.pk).update(status='done')
+        Job.objects.filter(pk=queued.pk).update(updated_at=old)
+        out = StringIO()
+        call_command('purge_jobs', stdout=out)
+        self.assertIn('Deleted 2 finished jobs', out.getvalue())
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {recent.pk, queued.pk})
+    
+    def test_booking_enqueues_confirmation(self):
+        User.objects.create_user(username='mailme', email='mail@example.com', password='testpass123')
+        travel_option = TravelOption.objects.create(
+            travel_id='JQ001',
+            type='train',
+            source='Portland',
+            destination='Seattle',
+            departure_date=date.today() + timedelta(days=2),
+            departure_time=time(8, 00),
+            arrival_date=date.today() + timedelta(days=2),
+            arrival_time=time(11, 30),
+            price=Decimal('40.00'),
+            available_seats=10,
+            total_seats=10
+        )
+        self.client.login(username='mailme', password='testpass123')
+        self.client.post(
+            reverse('travel:book_travel', kwargs={'pk': travel_option.pk}),
+            {
+                'number_of_seats': 1,
+                'passenger_names': 'Mail Me',
+                'contact_phone': '+1234567890'
+            }
+        )
+        job = Job.objects.get(task='travel.send_booking_confirmation')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(Booking.objects.get().booking_id, mail.outbox[0].subject)
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='etag', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            travel_id='CG001',
+            type='flight',
+            source='Boston',
+            destination='Miami',
+            departure_date=date.today() + timedelta(days=6),
+            departure_time=time(11, 00),
+            arrival_date=date.today() + timedelta(days=6),
+            arrival_time=time(14, 30),
+            price=Decimal('210.00'),
+            available_seats=20,
+            total_seats=20
+        )
+    
+    def _revalidate(self, url, last_modified=True):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.has_header('ETag'))
+        self.assertEqual(first.has_header('Last-Modified'), last_modified)
+        return first, self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+    
+    def test_travel_detail_not_modified(self):
+        url = reverse('travel:travel_detail', kwargs={'pk': self.travel_option.pk})
+        first, second = self._revalidate(url)
+        self.assertEqual(second.status_code, 304)
+        
+        self.travel_option.available_seats = 19
+        self.travel_option.save()
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, 200)
+        
+        # Both validators share one query
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=third['ETag']).status_code, 304)
+        self.assertEqual(len([q for q in queries.captured_queries if 'travel_traveloption' in q['sql']]), 1)
+    
+    def test_sharded_travel_detail_revalidates_on_shard_bookings(self):
+        inventory.set_seat_shards(self.travel_option.pk, 2)
+        url = reverse('travel:travel_detail', kwargs={'pk': self.travel_option.pk})
+        first = self.client.get(url)
+        self.assertFalse(first.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        with transaction.atomic():
+            locked = inventory.lock_travel_options([self.travel_option.pk])[self.travel_option.pk]
+            inventory.reserve_seats(locked, 2)
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.context['travel_option'].available_seats, 18)
+    
+    def test_etag_differs_per_viewer(self):
+        url = reverse('travel:travel_detail', kwargs={'pk': self.travel_option.pk})
+        anonymous = self.client.get(url)
+        self.client.login(username='etag', password='testpass123')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=anonymous['ETag'])
+        self.assertEqual(response.status_code, 200)
+    
+    def test_etag_changes_with_csrf_token_on_relogin(self):
+        url = reverse('travel:travel_detail', kwargs={'pk': self.travel_option.pk})
+        credentials = {'username': 'etag', 'password': 'testpass123'}
+        self.client.post(reverse('login'), credentials)
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        token = self.client.cookies[settings.CSRF_COOKIE_NAME].value
+        
+        self.client.post(reverse('logout'))
+        self.client.post(reverse('login'), credentials)
+        self.assertNotEqual(self.client.cookies[settings.CSRF_COOKIE_NAME].value, token)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+    
+    def test_booking_detail_not_modified(self):
+        booking = Booking.objects.create(
+            user=self.user,
+            travel_option=self.travel_option,
+            number_of_seats=1
+        )
+        self.client.login(username='etag', password='testpass123')
+        url = reverse('travel:booking_detail', kwargs={'pk': booking.pk})
+        first, second = self._revalidate(url)
+        self.assertEqual(second.status_code, 304)
+        
+        booking.cancel_booking()
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, 200)
+    
+    def test_search_results_not_modified(self):
+        url = reverse('travel:home') + '?source=Boston'
+        first, second = self._revalidate(url, last_modified=False)
+        self.assertEqual(second.status_code, 304)
+        
+        other = self.client.get(reverse('travel:home') + '?source=Miami',
+                                HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(other.status_code, 200)
+        
+        TravelOption.objects.create(
+            travel_id='CG002',
+            type='bus',
+            source='Boston',
+            destination='Providence',
+            departure_date=date.today() + timedelta(days=6),
+            departure_time=time(9, 00),
+            arrival_date=date.today() + timedelta(days=6),
+            arrival_time=time(10, 30),
+            price=Decimal('15.00'),
+            available_seats=30,
+            total_seats=30
+        )
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, 200)
+        self.assertContains(third, '2 results found')
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='archivist', password='testpass123')
+        self.old_option = self._option('AR001', date.today() - timedelta(days=120))
+        self.recent_option = self._option('AR002', date.today() - timedelta(days=10))
+        self.old_booking = Booking.objects.create(
+            user=self.user, travel_option=self.old_option, number_of_seats=2
+        )
+        self.recent_booking = Booking.objects.create(
+            user=self.user, travel_option=self.recent_option, number_of_seats=1
+        )
+    
+    def _option(self, travel_id, departure_date):
+        return TravelOption.objects.create(
+            travel_id=travel_id,
+            type='train',
+            source='Denver',
+            destination='Omaha',
+            departure_date=departure_date,
+            departure_time=time(8, 00),
+            arrival_date=departure_date,
+            arrival_time=time(16, 00),
+            price=Decimal('70.00'),
+            available_seats=100,
+            total_seats=100
+        )
+    
+    def test_archive_moves_departed_rows(self):
+        self.assertEqual(archive_departed(retention_days=90, batch_size=1), (1, 1))
+        self.assertFalse(TravelOption.objects.filter(pk=self.old_option.pk).exists())
+        self.assertFalse(Booking.objects.filter(pk=self.old_booking.pk).exists())
+        archived = ArchivedBooking.objects.get(pk=self.old_booking.pk)
+        self.assertEqual(archived.booking_id, self.old_booking.booking_id)
+        self.assertEqual(archived.travel_option.travel_id, 'AR001')
+        self.assertTrue(TravelOption.objects.filter(pk=self.recent_option.pk).exists())
+        self.assertEqual(archive_departed(retention_days=90), (0, 0))
+    
+    def test_archived_booking_still_readable(self):
+        archive_departed(retention_days=90)
+        self.client.login(username='archivist', password='testpass123')
+        response = self.client.get(
+            reverse('travel:booking_detail', kwargs={'pk': self.old_booking.pk})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.old_booking.booking_id)
+        self.assertContains(response, '(archived)')
+        self.assertNotContains(response, 'Cancel Booking')
+        
+        response = self.client.get(reverse('travel:booking_list'))
+        self.assertContains(response, self.old_booking.booking_id)
+        self.assertContains(response, self.recent_booking.booking_id)
+    
+    def test_chained_results_slicing(self):
+        archive_departed(retention_days=90)
+        chained = ChainedResults(
+            Booking.objects.filter(user=self.user),
+            ArchivedBooking.objects.filter(user=self.user),
+        )
+        self.assertEqual(len(chained), 2)
+        self.assertEqual([b.pk for b in chained[0:2]], [self.recent_booking.pk, self.old_booking.pk])
+        self.assertEqual(chained[1].pk, self.old_booking.pk)
+        self.assertEqual(chained[1:5][0].pk, self.old_booking.pk)
+
+class AdmissionControlTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        admission_stats.reset()
+        self.client = Client()
+        self.travel_option = TravelOption.objects.create(
+            travel_id='RL001',
+            type='bus',
+            source='Tampa',
+            destination='Orlando',
+            departure_date=date.today() + timedelta(days=3),
+            departure_time=time(9, 00),
+            arrival_date=date.today() + timedelta(days=3),
+            arrival_time=time(11, 00),
+            price=Decimal('20.00'),
+            available_seats=50,
+            total_seats=50
+        )
+    
+    def tearDown(self):
+        cache.clear()
+    
+    def test_token_bucket(self):
+        bucket = TokenBucket(cache, rate=1, burst=2)
+        self.assertEqual(bucket.take('k', now=100), (True, 0))
+        self.assertEqual(bucket.take('k', now=100), (True, 0))
+        self.assertEqual(bucket.take('k', now=100), (False, 1))
+        self.assertEqual(bucket.take('k', now=101), (True, 0))
+    
+    @override_settings(TRAVEL_ADMISSION_CONTROL={'VIEWS': {'travel:home': {'ip': (0.1, 2)}}})
+    def test_ip_limit_returns_429_without_queries(self):
+        self.assertEqual(self.client.get(reverse('travel:home')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('travel:home')).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('travel:home'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(len(queries), 0)
+        
+        # Other clients are unaffected
+        response = self.client.get(reverse('travel:home'), REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(admission_stats.snapshot()['rejected'],
+                         [{'view': 'travel:home', 'reason': 'ip', 'count': 1}])
+    
+    @override_settings(TRAVEL_ADMISSION_CONTROL={
+        'PROXY_HEADER': 'HTTP_X_FORWARDED_FOR', 'PROXY_HOPS': 1,
+        'VIEWS': {'travel:home': {'ip': (0.1, 1)}},
+    })
+    def test_ip_limit_behind_proxy(self):
+        url = reverse('travel:home')
+        proxy = {'REMOTE_ADDR': '10.0.0.1'}
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='203.0.113.5', **proxy).status_code, 200)
+        # A second client behind the same proxy has its own bucket
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='203.0.113.6', **proxy).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='203.0.113.5', **proxy).status_code, 429)
+        # Addresses the client put in front of the proxy's are ignored
+        response = self.client.get(url, HTTP_X_FORWARDED_FOR='198.51.100.1, 203.0.113.5', **proxy)
+        self.assertEqual(response.status_code, 429)
+        # Without the header, the proxy's own address is used
+        self.assertEqual(self.client.get(url, **proxy).status_code, 200)
+    
+    @override_settings(TRAVEL_ADMISSION_CONTROL={
+        'VIEWS': {'travel:book_travel': {'travel_option': (0.1, 1)}}
+    })
+    def test_travel_option_limit(self):
+        url = reverse('travel:book_travel', kwargs={'pk': self.travel_option.pk})
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.3').status_code, 429)
+    
+    @override_settings(TRAVEL_ADMISSION_CONTROL={
+        'VIEWS': {'travel:book_travel': {'user': (0.1, 1)}}
+    })
+    def test_user_limit_follows_the_account_not_the_cookie(self):
+        User.objects.create_user(username='hammer', password='testpass123')
+        url = reverse('travel:book_travel', kwargs={'pk': self.travel_option.pk})
+        self.client.login(username='hammer', password='testpass123')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # A fresh session (cleared cookies) is still the same user
+        other = Client()
+        other.login(username='hammer', password='testpass123')
+        self.assertEqual(other.get(url, REMOTE_ADDR='10.0.0.4').status_code, 429)
+        # Anonymous requests have no user bucket
+        self.assertEqual(Client().get(url).status_code, 302)
+    
+    @override_settings(TRAVEL_ADMISSION_CONTROL={
+        'MAX_IN_FLIGHT': 0, 'VIEWS': {'travel:home': {}}
+    })
+    def test_sheds_load_when_saturated(self):
+        response = self.client.get(reverse('travel:home'))
+        self.assertEqual(response.status_code, 429)
+        # Unprotected views are not shed
+        response = self.client.get(
+            reverse('travel:travel_detail', kwargs={'pk': self.travel_option.pk})
+        )
+        self.assertEqual(response.status_code, 200)
+    
+    def test_stats_view_is_staff_only(self):
+        url = reverse('travel:admission_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.create_user(username='ops', password='testpass123', is_staff=True)
+        self.client.login(username='ops', password='testpass123')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('in_flight', response.json())
+
+class ItineraryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='roundtrip', password='testpass123')
+        self.outbound = self._option('IT001', 5, 30)
+        self.inbound = self._option('IT002', 9, 30)
+    
+    def _option(self, travel_id, days, seats):
+        return TravelOption.objects.create(
+            travel_id=travel_id,
+            type='train',
+            source='Chicago',
+            destination='St. Louis',
+            departure_date=date.today() + timedelta(days=days),
+            departure_time=time(7, 00),
+            arrival_date=date.today() + timedelta(days=days),
+            arrival_time=time(12, 00),
+            price=Decimal('55.00'),
+            available_seats=seats,
+            total_seats=seats
+        )
+    
+    def test_round_trip(self):
+        itinerary = book_itinerary(
+            self.user, [self.inbound.pk, self.outbound.pk], ['Ann', 'Bob'], '555'
+        )
+        self.assertEqual(itinerary.total_price, Decimal('220.00'))
+        self.assertEqual(itinerary.bookings.count(), 2)
+        self.outbound.refresh_from_db()
+        self.inbound.refresh_from_db()
+        self.assertEqual(self.outbound.available_seats, 28)
+        self.assertEqual(self.inbound.available_seats, 28)
+    
+    def test_large_group_is_split(self):
+        names = [f'Passenger {i}' for i in range(23)]
+        itinerary = book_itinerary(self.user, [self.outbound.pk], names)
+        seats = sorted(itinerary.bookings.values_list('number_of_seats', flat=True))
+        self.assertEqual(seats, [3, 10, 10])
+        self.assertTrue(all(b.pk for b in itinerary.booking_list))
+    
+    def test_all_or_nothing(self):
+        small = self._option('IT003', 7, 1)
+        with self.assertRaises(InsufficientSeats):
+            book_itinerary(self.user, [self.outbound.pk, small.pk], ['Ann', 'Bob'])
+        self.outbound.refresh_from_db()
+        self.assertEqual(self.outbound.available_seats, 30)
+        self.assertFalse(Itinerary.objects.exists())
+        self.assertFalse(Booking.objects.exists())
+    
+    def test_rejects_duplicate_legs(self):
+        with self.assertRaises(ItineraryError):
+            book_itinerary(self.user, [self.outbound.pk, self.outbound.pk], ['Ann'])
+    
+    def test_api(self):
+        url = reverse('travel:book_itinerary')
+        body = json.dumps({
+            'travel_options': [self.outbound.pk, self.inbound.pk],
+            'passengers': ['Ann'],
+            'contact_phone': '555',
+        })
+        self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 401)
+        self.client.login(username='roundtrip', password='testpass123')
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['bookings']), 2)
+        
+        body = json.dumps({'travel_options': [self.outbound.pk], 'passengers': ['x'] * 31})
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.user = User.objects.create_user(username='metrics', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            travel_id='MT001',
+            type='bus',
+            source='Denver',
+            destination='Boulder',
+            departure_date=date.today() + timedelta(days=3),
+            departure_time=time(8, 00),
+            arrival_date=date.today() + timedelta(days=3),
+            arrival_time=time(9, 00),
+            price=Decimal('15.00'),
+            available_seats=40,
+            total_seats=40
+        )
+    
+    def test_render_counter_and_histogram(self):
+        counter = self.registry.counter('demo_total', 'Demo counter', ['kind'])
+        counter.inc(kind='a')
+        counter.inc(2, kind='a')
+        histogram = self.registry.histogram('demo_seconds', 'Demo latency', buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        output = self.registry.render()
+        self.assertIn('# TYPE demo_total counter', output)
+        self.assertIn('demo_total{kind="a"} 3', output)
+        self.assertIn('demo_seconds_bucket{le="0.1"} 1', output)
+        self.assertIn('demo_seconds_bucket{le="1"} 2', output)
+        self.assertIn('demo_seconds_bucket{le="+Inf"} 2', output)
+        self.assertIn('demo_seconds_count 2', output)
+    
+    def test_label_mismatch(self):
+        counter = self.registry.counter('demo_total', 'Demo counter', ['kind'])
+        with self.assertRaises(ValueError):
+            counter.inc(type='a')
+    
+    def test_merges_other_processes(self):
+        counter = self.registry.counter('demo_total', 'Demo counter')
+        counter.inc(5)
+        with tempfile.TemporaryDirectory() as directory:
+            other = self.registry.snapshot()
+            other['pid'] = -1
+            with open(f'{directory}/metrics--1.json', 'w') as fh:
+                json.dump(other, fh)
+            counter.inc()
+            self.assertIn('demo_total 11', self.registry.render(directory))
+    
+    def test_endpoint_is_staff_only(self):
+        url = reverse('travel:metrics')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.create_user(username='ops', password='testpass123', is_staff=True)
+        self.client.login(username='ops', password='testpass123')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('travel_request_duration_seconds', response.content.decode())
+    
+    def test_booking_counters(self):
+        before = dict((tuple(k), v) for k, v in metrics.seats_sold.snapshot()).get(('bus',), 0)
+        self.client.login(username='metrics', password='testpass123')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('travel:book_travel', args=[self.travel_option.pk]), {
+                'number_of_seats': 3,
+                'passenger_names': 'Ann\nBob\nCai',
+                'contact_phone': '+1234567890',
+            })
+        self.assertEqual(Booking.objects.count(), 1)
+        after = dict((tuple(k), v) for k, v in metrics.seats_sold.snapshot()).get(('bus',), 0)
+        self.assertEqual(after - before, 3)
+
+
+class SlowQueryLogTest(TestCase):
+    def setUp(self):
+        TravelOption.objects.create(
+            travel_id='SQ001',
+            type='train',
+            source='Boston',
+            destination='Albany',
+            departure_date=date.today() + timedelta(days=4),
+            departure_time=time(9, 00),
+            arrival_date=date.today() + timedelta(days=4),
+            arrival_time=time(13, 00),
+            price=Decimal('45.00'),
+            available_seats=80,
+            total_seats=80
+        )
+    
+    def test_fingerprint_ignores_literals(self):
+        a = slowlog.fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND name = 'x' LIMIT 21")
+        b = slowlog.fingerprint("SELECT *  FROM t WHERE id IN (%s) AND name = 'yy' LIMIT 5")
+        self.assertEqual(a, b)
+        self.assertEqual(a[1], 'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?')
+    
+    def test_redacts_params(self):
+        self.assertEqual(slowlog.redact(['Jane Doe', 3, None]), ['str(8)', 'int', None])
+    
+    @override_settings(TRAVEL_SLOW_QUERY_LOG={'THRESHOLD_MS': 0})
+    def test_records_and_aggregates_by_fingerprint(self):
+        self.client.get(reverse('travel:home'), {'source': 'Boston'})
+        entry = SlowQuery.objects.get(statement__contains='"travel_traveloption"."travel_id"',
+                                      statement__startswith='SELECT')
+        self.assertEqual(entry.origin, 'travel:home')
+        self.assertTrue(entry.location.startswith('travel/'))
+        self.assertTrue(entry.explain)
+        self.assertNotIn('Boston', json.dumps(entry.sample_params))
+        count = entry.count
+        self.client.get(reverse('travel:home'), {'source': 'Bos'})
+        entry.refresh_from_db()
+        self.assertEqual(entry.count, count + 1)
+    
+    @override_settings(TRAVEL_SLOW_QUERY_LOG={'ENABLED': False, 'THRESHOLD_MS': 0})
+    def test_disabled(self):
+        self.client.get(reverse('travel:home'))
+        self.assertFalse(SlowQuery.objects.exists())
+
+
+class ScheduleDatetimeTest(TestCase):
+    def setUp(self):
+        self.day = date.today() + timedelta(days=6)
+        self.slow = self._option('SD001', time(19, 00), time(23, 30), '40.00')
+        self.fast = self._option('SD002', time(8, 00), time(9, 15), '90.00')
+        self.mid = self._option('SD003', time(18, 30), time(21, 00), '60.00')
+    
+    def _option(self, travel_id, departs, arrives, price):
+        return TravelOption.objects.create(
+            travel_id=travel_id,
+            type='bus',
+            source='Austin',
+            destination='Dallas',
+            departure_date=self.day,
+            departure_time=departs,
+            arrival_date=self.day,
+            arrival_time=arrives,
+            price=Decimal(price),
+            available_seats=20,
+            total_seats=20
+        )
+    
+    def _results(self, **params):
+        response = self.client.get(reverse('travel:home'), params)
+        return [option.travel_id for option in response.context['page_obj']]
+    
+    def test_save_sets_derived_columns(self):
+        self.assertEqual(self.slow.duration, timedelta(hours=4, minutes=30))
+        self.assertEqual(self.slow.duration_display, '4h 30m')
+        self.slow.arrival_time = time(22, 00)
+        self.slow.save(update_fields=['arrival_time'])
+        self.slow.refresh_from_db()
+        self.assertEqual(self.slow.duration, timedelta(hours=3))
+    
+    def test_queryset_updates_keep_columns_in_sync(self):
+        TravelOption.objects.filter(pk=self.fast.pk).update(arrival_date=self.day + timedelta(days=1))
+        self.fast.refresh_from_db()
+        self.assertEqual(self.fast.duration, timedelta(hours=25, minutes=15))
+        
+        self.mid.departure_time = time(20, 00)
+        TravelOption.objects.bulk_update([self.mid], ['departure_time'])
+        self.mid.refresh_from_db()
+        self.assertEqual(self.mid.duration, timedelta(hours=1))
+        self.assertEqual(self.mid.departure_at.time(), time(20, 00))
+    
+    def test_sync_schedule_backfills(self):
+        TravelOption.objects.all().update(departure_at=None, arrival_at=None, duration=None)
+        self.assertEqual(TravelOption.objects.all().sync_schedule(batch_size=2), 3)
+        self.assertFalse(TravelOption.objects.filter(duration__isnull=True).exists())
+    
+    def test_home_sorting(self):
+        self.assertEqual(self._results(), ['SD002', 'SD003', 'SD001'])
+        self.assertEqual(self._results(sort='price'), ['SD001', 'SD003', 'SD002'])
+        self.assertEqual(self._results(sort='duration'), ['SD002', 'SD003', 'SD001'])
+    
+    def test_home_time_window(self):
+        self.assertEqual(self._results(departure_date=self.day, depart_after='18:00'), ['SD003', 'SD001'])
+        self.assertEqual(self._results(depart_after='18:00', depart_before='18:45'), ['SD003'])
+        self.assertEqual(self._results(max_duration=2), ['SD002'])
+
+
+class SeatMapTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='seats', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            travel_id='SM001',
+            type='flight',
+            source='Seattle',
+            destination='Portland',
+            departure_date=date.today() + timedelta(days=8),
+            departure_time=time(6, 00),
+            arrival_date=date.today() + timedelta(days=8),
+            arrival_time=time(7, 00),
+            price=Decimal('80.00'),
+            available_seats=12,
+            total_seats=12
+        )
+    
+    def _book(self, seats, selection=''):
+        self.client.login(username='seats', password='testpass123')
+        return self.client.post(reverse('travel:book_travel', args=[self.travel_option.pk]), {
+            'number_of_seats': seats,
+            'passenger_names': '\n'.join(f'P{i}' for i in range(seats)),
+            'contact_phone': '+1234567890',
+            'seat_selection': selection,
+        })
+    
+    def test_find_keeps_groups_in_a_block(self):
+        plan = SeatPlan('ABC-DEF', 12)
+        taken = plan.mask(['1A', '1D'])
+        self.assertEqual(plan.labels(plan.find(taken, 2)), ['1B', '1C'])
+        self.assertEqual(plan.labels(plan.find(taken, 3)), ['2A', '2B', '2C'])
+        # No block of four exists: same row across the aisle
+        self.assertEqual(plan.labels(plan.find(taken, 4)), ['2A', '2B', '2C', '2D'])
+        full = plan.mask(['1A', '1C', '1E', '2A', '2C', '2E'])
+        self.assertEqual(plan.labels(plan.find(full, 3)), ['1B', '1D', '1F'])
+        self.assertIsNone(plan.find(plan.all_seats, 1))
+    
+    def test_booking_claims_adjacent_seats(self):
+        self._book(3)
+        booking = Booking.objects.get()
+        self.assertEqual(booking.seat_numbers, ['1A', '1B', '1C'])
+        seat_map = SeatMap.objects.get(travel_option=self.travel_option)
+        self.assertEqual(seat_map.free_count, 9)
+    
+    def test_selected_seats(self):
+        self._book(2, '2f, 2E')
+        self.assertEqual(Booking.objects.get().seat_numbers, ['2E', '2F'])
+        response = self._book(1, '2E')
+        self.assertContains(response, 'Seat 2E is not available')
+        self.assertEqual(Booking.objects.count(), 1)
+        response = self._book(2, '1A')
+        self.assertContains(response, 'Please pick exactly 2 seats or none.')
+    
+    def test_cancel_releases_seats(self):
+        self._book(2, '1A, 1B')
+        Booking.objects.get().cancel_booking()
+        seat_map = SeatMap.objects.get(travel_option=self.travel_option)
+        self.assertEqual(seat_map.free_count, 12)
+        self._book(1, '1A')
+        self.assertEqual(Booking.objects.filter(status='confirmed').get().seat_numbers, ['1A'])
+    
+    def test_existing_bookings_are_seated_first(self):
+        legacy = Booking.objects.create(
+            user=self.user, travel_option=self.travel_option, number_of_seats=2,
+            total_price=Decimal('160.00'),
+        )
+        TravelOption.objects.filter(pk=self.travel_option.pk).update(available_seats=10)
+        self._book(1)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.seat_numbers, ['1A', '1B'])
+        self.assertEqual(Booking.objects.exclude(pk=legacy.pk).get().seat_numbers, ['1C'])
+
+class ReportsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reports', password='testpass123')
+        self.day = date.today() + timedelta(days=5)
+        self.options = [
+            TravelOption.objects.create(
+                travel_id=f'RP00{i}',
+                type='bus',
+                source='Austin',
+                destination='Dallas',
+                departure_date=self.day + timedelta(days=i),
+                departure_time=time(9, 00),
+                arrival_date=self.day + timedelta(days=i),
+                arrival_time=time(12, 00),
+                price=Decimal('40.00'),
+                available_seats=20,
+                total_seats=20
+            )
+            for i in range(2)
+        ]
+        cache.clear()
+    
+    def _book(self, option, seats):
+        option.available_seats -= seats
+        option.save()
+        return Booking.objects.create(
+            user=self.user,
+            travel_option=option,
+            number_of_seats=seats,
+            total_price=option.price * seats,
+            passenger_details={'names': ['P'] * seats}
+        )
+    
+    def _age_everything(self):
+        TravelOption.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        Booking.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        ReportWatermark.objects.update(value=timezone.now() - timedelta(hours=1))
+    
+    def test_refresh_computes_occupancy_and_revenue(self):
+        self._book(self.options[0], 5)
+        self.assertEqual(reports.refresh(), 2)
+        stats = DailyRouteStats.objects.get(day=self.day)
+        self.assertEqual(stats.seats_sold, 5)
+        self.assertEqual(stats.bookings, 1)
+        self.assertEqual(stats.revenue, Decimal('200.00'))
+        self.assertEqual(stats.occupancy, 25.0)
+        self.assertEqual(DailyRouteStats.objects.get(day=self.day + timedelta(days=1)).seats_sold, 0)
+    
+    def test_incremental_refresh_only_recomputes_changed_days(self):
+        reports.refresh()
+        self._age_everything()
+        self.assertEqual(reports.refresh(), 0)
+        self._book(self.options[1], 2)
+        self.assertEqual(reports.refresh(), 1)
+        self.assertEqual(DailyRouteStats.objects.get(day=self.day + timedelta(days=1)).seats_sold, 2)
+    
+    def test_cancellation_updates_revenue(self):
+        booking = self._book(self.options[0], 4)
+        reports.refresh()
+        self._age_everything()
+        booking.cancel_booking()
+        reports.refresh()
+        stats = DailyRouteStats.objects.get(day=self.day)
+        self.assertEqual((stats.seats_sold, stats.bookings, stats.revenue), (0, 0, Decimal('0.00')))
+    
+    def test_moved_and_deleted_departures_refresh_their_old_day(self):
+        reports.refresh()
+        self._age_everything()
+        moved = self.options[0]
+        moved.departure_date = moved.arrival_date = self.day + timedelta(days=1)
+        moved.save()
+        self.assertEqual(reports.refresh(), 2)
+        self.assertFalse(DailyRouteStats.objects.filter(day=self.day).exists())
+        self.assertEqual(DailyRouteStats.objects.get(day=self.day + timedelta(days=1)).departures, 2)
+        
+        self._age_everything()
+        TravelOption.objects.filter(pk=self.options[1].pk).delete()
+        self.assertEqual(reports.refresh(), 1)
+        self.assertEqual(DailyRouteStats.objects.get(day=self.day + timedelta(days=1)).departures, 1)
+        self.assertFalse(StaleReportDay.objects.exists())
+    
+    def test_seats_sold_clamped_and_summed_from_shards(self):
+        TravelOption.objects.filter(pk=self.options[0].pk).update(available_seats=25)
+        inventory.set_seat_shards(self.options[1].pk, 2)
+        with transaction.atomic():
+            locked = inventory.lock_travel_options([self.options[1].pk])[self.options[1].pk]
+            inventory.reserve_seats(locked, 3)
+        reports.refresh()
+        self.assertEqual(DailyRouteStats.objects.get(day=self.day).seats_sold, 0)
+        self.assertEqual(DailyRouteStats.objects.get(day=self.day + timedelta(days=1)).seats_sold, 3)
+    
+    def test_report_is_cached_until_next_refresh(self):
+        self._book(self.options[0], 5)
+        reports.refresh()
+        rows = reports.report_rows(self.day, self.day + timedelta(days=1))
+        with self.assertNumQueries(1):
+            # Only the watermark lookup
+            self.assertEqual(reports.report_rows(self.day, self.day + timedelta(days=1)), rows)
+        self.assertEqual(reports.totals(rows)['occupancy'], 12.5)
+    
+    def test_admin_report_and_csv(self):
+        self._book(self.options[0], 5)
+        reports.refresh()
+        User.objects.create_superuser(username='ops', password='testpass123')
+        self.client.login(username='ops', password='testpass123')
+        url = reverse('admin:travel_dailyroutestats_report')
+        params = {'start': self.day.isoformat(), 'end': self.day.isoformat()}
+        response = self.client.get(url, params)
+        self.assertContains(response, 'Austin → Dallas')
+        self.assertContains(response, '$200.00')
+        response = self.client.get(url, {**params, 'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0].split(','), reports.COLUMNS)
+        self.assertEqual(lines[1], f'{self.day},Austin,Dallas,bus,1,20,5,25.0,1,200.00')
+
+class IdempotencyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='retry', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            travel_id='ID001',
+            type='flight',
+            source='Miami',
+            destination='Atlanta',
+            departure_date=date.today() + timedelta(days=6),
+            departure_time=time(8, 00),
+            arrival_date=date.today() + timedelta(days=6),
+            arrival_time=time(10, 00),
+            price=Decimal('120.00'),
+            available_seats=10,
+            total_seats=10
+        )
+        self.client.login(username='retry', password='testpass123')
+        cache.clear()
+    
+    def _book(self, key):
+        return self.client.post(reverse('travel:book_travel', args=[self.travel_option.pk]), {
+            'number_of_seats': 2,
+            'passenger_names': 'Ann\nBob',
+            'contact_phone': '+1234567890',
+            'idempotency_key': key,
+        })
+    
+    def test_form_embeds_a_key(self):
+        response = self.client.get(reverse('travel:book_travel', args=[self.travel_option.pk]))
+        self.assertContains(response, 'name="idempotency_key"')
+    
+    def test_duplicate_booking_is_replayed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._book('double-click')
+        second = self._book('double-click')
+        # Served from the database when the cache has forgotten the key
+        cache.clear()
+        third = self._book('double-click')
+        booking = Booking.objects.get()
+        for response in (first, second, third):
+            self.assertRedirects(response, reverse('travel:booking_detail', args=[booking.pk]))
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 8)
+        self._book('another-click')
+        self.assertEqual(Booking.objects.count(), 2)
+    
+    def test_claim_replays_a_completed_key(self):
+        with transaction.atomic():
+            record = idempotency.claim(self.user, 'k1', 'book:1')
+            idempotency.complete(record, {'booking': 1, 'booking_id': 'BK1'})
+        with self.assertRaises(idempotency.Replay) as replay:
+            idempotency.claim(self.user, 'k1', 'book:1')
+        self.assertEqual(replay.exception.result['booking_id'], 'BK1')
+        with self.assertRaises(idempotency.KeyReused):
+            idempotency.claim(self.user, 'k1', 'cancel:1')
+    
+    def test_duplicate_cancellation_is_replayed(self):
+        self._book('book-once')
+        booking = Booking.objects.get()
+        url = reverse('travel:cancel_booking', args=[booking.pk])
+        self.client.post(url, {'idempotency_key': 'cancel-once'})
+        response = self.client.post(url, {'idempotency_key': 'cancel-once'}, follow=True)
+        self.assertContains(response, 'Booking cancelled successfully.')
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 10)
+    
+    def test_itinerary_api_header(self):
+        url = reverse('travel:book_itinerary')
+        body = json.dumps({'travel_options': [self.travel_option.pk], 'passengers': ['Ann']})
+        first = self.client.post(url, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='api-1')
+        second = self.client.post(url, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='api-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(Booking.objects.count(), 1)
+        response = self._book('api-1')
+        self.assertEqual(response.status_code, 400)
+        bad = self.client.post(url, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='not a key!')
+        self.assertEqual(bad.status_code, 422)
+    
+    def test_expired_keys_are_reused_and_purged(self):
+        self._book('old-key')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        cache.clear()
+        self._book('old-key')
+        self.assertEqual(Booking.objects.count(), 2)
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(idempotency.purge_expired(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+class SeatReconciliationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='drift', password='testpass123')
+        self.options = [
+            TravelOption.objects.create(
+                travel_id=f'DR00{i}',
+                type='train',
+                source='Denver',
+                destination='Boulder',
+                departure_date=date.today() + timedelta(days=days),
+                departure_time=time(10, 00),
+                arrival_date=date.today() + timedelta(days=days),
+                arrival_time=time(11, 00),
+                price=Decimal('15.00'),
+                available_seats=20,
+                total_seats=20
+            )
+            for i, days in enumerate([-1, 3, 4, 5])
+        ]
+        for option, seats in zip(self.options, [4, 4, 3, 0]):
+            if seats:
+                Booking.objects.create(
+                    user=self.user, travel_option=option, number_of_seats=seats,
+                    total_price=option.price * seats, passenger_details={}
+                )
+        Booking.objects.create(
+            user=self.user, travel_option=self.options[2], number_of_seats=2,
+            total_price=Decimal('30.00'), passenger_details={}, status='cancelled'
+        )
+        # As if booked correctly: only options[2] is left out of sync
+        TravelOption.objects.filter(pk=self.options[1].pk).update(available_seats=16)
+    
+    def test_drift_is_reported_and_repaired(self):
+        report = reconcile_inventory(batch_size=2)
+        by_id = {row['travel_id']: row for row in report}
+        # Departed options are left alone; DR003 had no bookings
+        self.assertEqual(set(by_id), {'DR002'})
+        self.assertEqual((by_id['DR002']['recorded'], by_id['DR002']['expected'], by_id['DR002']['drift']), (20, 17, 3))
+        self.assertEqual(
+            list(TravelOption.objects.order_by('travel_id').values_list('available_seats', flat=True)),
+            [20, 16, 17, 20],
+        )
+        self.assertEqual(reconcile_inventory(), [])
+    
+    def test_dry_run_and_oversold(self):
+        TravelOption.objects.filter(pk=self.options[3].pk).update(total_seats=0)
+        Booking.objects.create(
+            user=self.user, travel_option=self.options[3], number_of_seats=1,
+            total_price=Decimal('15.00'), passenger_details={}
+        )
+        report = reconcile_inventory(dry_run=True)
+        self.assertEqual(len(report), 2)
+        self.assertEqual(report[-1]['expected'], -1)
+        self.assertEqual(TravelOption.objects.get(pk=self.options[2].pk).available_seats, 20)
+        reconcile_inventory()
+        self.assertEqual(TravelOption.objects.get(pk=self.options[3].pk).available_seats, 0)
+
+class LiveSeatsTest(TestCase):
+    def setUp(self):
+        self.travel_option = TravelOption.objects.create(
+            travel_id='LV001',
+            type='train',
+            source='Boston',
+            destination='New York',
+            departure_date=date.today() + timedelta(days=2),
+            departure_time=time(9, 00),
+            arrival_date=date.today() + timedelta(days=2),
+            arrival_time=time(13, 00),
+            price=Decimal('60.00'),
+            available_seats=30,
+            total_seats=30
+        )
+    
+    def test_hub_fans_out_latest_state(self):
+        async def run():
+            async def no_changes(ids, since):
+                return [], None
+            hub = live.Hub(fetch=no_changes, poll_interval=0.01)
+            watchers = [hub.subscribe([1, 2]) for _ in range(3)]
+            other = hub.subscribe([2])
+            self.assertEqual(hub.publish({'id': 1, 'available_seats': 5, 'price': '10.00'}), 3)
+            hub.publish({'id': 1, 'available_seats': 4, 'price': '10.00'})
+            # Unchanged states are not sent again
+            self.assertEqual(hub.publish({'id': 1, 'available_seats': 4, 'price': '10.00'}), 0)
+            for subscriber in watchers:
+                self.assertEqual(await subscriber.changes(timeout=1), [{'id': 1, 'available_seats': 4, 'price': '10.00'}])
+            self.assertEqual(await other.changes(timeout=0.01), [])
+            for subscriber in watchers + [other]:
+                hub.unsubscribe(subscriber)
+            self.assertEqual((hub.subscribers, hub.states, hub.count), ({}, {}, 0))
+        asyncio.run(run())
+    
+    def test_watcher_polls_once_for_all_subscribers(self):
+        calls = []
+        
+        async def fetch(ids, since):
+            calls.append(sorted(ids))
+            return [{'pk': 7, 'available_seats': 3, 'price': Decimal('9.50'), 'updated_at': timezone.now()}], None
+        
+        async def run():
+            hub = live.Hub(fetch=fetch, poll_interval=0.01)
+            subscribers = [hub.subscribe([7, 8]) for _ in range(100)]
+            changes = await subscribers[0].changes(timeout=1)
+            self.assertEqual(changes, [{'id': 7, 'available_seats': 3, 'price': '9.50'}])
+            self.assertTrue(all(subscriber.pending for subscriber in subscribers[1:]))
+            for subscriber in subscribers:
+                hub.unsubscribe(subscriber)
+        asyncio.run(run())
+        self.assertEqual(calls[0], [7, 8])
+    
+    def _book_sharded(self, seats):
+        with transaction.atomic():
+            locked = inventory.lock_travel_options([self.travel_option.pk])[self.travel_option.pk]
+            inventory.reserve_seats(locked, seats)
+    
+    async def test_watcher_sees_bookings_of_sharded_departures(self):
+        await sync_to_async(inventory.set_seat_shards)(self.travel_option.pk, 2)
+        hub = live.Hub(poll_interval=0.01)
+        subscriber = hub.subscribe([self.travel_option.pk])
+        self.assertEqual(await subscriber.changes(timeout=5),
+                         [{'id': self.travel_option.pk, 'available_seats': 30, 'price': '60.00'}])
+        
+        await sync_to_async(self._book_sharded)(2)
+        # Shards were taken from without touching the departure's row
+        option = await TravelOption.objects.aget(pk=self.travel_option.pk)
+        self.assertEqual(option.available_seats, 30)
+        self.assertEqual(await subscriber.changes(timeout=5),
+                         [{'id': self.travel_option.pk, 'available_seats': 28, 'price': '60.00'}])
+        self.assertEqual((await live.fetch_states([self.travel_option.pk]))[0]['available_seats'], 28)
+        hub.unsubscribe(subscriber)
+    
+    def test_snapshot_without_asgi(self):
+        response = self.client.get(reverse('travel:seat_stream'), {'ids': self.travel_option.pk})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertContains(response, 'retry: 10000')
+        self.assertContains(response, '"available_seats": 30')
+        self.assertEqual(self.client.get(reverse('travel:seat_stream'), {'ids': 'x'}).status_code, 400)
+    
+    @override_settings(TRAVEL_LIVE_SEATS={'POLL_INTERVAL': 0.05})
+    async def test_stream_pushes_changes(self):
+        response = await self.async_client.get(reverse('travel:seat_stream'), {'ids': self.travel_option.pk})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content.__aiter__()
+        self.assertIn(b'retry:', await stream.__anext__())
+        self.assertIn(b'"available_seats": 30', await stream.__anext__())
+        self.assertEqual(live.hub.count, 1)
+        
+        await sync_to_async(TravelOption.objects.filter(pk=self.travel_option.pk).update)(
+            available_seats=28, updated_at=timezone.now(),
+        )
+        event = await asyncio.wait_for(stream.__anext__(), 5)
+        self.assertIn(b'"available_seats": 28', event)
+        # The server cancels the response task when the client disconnects
+        waiting = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(live.hub.count, 0)
+
+class CurrencyTest(TestCase):
+    def setUp(self):
+        self.travel_option = TravelOption.objects.create(
+            travel_id='CX001',
+            type='flight',
+            source='London',
+            destination='Paris',
+            departure_date=date.today() + timedelta(days=10),
+            departure_time=time(8, 00),
+            arrival_date=date.today() + timedelta(days=10),
+            arrival_time=time(10, 00),
+            price=Decimal('100.05'),
+            available_seats=50,
+            total_seats=50
+        )
+        cache.clear()
+    
+    def _load(self, content, suffix='.csv'):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as f:
+            f.write(content)
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('load_exchange_rates', f.name, stdout=StringIO())
+        finally:
+            os.unlink(f.name)
+    
+    def test_conversion_rounds_half_up_to_minor_unit(self):
+        self._load('currency,rate,decimals,symbol\nEUR,0.9,2,€\nJPY,150.5,0,¥\nCHF,0.85\n')
+        self.assertEqual(currency.get_converter('EUR').format(Decimal('100.05')), '€90.05')
+        self.assertEqual(currency.get_converter('EUR').convert(Decimal('0.05')), Decimal('0.05'))
+        self.assertEqual(currency.get_converter('JPY').format(Decimal('100.05')), '¥15058')
+        self.assertEqual(currency.get_converter('CHF').format(Decimal('10.00')), '8.50 CHF')
+        # Unknown currencies fall back to the base currency
+        self.assertEqual(currency.get_converter('XYZ').format(Decimal('100.05')), '$100.05')
+    
+    def test_converters_are_cached_per_rate_version(self):
+        self._load('EUR,0.9\n')
+        converter = currency.get_converter('EUR')
+        self.assertIs(currency.get_converter('EUR'), converter)
+        self._load('{"base": "USD", "rates": {"EUR": "0.8"}}', suffix='.json')
+        updated = currency.get_converter('EUR')
+        self.assertEqual(updated.version, converter.version + 1)
+        self.assertEqual(updated.format(Decimal('10')), '8.00 EUR')
+        self.assertEqual(list(ExchangeRate.objects.values_list('currency', flat=True)), ['EUR'])
+    
+    def test_home_shows_session_currency(self):
+        self._load('EUR,0.9,2,€\n')
+        response = self.client.get(reverse('travel:home'))
+        self.assertContains(response, '$100.05')
+        tag = response['ETag']
+        response = self.client.post(reverse('travel:set_currency'), {'currency': 'EUR', 'next': '/'})
+        self.assertRedirects(response, '/')
+        response = self.client.get(reverse('travel:home'))
+        self.assertContains(response, '€90.05')
+        self.assertNotEqual(response['ETag'], tag)
+        response = self.client.get(reverse('travel:travel_detail', args=[self.travel_option.pk]))
+        self.assertContains(response, '€90.05')
+        self.assertContains(response, 'Charged as $100.05')
+    
+    def test_booking_and_waitlist_pages_show_session_currency(self):
+        self._load('EUR,0.9,2,€\n')
+        User.objects.create_user(username='euro', password='testpass123')
+        self.client.login(username='euro', password='testpass123')
+        self.client.post(reverse('travel:set_currency'), {'currency': 'EUR', 'next': '/'})
+        response = self.client.get(reverse('travel:book_travel', args=[self.travel_option.pk]))
+        self.assertContains(response, '€90.05')
+        self.assertContains(response, 'data-rate="0.9')
+        self.assertNotContains(response, '<span>$100.05</span>')
+        TravelOption.objects.filter(pk=self.travel_option.pk).update(available_seats=0)
+        response = self.client.get(reverse('travel:join_waitlist', args=[self.travel_option.pk]))
+        self.assertContains(response, '€90.05')
+    
+    def test_rates_are_read_from_cache(self):
+        self._load('EUR,0.9\n')
+        currency.rate_table()
+        with self.assertNumQueries(0):
+            currency.rate_table()
+
+class TrendingRoutesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='trendy', password='testpass123')
+        self.routes = [
+            TravelOption.objects.create(
+                travel_id=f'TR00{i}',
+                type='bus',
+                source='Lisbon',
+                destination=destination,
+                departure_date=date.today() + timedelta(days=4),
+                departure_time=time(9, 00),
+                arrival_date=date.today() + timedelta(days=4),
+                arrival_time=time(12, 00),
+                price=Decimal('25.00'),
+                available_seats=40,
+                total_seats=40
+            )
+            for i, destination in enumerate(['Porto', 'Faro'])
+        ]
+        cache.clear()
+        trending.clear_cache()
+        self.client.login(username='trendy', password='testpass123')
+    
+    def _book(self, option, seats):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('travel:book_travel', args=[option.pk]), {
+                'number_of_seats': seats,
+                'passenger_names': '\n'.join(f'P{i}' for i in range(seats)),
+                'contact_phone': '+1234567890',
+            })
+        return Booking.objects.filter(travel_option=option).latest('pk')
+    
+    def _scores(self):
+        return dict(RoutePopularity.objects.values_list('destination', 'score'))
+    
+    def test_bookings_and_cancellations_update_scores(self):
+        porto = self._book(self.routes[0], 3)
+        self._book(self.routes[1], 1)
+        scores = self._scores()
+        self.assertAlmostEqual(scores['Porto'], 3, places=2)
+        self.assertAlmostEqual(scores['Faro'], 1, places=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            porto.cancel_booking()
+        self.assertAlmostEqual(self._scores()['Porto'], 0, places=6)
+    
+    def test_compaction_decays_and_drops_routes(self):
+        week_ago = timezone.now() - timedelta(days=7)
+        ReportWatermark.objects.create(name=trending.EPOCH_NAME, value=week_ago)
+        RoutePopularity.objects.create(source='Lisbon', destination='Porto', score=4)
+        RoutePopularity.objects.create(source='Lisbon', destination='Faro', score=0.08)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(trending.compact(), 1)
+        self.assertAlmostEqual(self._scores()['Porto'], 2, places=3)
+        self.assertGreater(ReportWatermark.objects.get(name=trending.EPOCH_NAME).value, week_ago)
+    
+    def test_increments_ignore_an_epoch_cached_before_compaction(self):
+        self._book(self.routes[0], 1)
+        # Another process compacts a week later; this one's cache still has the old epoch
+        ReportWatermark.objects.filter(name=trending.EPOCH_NAME).update(value=timezone.now())
+        cache.set(trending.EPOCH_CACHE_KEY, timezone.now() - timedelta(days=7))
+        self._book(self.routes[1], 1)
+        self.assertAlmostEqual(self._scores()['Faro'], 1, places=2)
+    
+    def test_rebuild_from_bookings(self):
+        self._book(self.routes[0], 2)
+        RoutePopularity.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(trending.rebuild(), 1)
+        self.assertGreater(self._scores()['Porto'], 1)
+    
+    def test_home_strip_needs_no_queries(self):
+        self._book(self.routes[1], 2)
+        self._book(self.routes[0], 1)
+        self.assertEqual([route['destination'] for route in trending.top_routes()], ['Faro', 'Porto'])
+        with self.assertNumQueries(0):
+            trending.top_routes()
+        response = self.client.get(reverse('travel:home'))
+        self.assertContains(response, 'Popular routes')
+        self.assertContains(response, 'destination=Faro')
+
+
+
+class BookingIndexTest(TestCase):
+    """The booking list and admin queries are served by an index, in order"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user('indexed', password='pass12345')
+        self.admin = User.objects.create_superuser('ops', 'ops@example.com', 'pass12345')
+        option = TravelOption.objects.create(
+            travel_id='IDX1', type='bus', source='Lisbon', destination='Porto',
+            departure_date=date.today() + timedelta(days=5), departure_time=time(9, 0),
+            arrival_date=date.today() + timedelta(days=5), arrival_time=time(12, 0),
+            price=Decimal('20.00'), total_seats=40, available_seats=40,
+        )
+        for user in (self.user, self.admin):
+            Booking.objects.create(user=user, travel_option=option, number_of_seats=1)
+    
+    @skipUnless(connection.vendor in PLAN_VENDORS, 'EXPLAIN output is only parsed for MySQL and SQLite')
+    def test_booking_list_queries(self):
+        bookings = Booking.objects.filter(user=self.user).select_related('travel_option')
+        assert_uses_index(bookings[:10], 'booking_user_date_idx')
+        assert_uses_index(bookings.filter(status='cancelled')[:10], 'booking_user_status_idx')
+        self.assertIn('booking_user_date_idx', query_plan(bookings.order_by()).indexes)
+    
+    @skipUnless(connection.vendor in PLAN_VENDORS, 'EXPLAIN output is only parsed for MySQL and SQLite')
+    def test_admin_changelist_queries(self):
+        self.client.login(username='ops', password='pass12345')
+        url = reverse('admin:travel_booking_changelist')
+        today = timezone.localdate()
+        for params, index in (
+            ({}, 'booking_date_idx'),
+            ({'status__exact': 'confirmed'}, 'booking_status_date_idx'),
+            ({'booking_date__year': today.year, 'booking_date__month': today.month}, 'booking_date_idx'),
+            ({'travel_option__type__exact': 'bus'}, 'booking_date_idx'),
+        ):
+            with self.subTest(params=params):
+                changelist = self.client.get(url, params).context['cl']
+                assert_uses_index(changelist.queryset[:100], index)
+    
+    @skipUnless(connection.vendor in PLAN_VENDORS, 'EXPLAIN output is only parsed for MySQL and SQLite')
+    def test_plan_reports_sorts_and_scans(self):
+        plan = query_plan(Booking.objects.order_by('total_price'))
+        self.assertTrue(plan.sorts)
+        self.assertIn('travel_booking', plan.full_scans)
+        with self.assertRaises(AssertionError):
+            assert_uses_index(Booking.objects.order_by('total_price'), 'booking_date_idx')
+    
+    def test_unknown_backend_gives_unparsed_plan(self):
+        with mock.patch.object(connection, 'vendor', 'oracle'):
+            plan = query_plan(Booking.objects.all())
+            self.assertFalse(plan.parsed)
+            self.assertEqual(plan.indexes, set())
+            with self.assertRaisesMessage(AssertionError, 'No plan parser for oracle'):
+                assert_uses_index(Booking.objects.all(), 'booking_date_idx')
+    
+    def test_add_index_online_skips_existing_index(self):
+        operation = AddIndexOnline('booking', models.Index(fields=['-booking_date', '-id'], name='booking_date_idx'))
+        self.assertTrue(operation.describe().endswith('(online)'))
+        state = MigrationLoader(connection).project_state()
+        # An editor that cannot run DDL: an existing index must not get that far
+        editor = SimpleNamespace(connection=connection)
+        self.assertTrue(index_exists(editor, Booking, 'booking_date_idx'))
+        operation.database_forwards('travel', editor, state, state)
+
+
+class SeatShardTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sharded', password='testpass123')
+        self.option = TravelOption.objects.create(
+            travel_id='SH001', type='train', source='Madrid', destination='Seville',
+            departure_date=date.today() + timedelta(days=3), departure_time=time(7, 0),
+            arrival_date=date.today() + timedelta(days=3), arrival_time=time(9, 30),
+            price=Decimal('40.00'), available_seats=10, total_seats=10,
+        )
+    
+    def _shards(self):
+        return list(SeatShard.objects.filter(travel_option=self.option).values_list('available_seats', flat=True))
+    
+    def _reserve(self, seats):
+        with transaction.atomic():
+            locked = inventory.lock_travel_options([self.option.pk])[self.option.pk]
+            inventory.reserve_seats(locked, seats)
+        return locked
+    
+    def test_switching_splits_and_merges_seats(self):
+        option = inventory.set_seat_shards(self.option.pk, 4)
+        self.assertEqual(option.seat_shards, 4)
+        self.assertEqual(self._shards(), [3, 3, 2, 2])
+        self._reserve(3)
+        option = inventory.set_seat_shards(self.option.pk, 0)
+        self.assertEqual((option.seat_shards, option.available_seats), (0, 7))
+        self.assertEqual(self._shards(), [])
+        with self.assertRaises(ValueError):
+            inventory.set_seat_shards(self.option.pk, inventory.MAX_SEAT_SHARDS + 1)
+    
+    def test_bookings_take_from_shards_without_writing_the_row(self):
+        inventory.set_seat_shards(self.option.pk, 4)
+        updated_at = TravelOption.objects.get(pk=self.option.pk).updated_at
+        self.assertEqual(self._reserve(3).available_seats, 7)
+        # More seats than any one shard holds: spread over several
+        self._reserve(5)
+        self.assertEqual(sum(self._shards()), 2)
+        with self.assertRaises(InsufficientSeats):
+            self._reserve(3)
+        option = TravelOption.objects.get(pk=self.option.pk)
+        self.assertEqual((option.available_seats, option.updated_at), (10, updated_at))
+        self.assertEqual(inventory.available_seats(option), 2)
+    
+    def test_booking_cancel_and_sync(self):
+        inventory.set_seat_shards(self.option.pk, 2)
+        self.client.login(username='sharded', password='testpass123')
+        self.client.post(reverse('travel:book_travel', kwargs={'pk': self.option.pk}), {
+            'number_of_seats': 2, 'passenger_names': 'Ana\nLuis', 'contact_phone': '+34123456789',
+        })
+        booking = Booking.objects.get(travel_option=self.option)
+        self.assertEqual(booking.seat_numbers, [])
+        self.assertEqual(sum(self._shards()), 8)
+        self.assertEqual(inventory.sync_shard_totals(), 1)
+        self.assertEqual(TravelOption.objects.get(pk=self.option.pk).available_seats, 8)
+        self.assertEqual(reconcile_inventory(), [])
+        
+        booking.cancel_booking()
+        self.assertEqual(sum(self._shards()), 10)
+        self.assertEqual(TravelOption.objects.get(pk=self.option.pk).available_seats, 8)
+        self.assertEqual(inventory.sync_shard_totals(), 1)
+        self.assertEqual(inventory.sync_shard_totals(), 0)
+    
+    def test_sharded_departures_offer_no_seat_selection(self):
+        inventory.set_seat_shards(self.option.pk, 2)
+        option = TravelOption.objects.get(pk=self.option.pk)
+        with self.assertRaises(inventory.SeatUnavailable):
+            inventory.claim_seats(option, [Booking(number_of_seats=1)], ['1A'])
+        self.client.login(username='sharded', password='testpass123')
+        response = self.client.get(reverse('travel:book_travel', kwargs={'pk': self.option.pk}))
+        self.assertIsNone(response.context['seat_rows'])
+
+
+class BatchLookupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='mobile', password='testpass123')
+        self.other = User.objects.create_user(username='someone', password='testpass123')
+        self.options = [
+            TravelOption.objects.create(
+                travel_id=f'BL00{i}', type='flight', source='Oslo', destination='Bergen',
+                departure_date=date.today() + timedelta(days=i + 1), departure_time=time(8, 0),
+                arrival_date=date.today() + timedelta(days=i + 1), arrival_time=time(9, 0),
+                price=Decimal('80.00'), available_seats=50, total_seats=50,
+            )
+            for i in range(2)
+        ]
+        self.mine = Booking.objects.create(user=self.user, travel_option=self.options[0], number_of_seats=2,
+                                           total_price=Decimal('160.00'))
+        self.theirs = Booking.objects.create(user=self.other, travel_option=self.options[1], number_of_seats=1,
+                                             total_price=Decimal('80.00'))
+        now = timezone.now()
+        self.archived_option = ArchivedTravelOption.objects.create(
+            id=9001, travel_id='BLOLD', type='flight', source='Oslo', destination='Tromso',
+            departure_date=date.today() - timedelta(days=200), departure_time=time(8, 0),
+            arrival_date=date.today() - timedelta(days=200), arrival_time=time(10, 0),
+            price=Decimal('120.00'), available_seats=10, total_seats=60, created_at=now, updated_at=now,
+        )
+        self.archived = ArchivedBooking.objects.create(
+            id=9001, booking_id='BKARCHIVE', user=self.user, travel_option=self.archived_option,
+            number_of_seats=1, total_price=Decimal('120.00'), booking_date=now, status='confirmed',
+            created_at=now, updated_at=now,
+        )
+        self.url = reverse('travel:batch_lookup')
+    
+    def test_travel_options_in_order_with_not_found_markers(self):
+        ids = [self.options[1].pk, 424242, self.archived_option.pk, self.options[0].pk]
+        converter = currency.get_converter()
+        with self.assertNumQueries(2):
+            result = lookup.lookup_many(self.user, ids, [], converter)
+        items = result['travel_options']
+        self.assertEqual([item['id'] for item in items], ids)
+        self.assertEqual(items[1], {'id': 424242, 'error': lookup.NOT_FOUND})
+        self.assertEqual(items[0]['travel_id'], 'BL001')
+        self.assertTrue(items[2]['archived'])
+        self.assertIsNone(items[2]['url'])
+        with self.assertNumQueries(1):
+            lookup.lookup_many(self.user, ids[:1] + ids[3:], [], converter)
+    
+    def test_bookings_follow_booking_detail_ownership(self):
+        self.client.login(username='mobile', password='testpass123')
+        booking_ids = [self.archived.booking_id, self.theirs.booking_id, self.mine.booking_id, 'BKMISSING']
+        response = self.client.get(self.url, {
+            'bookings': ','.join(booking_ids), 'travel_options': str(self.options[1].pk),
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        bookings = data['bookings']
+        self.assertEqual([item['booking_id'] for item in bookings], booking_ids)
+        self.assertTrue(bookings[0]['archived'])
+        self.assertEqual(bookings[1], {'booking_id': self.theirs.booking_id, 'error': lookup.NOT_FOUND})
+        self.assertEqual(bookings[2]['travel_option']['id'], self.options[0].pk)
+        self.assertTrue(bookings[2]['can_be_cancelled'])
+        self.assertEqual(bookings[3]['error'], lookup.NOT_FOUND)
+        self.assertEqual(data['travel_options'][0]['available_seats'], 50)
+    
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'travel_options': '1,x'}).status_code, 400)
+        # Beyond the 64-bit id range: rejected instead of overflowing in the query
+        self.assertEqual(self.client.get(self.url, {'travel_options': '99999999999999999999999'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'travel_options': '0'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'bookings': self.mine.booking_id}).status_code, 401)
+        self.assertEqual(self.client.get(self.url, {'travel_options': str(self.options[0].pk)}).status_code, 200)
+        too_many = ','.join(str(pk) for pk in range(1, lookup.MAX_ITEMS + 2))
+        self.assertEqual(self.client.get(self.url, {'travel_options': too_many}).status_code, 400)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+
+class RecurringScheduleTest(TestCase):
+    def setUp(self):
+        # A Monday, so weekdays are easy to count
+        self.today = date(2030, 1, 7)
+        self.schedule = RecurringSchedule.objects.create(
+            code='IC100', type='train', source='Vienna', destination='Graz', weekdays='12345',
+            departure_time=time(7, 15), arrival_time=time(9, 50), valid_from=self.today,
+            total_seats=300, base_price=Decimal('39.00'),
+        )
+    
+    def test_materializes_lazily_within_the_horizon(self):
+        self.assertEqual(recurring.materialize(self.schedule, self.today, horizon_days=13), 10)
+        departures = TravelOption.objects.filter(recurring_schedule=self.schedule)
+        self.assertEqual(departures.count(), 10)
+        first = departures.get(departure_date=self.today)
+        self.assertEqual(first.travel_id, 'IC100-300107')
+        self.assertEqual((first.available_seats, first.price, first.duration), (300, Decimal('39.00'), timedelta(hours=2, minutes=35)))
+        self.assertFalse(departures.filter(departure_date__iso_week_day__gt=5).exists())
+        # Already expanded: nothing to do until the horizon moves
+        self.assertEqual(recurring.materialize(self.schedule, self.today, horizon_days=13), 0)
+        self.assertEqual(recurring.materialize_all(self.today + timedelta(days=7), horizon_days=13), 5)
+    
+    def test_changes_skip_departures_with_bookings(self):
+        recurring.materialize(self.schedule, self.today, horizon_days=13)
+        booked = TravelOption.objects.get(recurring_schedule=self.schedule, departure_date=self.today)
+        user = User.objects.create_user(username='commuter', password='testpass123')
+        Booking.objects.create(user=user, travel_option=booked, number_of_seats=1, total_price=booked.price)
+        
+        self.schedule.departure_time = time(23, 30)
+        self.schedule.arrival_time = time(1, 5)
+        self.schedule.arrival_day_offset = 1
+        self.schedule.base_price = Decimal('29.00')
+        self.schedule.weekdays = '1234'
+        self.schedule.save()
+        result = recurring.apply_changes(self.schedule, self.today)
+        self.assertEqual(result, {'updated': 7, 'removed': 2, 'created': 0, 'kept': 1})
+        
+        booked.refresh_from_db()
+        self.assertEqual((booked.departure_time, booked.price), (time(7, 15), Decimal('39.00')))
+        moved = TravelOption.objects.get(recurring_schedule=self.schedule, departure_date=self.today + timedelta(days=1))
+        self.assertEqual((moved.departure_time, moved.price), (time(23, 30), Decimal('29.00')))
+        self.assertEqual(moved.arrival_date, self.today + timedelta(days=2))
+        self.assertEqual(moved.duration, timedelta(hours=1, minutes=35))
+        
+        self.schedule.weekdays = '12345'
+        self.schedule.save()
+        self.assertEqual(recurring.apply_changes(self.schedule, self.today)['created'], 2)
+    
+    def test_dropped_days_keep_departures_with_bookings(self):
+        recurring.materialize(self.schedule, self.today, horizon_days=6)
+        friday = TravelOption.objects.get(recurring_schedule=self.schedule, departure_date=self.today + timedelta(days=4))
+        user = User.objects.create_user(username='friday', password='testpass123')
+        booking = Booking.objects.create(user=user, travel_option=friday, number_of_seats=1, total_price=friday.price)
+        self.schedule.weekdays = '1234'
+        self.schedule.save()
+        self.assertEqual(recurring.apply_changes(self.schedule, self.today)['removed'], 0)
+        self.assertTrue(Booking.objects.filter(pk=booking.pk).exists())
+    
+    def test_validation_and_command(self):
+        self.schedule.weekdays = '18'
+        self.schedule.arrival_time = time(6, 0)
+        with self.assertRaises(ValidationError) as raised:
+            self.schedule.full_clean()
+        self.assertEqual(set(raised.exception.message_dict), {'weekdays', 'arrival_time'})
+        
+        RecurringSchedule.objects.filter(pk=self.schedule.pk).update(valid_from=date.today())
+        out = StringIO()
+        call_command('materialize_schedules', '--horizon-days', '6', stdout=out)
+        self.assertIn('Created 5 departures', out.getvalue())
+
+class ListSink:
+    def __init__(self, config=None, fail=False):
+        self.messages = []
+        self.fail = fail
+    
+    def deliver(self, messages):
+        if self.fail:
+            raise OSError('sink down')
+        self.messages.extend(messages)
+    
+    def close(self):
+        pass
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='outbox', password='testpass123')
+        self.option = TravelOption.objects.create(
+            travel_id='OB001', type='flight', source='Oslo', destination='Bergen',
+            departure_date=date.today() + timedelta(days=5), departure_time=time(8, 0),
+            arrival_date=date.today() + timedelta(days=5), arrival_time=time(9, 0),
+            price=Decimal('80.00'), available_seats=10, total_seats=10,
+        )
+    
+    def _book(self, seats):
+        self.client.post(reverse('travel:book_travel', kwargs={'pk': self.option.pk}), {
+            'number_of_seats': seats, 'passenger_names': '\n'.join(f'P{i}' for i in range(seats)),
+            'contact_phone': '+4712345678',
+        })
+    
+    def test_changes_write_events_in_their_transaction(self):
+        self.client.login(username='outbox', password='testpass123')
+        self._book(2)
+        booking = Booking.objects.get(travel_option=self.option)
+        booking.cancel_booking()
+        events = list(OutboxEvent.objects.values_list('topic', 'key', 'payload'))
+        self.assertEqual([(topic, key) for topic, key, _ in events], [
+            (outbox.SEATS_CHANGED, self.option.pk), (outbox.BOOKING_CREATED, booking.pk),
+            (outbox.SEATS_CHANGED, self.option.pk), (outbox.BOOKING_CANCELLED, booking.pk),
+        ])
+        self.assertEqual([events[0][2]['delta'], events[2][2]['delta']], [-2, 2])
+        self.assertEqual((events[1][2]['source'], events[3][2]['status']), ('web', 'cancelled'))
+        
+        # A change that rolls back leaves no event behind
+        OutboxEvent.objects.all().delete()
+        with self.assertRaises(InsufficientSeats):
+            with transaction.atomic():
+                locked = inventory.lock_travel_options([self.option.pk])[self.option.pk]
+                inventory.reserve_seats(locked, 1)
+                inventory.reserve_seats(locked, 20)
+        self.assertFalse(OutboxEvent.objects.exists())
+        
+        reprice_upcoming(PricingEngine(curves={
+            'load_factor': [(0.0, 1.0)], 'days_to_departure': [(0, 1.5)], 'type': {'flight': 1.0},
+        }))
+        self.assertEqual(
+            list(OutboxEvent.objects.values_list('topic', 'payload')),
+            [(outbox.PRICE_CHANGED, {'travel_option_id': self.option.pk, 'old_price': '80.00', 'price': '120.00'})],
+        )
+    
+    def test_relay_compacts_seat_events_and_deletes_delivered(self):
+        self.client.login(username='outbox', password='testpass123')
+        for seats in (1, 2, 3):
+            self._book(seats)
+        self.assertEqual(OutboxEvent.objects.count(), 6)
+        
+        sink = ListSink()
+        self.assertEqual(outbox.relay_pending(sink, batch_size=4), (6, 5))
+        self.assertFalse(OutboxEvent.objects.exists())
+        topics = [message['topic'] for message in sink.messages]
+        self.assertEqual(topics, [outbox.BOOKING_CREATED, outbox.SEATS_CHANGED, outbox.BOOKING_CREATED,
+                                  outbox.SEATS_CHANGED, outbox.BOOKING_CREATED])
+        # The first batch's two seat events were merged in place of the second
+        first = sink.messages[1]['payload']
+        self.assertEqual((first['delta'], first['available_seats']), (-3, 4))
+        self.assertEqual([message['id'] for message in sink.messages], sorted(message['id'] for message in sink.messages))
+    
+    def test_failed_delivery_keeps_events(self):
+        inventory.set_seat_shards(self.option.pk, 2)
+        with transaction.atomic():
+            inventory.release_seats(self.option.pk, 1)
+        with self.assertRaises(OSError):
+            outbox.relay(ListSink(fail=True))
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+        sink = ListSink()
+        self.assertEqual(outbox.relay(sink), (1, 1))
+        # Seats of sharded departures are summed from the shards
+        self.assertEqual(sink.messages[0]['payload']['available_seats'], 11)
+    
+    def test_file_and_socket_sinks(self):
+        self.client.login(username='outbox', password='testpass123')
+        self._book(1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.jsonl')
+            out = StringIO()
+            with override_settings(TRAVEL_OUTBOX={'SINK': 'file', 'PATH': path}):
+                call_command('relay_outbox', stdout=out)
+            self.assertIn('Relayed 2 events as 2 messages', out.getvalue())
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual([line['topic'] for line in lines], [outbox.SEATS_CHANGED, outbox.BOOKING_CREATED])
+            
+            self._book(1)
+            address = os.path.join(directory, 'relay.sock')
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(address)
+            server.listen(1)
+            sink = outbox.get_sink({**outbox.DEFAULTS, 'SINK': 'socket', 'ADDRESS': address})
+            try:
+                self.assertEqual(outbox.relay(sink), (2, 2))
+                sink.close()
+                peer, _ = server.accept()
+                received = b''
+                while chunk := peer.recv(4096):
+                    received += chunk
+                peer.close()
+            finally:
+                server.close()
+            self.assertEqual(len(received.splitlines()), 2)
+            self.assertEqual(json.loads(received.splitlines()[1])['payload']['booking_id'],
+                             Booking.objects.latest('id').booking_id)
@@ -0,0 +1,208 @@
+"""
+Trending routes for the home page.
+
+Each booked seat adds ``exp(λ·(t - epoch))`` to its route's score, where
+``λ = ln 2 / half-life``; a cancellation takes its booking's contribution
+back off. Since every score decays by the same factor, storing them relative
+to a fixed epoch keeps their order correct without ever rewriting rows, and
+the current score is ``stored · exp(-λ·(now - epoch))``. ``compact()`` (the
+``compact_route_popularity`` command) periodically moves the epoch to now,
+rescaling all rows in one UPDATE so stored values stay small, and drops
+routes whose score has decayed away.
+
+Scores are updated after the booking transaction commits, with one
+``UPDATE ... SET score = score + x`` per route, so bookings never wait on
+each other for this. An increment racing a compaction may be scaled by the
+previous epoch (it reads the epoch row without locking it); with a daily
+compaction and a week's half-life that is a ~10% error on one booking.
+
+``top_routes()`` serves the home page from a per-process copy that is
+refreshed from the cache every ``REFRESH_SECONDS``; only the process that
+finds the shared cache empty runs the one indexed query.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, time as dtime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import signals
+from .models import Booking, ReportWatermark, RoutePopularity
+
+DEFAULTS = {
+    'HALF_LIFE_DAYS': 7,
+    'TOP_N': 6,
+    # Routes below this (decayed) score are dropped by compact()
+    'MIN_SCORE': 0.05,
+    'REFRESH_SECONDS': 60,
+}
+
+EPOCH_NAME = 'route_popularity_epoch'
+EPOCH_CACHE_KEY = 'trending:epoch'
+ROUTES_CACHE_KEY = 'trending:routes'
+
+_local = {'routes': [], 'version': '', 'expires': 0.0}
+_lock = threading.Lock()
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TRAVEL_TRENDING', {}))
+    return config
+
+
+def decay_rate(config=None):
+    config = config or get_config()
+    return math.log(2) / (config['HALF_LIFE_DAYS'] * 86400)
+
+
+def read_epoch():
+    return ReportWatermark.objects.get_or_create(name=EPOCH_NAME, defaults={'value': timezone.now()})[0].value
+
+
+def get_epoch():
+    """The epoch for reading scores, cached for ``REFRESH_SECONDS`` like the routes"""
+    epoch = cache.get(EPOCH_CACHE_KEY)
+    if epoch is None:
+        epoch = read_epoch()
+        cache.set(EPOCH_CACHE_KEY, epoch, get_config()['REFRESH_SECONDS'])
+    return epoch
+
+
+def weight(at, epoch, rate):
+    return math.exp(rate * (at - epoch).total_seconds())
+
+
+def add_scores(deltas):
+    """Apply ``{(source, destination): delta}`` to the stored scores"""
+    for (source, destination), delta in sorted(deltas.items()):
+        routes = RoutePopularity.objects.filter(source=source, destination=destination)
+        if routes.update(score=F('score') + delta, updated_at=timezone.now()) or delta <= 0:
+            continue
+        try:
+            with transaction.atomic():
+                RoutePopularity.objects.create(source=source, destination=destination, score=delta)
+        except IntegrityError:
+            routes.update(score=F('score') + delta, updated_at=timezone.now())
+
+
+def _deltas(bookings, sign, epoch, at=None):
+    rate = decay_rate()
+    deltas = defaultdict(float)
+    for booking in bookings:
+        option = booking.travel_option
+        deltas[(option.source, option.destination)] += (
+            sign * booking.number_of_seats * weight(at or booking.booking_date, epoch, rate)
+        )
+    return deltas
+
+
+def _score(bookings, sign, at=None):
+    # The epoch is read from its row, not the cache: another process's
+    # compaction only clears the cache of that process
+    with transaction.atomic():
+        add_scores(_deltas(bookings, sign, read_epoch(), at))
+
+
+@receiver(signals.bookings_created)
+def score_bookings_created(sender, bookings, **kwargs):
+    now = timezone.now()
+    transaction.on_commit(lambda: _score(bookings, 1, now))
+
+
+@receiver(signals.bookings_cancelled)
+def score_bookings_cancelled(sender, bookings, **kwargs):
+    # Remove exactly what the booking added when it was made
+    transaction.on_commit(lambda: _score(bookings, -1))
+
+
+def _compute_top(config):
+    epoch, rate = get_epoch(), decay_rate(config)
+    decay = weight(epoch, timezone.now(), rate)
+    rows = RoutePopularity.objects.filter(score__gt=0).order_by('-score')[:config['TOP_N']]
+    return [
+        {'source': row.source, 'destination': row.destination, 'score': round(row.score * decay, 2)}
+        for row in rows
+    ]
+
+
+def top_routes():
+    """The most popular routes as ``[{source, destination, score}]``; no query on the hot path"""
+    if _local['expires'] > time.monotonic():
+        return _local['routes']
+    with _lock:
+        if _local['expires'] > time.monotonic():
+            return _local['routes']
+        config = get_config()
+        cached = cache.get(ROUTES_CACHE_KEY)
+        if cached is None:
+            cached = (_compute_top(config), str(time.time()))
+            cache.set(ROUTES_CACHE_KEY, cached, config['REFRESH_SECONDS'])
+        _local['routes'], _local['version'] = cached
+        _local['expires'] = time.monotonic() + config['REFRESH_SECONDS']
+    return _local['routes']
+
+
+def version():
+    """Changes whenever the list returned by ``top_routes`` does; for ETags"""
+    top_routes()
+    return _local['version']
+
+
+def clear_cache():
+    cache.delete_many([EPOCH_CACHE_KEY, ROUTES_CACHE_KEY])
+    _local['expires'] = 0.0
+
+
+def compact(now=None):
+    """Move the epoch to ``now`` and drop routes that have decayed away; returns routes dropped"""
+    config = get_config()
+    now = now or timezone.now()
+    with transaction.atomic():
+        epoch, _ = ReportWatermark.objects.select_for_update().get_or_create(
+            name=EPOCH_NAME, defaults={'value': now},
+        )
+        factor = weight(epoch.value, now, decay_rate(config))
+        RoutePopularity.objects.update(score=F('score') * factor)
+        dropped, _ = RoutePopularity.objects.filter(score__lt=config['MIN_SCORE']).delete()
+        epoch.value = now
+        epoch.save(update_fields=['value'])
+    transaction.on_commit(clear_cache)
+    return dropped
+
+
+def rebuild(now=None):
+    """Recompute every score from confirmed bookings of the last ten half-lives"""
+    config = get_config()
+    now = now or timezone.now()
+    rate = decay_rate(config)
+    since = now - timedelta(days=10 * config['HALF_LIFE_DAYS'])
+    scores = defaultdict(float)
+    rows = (
+        Booking.objects.filter(status='confirmed', booking_date__gte=since).order_by()
+        .annotate(day=TruncDate('booking_date'))
+        .values('travel_option__source', 'travel_option__destination', 'day')
+        .annotate(seats=Sum('number_of_seats'))
+    )
+    for row in rows:
+        # Bookings of one day count as made at noon
+        at = timezone.make_aware(datetime.combine(row['day'], dtime(12)))
+        scores[(row['travel_option__source'], row['travel_option__destination'])] += row['seats'] * weight(at, now, rate)
+    with transaction.atomic():
+        RoutePopularity.objects.all().delete()
+        RoutePopularity.objects.bulk_create([
+            RoutePopularity(source=source, destination=destination, score=score)
+            for (source, destination), score in scores.items()
+            if score >= config['MIN_SCORE']
+        ], batch_size=500)
+        ReportWatermark.objects.update_or_create(name=EPOCH_NAME, defaults={'value': now})
+    transaction.on_commit(clear_cache)
+    return len(scores)
@@ -7,7 +7,15 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('travel/<int:pk>/', views.travel_detail, name='travel_detail'),
     path('travel/<int:pk>/book/', views.book_travel, name='book_travel'),
+    path('travel/live/', views.seat_stream, name='seat_stream'),
+    path('travel/<int:pk>/waitlist/', views.join_waitlist, name='join_waitlist'),
+    path('waitlist/<int:pk>/leave/', views.leave_waitlist, name='leave_waitlist'),
+    path('currency/', views.set_currency, name='set_currency'),
     path('bookings/', views.booking_list, name='booking_list'),
     path('booking/<int:pk>/', views.booking_detail, name='booking_detail'),
     path('booking/<int:pk>/cancel/', views.cancel_booking, name='cancel_booking'),
+    path('api/itineraries/', views.book_itinerary, name='book_itinerary'),
+    path('api/lookup/', views.batch_lookup, name='batch_lookup'),
+    path('ops/admission/', views.admission_stats, name='admission_stats'),
+    path('ops/metrics/', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
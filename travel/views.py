@@ -1,104 +1,291 @@
+import json
+import uuid
+from datetime import datetime, time, timedelta
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Q, Count, Max, Sum
 from django.db import transaction
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
-from .models import TravelOption, Booking
-from .forms import TravelSearchForm, BookingForm
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import condition, require_GET, require_POST
+from .conditional import has_pending_messages, make_etag, viewer_key
+from .archive import ChainedResults
+from .models import TravelOption, Booking, WaitlistEntry, ArchivedBooking, SeatMap
+from .seatmap import SeatPlan, default_layout
+from .forms import TravelSearchForm, BookingForm, WaitlistForm, render_search_form
+from .inventory import (
+    InsufficientSeats, SeatUnavailable, available_seats, claim_seats, lock_travel_options, reserve_seats,
+)
+from .jobs import enqueue
+from .signals import bookings_created
+from . import itinerary as itineraries
+from . import currency, idempotency, live, lookup, metrics, ratelimit, trending
 from django.views.generic import ListView, DetailView
 
+SEARCH_ORDERINGS = {
+    'departure': ('departure_at', 'pk'),
+    'price': ('price', 'departure_at', 'pk'),
+    'duration': ('duration', 'departure_at', 'pk'),
+}
+
+def _local_datetime(day, at):
+    return timezone.make_aware(datetime.combine(day, at), timezone.get_default_timezone())
+
+def _search(request):
+    """Search form and matching queryset for ``home``, built once per request"""
+    if not hasattr(request, '_travel_search'):
+        form = TravelSearchForm(request.GET or None)
+        travel_options = TravelOption.objects.filter(
+            departure_date__gte=timezone.now().date(),
+            available_seats__gt=0
+        )
+        
+        if form.is_valid():
+            # Apply filters
+            if form.cleaned_data.get('type'):
+                travel_options = travel_options.filter(type=form.cleaned_data['type'])
+            if form.cleaned_data.get('source'):
+                travel_options = travel_options.filter(
+                    source__icontains=form.cleaned_data['source']
+                )
+            if form.cleaned_data.get('destination'):
+                travel_options = travel_options.filter(
+                    destination__icontains=form.cleaned_data['destination']
+                )
+            departure_date = form.cleaned_data.get('departure_date')
+            depart_after = form.cleaned_data.get('depart_after')
+            depart_before = form.cleaned_data.get('depart_before')
+            if departure_date:
+                # One range on the departure_at index covers date and time window
+                travel_options = travel_options.filter(departure_at__range=(
+                    _local_datetime(departure_date, depart_after or time.min),
+                    _local_datetime(departure_date, depart_before or time.max),
+                ))
+            else:
+                if depart_after:
+                    travel_options = travel_options.filter(departure_time__gte=depart_after)
+                if depart_before:
+                    travel_options = travel_options.filter(departure_time__lte=depart_before)
+            if form.cleaned_data.get('max_duration'):
+                travel_options = travel_options.filter(
+                    duration__lte=timedelta(hours=form.cleaned_data['max_duration'])
+                )
+            if form.cleaned_data.get('min_price'):
+                travel_options = travel_options.filter(
+                    price__gte=form.cleaned_data['min_price']
+                )
+            if form.cleaned_data.get('max_price'):
+                travel_options = travel_options.filter(
+                    price__lte=form.cleaned_data['max_price']
+                )
+        sort = form.is_valid() and form.cleaned_data.get('sort') or 'departure'
+        travel_options = travel_options.order_by(*SEARCH_ORDERINGS[sort])
+        request._travel_search = (form, travel_options)
+    return request._travel_search
+
+def _search_version(request):
+    """Cheap aggregate fingerprint of the matching set: (count, latest update, pk sum)"""
+    if not hasattr(request, '_travel_search_version'):
+        _, travel_options = _search(request)
+        request._travel_search_version = travel_options.order_by().aggregate(
+            count=Count('pk'), latest=Max('updated_at'), pk_sum=Sum('pk')
+        )
+    return request._travel_search_version
+
+def home_etag(request):
+    if has_pending_messages(request):
+        return None
+    version = _search_version(request)
+    return make_etag(
+        'home',
+        sorted(request.GET.lists()),
+        version['count'],
+        version['latest'],
+        version['pk_sum'],
+        timezone.now().date(),
+        viewer_key(request),
+        currency.for_request(request).cache_key,
+        trending.version(),
+    )
+
+# No Last-Modified: the latest update of the matching set goes back when rows
+# leave it, and the page also depends on the date, currency and trending routes
+@condition(etag_func=home_etag)
 def home(request):
     """Home page with search functionality"""
-    form = TravelSearchForm(request.GET or None)
-    travel_options = TravelOption.objects.filter(
-        departure_date__gte=timezone.now().date(),
-        available_seats__gt=0
-    )
-    
-    if form.is_valid():
-        # Apply filters
-        if form.cleaned_data.get('type'):
-            travel_options = travel_options.filter(type=form.cleaned_data['type'])
-        if form.cleaned_data.get('source'):
-            travel_options = travel_options.filter(
-                source__icontains=form.cleaned_data['source']
-            )
-        if form.cleaned_data.get('destination'):
-            travel_options = travel_options.filter(
-                destination__icontains=form.cleaned_data['destination']
-            )
-        if form.cleaned_data.get('departure_date'):
-            travel_options = travel_options.filter(
-                departure_date=form.cleaned_data['departure_date']
-            )
-        if form.cleaned_data.get('min_price'):
-            travel_options = travel_options.filter(
-                price__gte=form.cleaned_data['min_price']
-            )
-        if form.cleaned_data.get('max_price'):
-            travel_options = travel_options.filter(
-                price__lte=form.cleaned_data['max_price']
-            )
+    form, travel_options = _search(request)
+    total_results = _search_version(request)['count']
     
     # Pagination
     paginator = Paginator(travel_options, 10)
+    paginator.count = total_results
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = currency.convert_prices(list(page_obj.object_list), currency.for_request(request))
     
     context = {
         'form': form,
+        'search_form_html': render_search_form(form),
         'page_obj': page_obj,
-        'total_results': travel_options.count(),
+        'total_results': total_results,
+        'trending_routes': trending.top_routes(),
     }
     return render(request, 'travel/home.html', context)
 
+def _travel_version(request, pk):
+    """
+    ``(updated_at, seats)`` of the travel option, read once for both
+    validators. Bookings of sharded departures leave ``updated_at`` alone,
+    so for those ``seats`` is the shard sum; ``None`` otherwise.
+    """
+    if not hasattr(request, '_travel_version'):
+        option = TravelOption.objects.filter(pk=pk).only('updated_at', 'seat_shards', 'available_seats').first()
+        if option is None:
+            request._travel_version = None
+        else:
+            request._travel_version = (option.updated_at, available_seats(option) if option.seat_shards else None)
+    return request._travel_version
+
+def travel_detail_etag(request, pk):
+    if has_pending_messages(request):
+        return None
+    version = _travel_version(request, pk)
+    if version is None:
+        return None
+    return make_etag('travel', pk, *version, viewer_key(request), currency.for_request(request).cache_key)
+
+def travel_detail_last_modified(request, pk):
+    if has_pending_messages(request):
+        return None
+    version = _travel_version(request, pk)
+    if version is None or version[1] is not None:
+        # Shard changes have no timestamp; sharded departures revalidate by ETag only
+        return None
+    return version[0]
+
+@condition(etag_func=travel_detail_etag, last_modified_func=travel_detail_last_modified)
 def travel_detail(request, pk):
     """Travel option detail view"""
     travel_option = get_object_or_404(TravelOption, pk=pk)
+    travel_option.available_seats = available_seats(travel_option)
+    currency.convert_prices([travel_option], currency.for_request(request))
     context = {
         'travel_option': travel_option,
     }
     return render(request, 'travel/travel_detail.html', context)
 
+async def seat_stream(request):
+    """
+    Server-Sent Events of seat and price changes for ``?ids=1,2,...``. Under
+    WSGI, where a response cannot stay open, a single snapshot is sent and
+    the browser reconnects after the ``retry`` delay.
+    """
+    config = live.get_config()
+    try:
+        ids = sorted({int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip()})
+    except ValueError:
+        return HttpResponseBadRequest('ids must be a comma-separated list of travel option ids.')
+    if not ids or len(ids) > config['MAX_WATCH']:
+        return HttpResponseBadRequest(f'Watch between 1 and {config["MAX_WATCH"]} travel options.')
+    
+    if not hasattr(request, 'scope'):
+        events = [f'retry: {config["RETRY"] * 1000}\n\n']
+        events.extend(live.format_event(state) for state in await live.fetch_states(ids))
+        response = HttpResponse(''.join(events), content_type='text/event-stream')
+    elif live.hub.count >= config['MAX_SUBSCRIBERS']:
+        response = HttpResponse('Too many live connections.', status=503)
+        response['Retry-After'] = str(config['RETRY'])
+        return response
+    else:
+        response = StreamingHttpResponse(live.event_stream(ids, config), content_type='text/event-stream')
+        response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def _seat_rows(travel_option):
+    """Seat grid for the selection step, or None while seats cannot be picked yet"""
+    if travel_option.seat_shards:
+        # Sharded departures assign no seats (see inventory)
+        return None
+    seat_map = SeatMap.objects.filter(travel_option=travel_option).first()
+    if seat_map is not None:
+        return seat_map.plan.grid(seat_map.taken_bits)
+    if travel_option.available_seats == travel_option.total_seats:
+        layout = default_layout(travel_option.type, travel_option.total_seats)
+        return SeatPlan(layout, travel_option.total_seats).grid(0)
+    # Seats sold before seat maps existed are placed when the map is created
+    return None
+
 @login_required
 def book_travel(request, pk):
     """Book a travel option"""
+    scope = f'book:{pk}'
+    if request.method == 'POST':
+        try:
+            key = idempotency.get_key(request)
+            result = key and idempotency.lookup(request.user, key, scope)
+        except (idempotency.InvalidKey, idempotency.KeyReused) as e:
+            return HttpResponseBadRequest(str(e))
+        if result:
+            return _replay_booking(request, result)
+    
     travel_option = get_object_or_404(TravelOption, pk=pk)
+    travel_option.available_seats = available_seats(travel_option)
     
     # Check if travel option is still available
-    if travel_option.available_seats == 0:
-        messages.error(request, 'This travel option is fully booked.')
-        return redirect('travel:travel_detail', pk=pk)
-    
     if travel_option.departure_date < timezone.now().date():
         messages.error(request, 'This travel option has already departed.')
         return redirect('travel:travel_detail', pk=pk)
     
+    if travel_option.available_seats == 0:
+        messages.info(request, 'This travel option is fully booked. You can join the waitlist instead.')
+        return redirect('travel:join_waitlist', pk=pk)
+    
     if request.method == 'POST':
         form = BookingForm(request.POST, travel_option=travel_option)
         if form.is_valid():
-            with transaction.atomic():
-                # Create booking
-                booking = form.save(commit=False)
-                booking.user = request.user
-                booking.travel_option = travel_option
-                booking.total_price = travel_option.price * booking.number_of_seats
-                
-                # Store passenger details
-                booking.passenger_details = {
-                    'names': form.cleaned_data['passenger_names'],
-                    'contact_phone': form.cleaned_data['contact_phone'],
-                }
-                
-                # Update available seats
-                travel_option.available_seats -= booking.number_of_seats
-                travel_option.save()
-                
-                booking.save()
-                
+            try:
+                with transaction.atomic():
+                    claimed = key and idempotency.claim(request.user, key, scope)
+                    # Re-read the row under lock; the form validated an unlocked copy
+                    travel_option = lock_travel_options([pk])[pk]
+                    
+                    # Create booking
+                    booking = form.save(commit=False)
+                    booking.user = request.user
+                    booking.travel_option = travel_option
+                    booking.total_price = travel_option.price * booking.number_of_seats
+                    
+                    # Store passenger details
+                    booking.passenger_details = {
+                        'names': form.cleaned_data['passenger_names'],
+                        'contact_phone': form.cleaned_data['contact_phone'],
+                    }
+                    
+                    # Update available seats and pick the seats themselves
+                    reserve_seats(travel_option, booking.number_of_seats)
+                    claim_seats(travel_option, [booking], form.cleaned_data['seat_selection'])
+                    
+                    booking.save()
+                    enqueue('travel.send_booking_confirmation', {'booking_id': booking.pk})
+                    bookings_created.send(sender=Booking, bookings=[booking], source='web')
+                    if claimed:
+                        idempotency.complete(claimed, {'booking': booking.pk, 'booking_id': booking.booking_id})
+            except idempotency.Replay as replay:
+                return _replay_booking(request, replay.result)
+            except idempotency.KeyReused as e:
+                return HttpResponseBadRequest(str(e))
+            except SeatUnavailable as e:
+                form.add_error('seat_selection', str(e))
+            except InsufficientSeats as e:
+                form.add_error('number_of_seats', str(e))
+            else:
                 messages.success(
                     request, 
                     f'Booking confirmed! Your booking ID is {booking.booking_id}'
@@ -107,44 +294,126 @@ def book_travel(request, pk):
     else:
         form = BookingForm(travel_option=travel_option)
     
+    currency.convert_prices([travel_option], currency.for_request(request))
     context = {
         'form': form,
         'travel_option': travel_option,
+        'seat_rows': _seat_rows(travel_option),
     }
     return render(request, 'travel/book_travel.html', context)
 
+def _replay_booking(request, result):
+    messages.info(request, f'This booking was already submitted. Your booking ID is {result["booking_id"]}')
+    return redirect('travel:booking_detail', pk=result['booking'])
+
+@require_POST
+def set_currency(request):
+    """Remember the display currency in the session"""
+    code = request.POST.get('currency', '')
+    _, rates = currency.rate_table()
+    if code in rates:
+        request.session[currency.SESSION_KEY] = code
+    next_url = request.POST.get('next') or request.META.get('HTTP_REFERER')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
+        next_url = reverse('travel:home')
+    return redirect(next_url)
+
 @login_required
 def booking_list(request):
     """User's booking list"""
-    bookings = Booking.objects.filter(user=request.user)
+    bookings = Booking.objects.filter(user=request.user).select_related('travel_option')
+    archived = ArchivedBooking.objects.filter(user=request.user).select_related('travel_option')
     
     # Filter by status if requested
     status_filter = request.GET.get('status')
     if status_filter in ['confirmed', 'cancelled']:
         bookings = bookings.filter(status=status_filter)
+        archived = archived.filter(status=status_filter)
     
-    paginator = Paginator(bookings, 10)
+    # Archived trips are listed after the current ones
+    paginator = Paginator(ChainedResults(bookings, archived), 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    currency.convert_prices(page_obj.object_list, currency.for_request(request), fields=('total_price',))
     
     context = {
         'page_obj': page_obj,
         'status_filter': status_filter,
+        'waitlist_entries': WaitlistEntry.objects.filter(
+            user=request.user, status='waiting'
+        ).select_related('travel_option'),
     }
     return render(request, 'travel/booking_list.html', context)
 
+def _booking_updated_at(request, pk):
+    """Latest change to the booking or its travel option, in one indexed query"""
+    if not hasattr(request, '_booking_updated_at'):
+        row = (
+            Booking.objects
+            .filter(pk=pk, user=request.user)
+            .values_list('updated_at', 'travel_option__updated_at')
+            .first()
+        )
+        if row is None:
+            row = (
+                ArchivedBooking.objects
+                .filter(pk=pk, user=request.user)
+                .values_list('updated_at', 'archived_at')
+                .first()
+            )
+        request._booking_updated_at = max(row) if row else None
+    return request._booking_updated_at
+
+def booking_detail_etag(request, pk):
+    if has_pending_messages(request):
+        return None
+    updated_at = _booking_updated_at(request, pk)
+    if updated_at is None:
+        return None
+    # The date is part of the tag because cancellability changes at departure
+    return make_etag(
+        'booking', pk, updated_at, timezone.now().date(), viewer_key(request), currency.for_request(request).cache_key,
+    )
+
+def booking_detail_last_modified(request, pk):
+    if has_pending_messages(request):
+        return None
+    return _booking_updated_at(request, pk)
+
 @login_required
+@condition(etag_func=booking_detail_etag, last_modified_func=booking_detail_last_modified)
 def booking_detail(request, pk):
     """Booking detail view"""
-    booking = get_object_or_404(Booking, pk=pk, user=request.user)
+    booking = (
+        Booking.objects.select_related('travel_option').filter(pk=pk, user=request.user).first()
+        or get_object_or_404(ArchivedBooking.objects.select_related('travel_option'), pk=pk, user=request.user)
+    )
+    currency.convert_prices([booking], currency.for_request(request), fields=('total_price',))
     context = {
         'booking': booking,
     }
     return render(request, 'travel/booking_detail.html', context)
 
+def _cancel_outcome(request, pk, cancelled):
+    if cancelled:
+        messages.success(request, 'Booking cancelled successfully.')
+    else:
+        messages.error(request, 'Unable to cancel booking.')
+    return redirect('travel:booking_detail', pk=pk)
+
 @login_required
 def cancel_booking(request, pk):
     """Cancel a booking"""
+    scope = f'cancel:{pk}'
+    if request.method == 'POST':
+        try:
+            key = idempotency.get_key(request)
+            result = key and idempotency.lookup(request.user, key, scope)
+        except (idempotency.InvalidKey, idempotency.KeyReused) as e:
+            return HttpResponseBadRequest(str(e))
+        if result:
+            return _cancel_outcome(request, pk, result['cancelled'])
+    
     booking = get_object_or_404(Booking, pk=pk, user=request.user)
     
     if not booking.can_be_cancelled:
@@ -152,13 +421,174 @@ def cancel_booking(request, pk):
         return redirect('travel:booking_detail', pk=pk)
     
     if request.method == 'POST':
-        if booking.cancel_booking():
-            messages.success(request, 'Booking cancelled successfully.')
-        else:
-            messages.error(request, 'Unable to cancel booking.')
-        return redirect('travel:booking_detail', pk=pk)
+        try:
+            with transaction.atomic():
+                claimed = key and idempotency.claim(request.user, key, scope)
+                cancelled = booking.cancel_booking()
+                if claimed:
+                    idempotency.complete(claimed, {'cancelled': cancelled})
+        except idempotency.Replay as replay:
+            cancelled = replay.result['cancelled']
+        except idempotency.KeyReused as e:
+            return HttpResponseBadRequest(str(e))
+        return _cancel_outcome(request, pk, cancelled)
     
     context = {
         'booking': booking,
+        'idempotency_key': uuid.uuid4().hex,
+    }
+    return render(request, 'travel/cancel_booking.html', context)
+
+@login_required
+def join_waitlist(request, pk):
+    """Queue for seats on a fully booked travel option"""
+    travel_option = get_object_or_404(TravelOption, pk=pk)
+    
+    if travel_option.departure_date < timezone.now().date():
+        messages.error(request, 'This travel option has already departed.')
+        return redirect('travel:travel_detail', pk=pk)
+    
+    if available_seats(travel_option) > 0:
+        return redirect('travel:book_travel', pk=pk)
+    
+    existing = WaitlistEntry.objects.filter(
+        user=request.user, travel_option=travel_option, status='waiting'
+    ).first()
+    if existing:
+        messages.info(request, f'You are already on the waitlist (position {existing.position}).')
+        return redirect('travel:booking_list')
+    
+    if request.method == 'POST':
+        form = WaitlistForm(request.POST)
+        if form.is_valid():
+            entry = form.save(commit=False)
+            entry.user = request.user
+            entry.travel_option = travel_option
+            entry.passenger_details = {
+                'names': form.cleaned_data['passenger_names'],
+                'contact_phone': form.cleaned_data['contact_phone'],
+            }
+            entry.save()
+            messages.success(
+                request,
+                f'You are on the waitlist at position {entry.position}. '
+                'Seats that become available are assigned automatically.'
+            )
+            return redirect('travel:booking_list')
+    else:
+        form = WaitlistForm()
+    
+    currency.convert_prices([travel_option], currency.for_request(request))
+    context = {
+        'form': form,
+        'travel_option': travel_option,
     }
-    return render(request, 'travel/cancel_booking.html', context)
\ No newline at end of file
+    return render(request, 'travel/join_waitlist.html', context)
+
+@login_required
+def leave_waitlist(request, pk):
+    """Withdraw from a waitlist"""
+    if request.method == 'POST':
+        updated = WaitlistEntry.objects.filter(
+            pk=pk, user=request.user, status='waiting'
+        ).update(status='cancelled')
+        if updated:
+            messages.success(request, 'You have left the waitlist.')
+        else:
+            messages.error(request, 'Unable to leave the waitlist.')
+    return redirect('travel:booking_list')
+
+@staff_member_required
+def admission_stats(request):
+    """Admission control counters of this process"""
+    return JsonResponse(ratelimit.stats.snapshot())
+
+@require_POST
+def book_itinerary(request):
+    """
+    JSON API: book the same passengers on several travel options at once.
+    
+    Body: {"travel_options": [id, ...], "passengers": ["name", ...], "contact_phone": "..."}
+    An ``Idempotency-Key`` header makes retries return the original response.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    try:
+        data = json.loads(request.body)
+        travel_option_ids = [int(pk) for pk in data.get('travel_options', [])]
+        passengers = [str(name).strip() for name in data.get('passengers', []) if str(name).strip()]
+        contact_phone = str(data.get('contact_phone', ''))[:15]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+    
+    try:
+        key = idempotency.get_key(request)
+        result = key and idempotency.lookup(request.user, key, 'itinerary')
+    except (idempotency.InvalidKey, idempotency.KeyReused) as e:
+        return JsonResponse({'error': str(e)}, status=422)
+    if result:
+        return _replay_itinerary(result)
+    
+    try:
+        with transaction.atomic():
+            claimed = key and idempotency.claim(request.user, key, 'itinerary')
+            itinerary = itineraries.book_itinerary(request.user, travel_option_ids, passengers, contact_phone)
+            body = {
+                'reference': itinerary.reference,
+                'total_price': str(itinerary.total_price),
+                'bookings': [
+                    {
+                        'id': booking.pk,
+                        'booking_id': booking.booking_id,
+                        'travel_option': booking.travel_option_id,
+                        'number_of_seats': booking.number_of_seats,
+                        'total_price': str(booking.total_price),
+                    }
+                    for booking in itinerary.booking_list
+                ],
+            }
+            if claimed:
+                idempotency.complete(claimed, body)
+    except idempotency.Replay as replay:
+        return _replay_itinerary(replay.result)
+    except idempotency.KeyReused as e:
+        return JsonResponse({'error': str(e)}, status=422)
+    except InsufficientSeats as e:
+        return JsonResponse({'error': str(e), 'travel_option': e.travel_option.pk}, status=409)
+    except itineraries.ItineraryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse(body, status=201)
+
+def _replay_itinerary(body):
+    response = JsonResponse(body, status=201)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+@require_GET
+def batch_lookup(request):
+    """
+    JSON API: several travel options and the user's bookings in one request.
+    
+    Query: ?travel_options=12,48&bookings=BK1A2B3C4D,BK5E6F7A8B
+    Ids that do not exist, or bookings of other users, come back as "not found".
+    """
+    try:
+        travel_option_ids = lookup.parse_ids(request.GET.get('travel_options'), lookup.pk_value)
+        booking_ids = lookup.parse_ids(request.GET.get('bookings'))
+    except lookup.InvalidLookup as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not travel_option_ids and not booking_ids:
+        return JsonResponse({'error': 'Pass travel_options and/or bookings ids.'}, status=400)
+    if booking_ids and not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    try:
+        body = lookup.lookup_many(request.user, travel_option_ids, booking_ids, currency.for_request(request))
+    except lookup.InvalidLookup as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(body)
+
+@staff_member_required
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
\ No newline at end of file
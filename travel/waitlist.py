@@ -0,0 +1,126 @@
+"""
+Waitlist allocation.
+
+Cancelling a booking only returns seats to the travel option; handing those
+seats to waitlisted users happens out of band (``process_waitlist`` command),
+so the cancel request never pays for it. Each departure is allocated in a
+single transaction that locks the travel option row, walks its queue in FIFO
+order and creates all resulting bookings with one bulk insert. Waitlisted
+users are not around when their booking is made, so each one gets the
+booking confirmation email, queued in the same transaction.
+
+Cancellations of sharded departures give their seats back to the shards,
+not to ``available_seats``, so those departures are picked up by their
+shards having seats.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .inventory import InsufficientSeats, claim_seats, lock_seat_shards, lock_travel_options, reserve_seats
+from .jobs import enqueue
+from .models import TravelOption, Booking, SeatShard, WaitlistEntry
+from .signals import bookings_created
+
+logger = logging.getLogger(__name__)
+
+QUEUE_PAGE_SIZE = 500
+
+
+def departures_needing_allocation(today=None):
+    """Ids of upcoming departures that have free seats and a waiting queue"""
+    today = today or timezone.now().date()
+    return (
+        TravelOption.objects
+        .filter(
+            Q(seat_shards=0, available_seats__gt=0)
+            | Q(Exists(SeatShard.objects.filter(travel_option=OuterRef('pk'), available_seats__gt=0))),
+            departure_date__gte=today,
+            waitlist_entries__status='waiting',
+        )
+        .values_list('pk', flat=True)
+        .distinct()
+        .order_by('pk')
+    )
+
+
+def allocate_waitlist(travel_option_id, page_size=QUEUE_PAGE_SIZE):
+    """
+    Assign free seats of one departure to its waitlist, first come first
+    served. Allocation stops at the first entry that does not fit so a large
+    party at the head of the queue is never starved by smaller ones behind it.
+    Returns the list of created bookings.
+    """
+    with transaction.atomic():
+        travel_option = lock_travel_options([travel_option_id]).get(travel_option_id)
+        if travel_option is not None:
+            # Sharded: hold every shard so the count cannot drop under the allocation
+            lock_seat_shards(travel_option)
+        if travel_option is None or travel_option.available_seats == 0:
+            return []
+
+        queue = WaitlistEntry.objects.filter(travel_option=travel_option, status='waiting')
+        if travel_option.departure_date < timezone.now().date():
+            queue.update(status='expired')
+            return []
+
+        seats_left = travel_option.available_seats
+        allocated = []
+        last_id = 0
+        head_blocked = False
+        while seats_left and not head_blocked:
+            page = list(queue.filter(id__gt=last_id).order_by('id')[:page_size])
+            if not page:
+                break
+            for entry in page:
+                if entry.number_of_seats > seats_left:
+                    head_blocked = True
+                    break
+                seats_left -= entry.number_of_seats
+                allocated.append(entry)
+            last_id = page[-1].id
+
+        if not allocated:
+            return []
+
+        bookings = [
+            Booking(
+                booking_id=Booking.generate_booking_id(),
+                user_id=entry.user_id,
+                travel_option=travel_option,
+                number_of_seats=entry.number_of_seats,
+                total_price=travel_option.price * entry.number_of_seats,
+                passenger_details=entry.passenger_details,
+            )
+            for entry in allocated
+        ]
+        claim_seats(travel_option, bookings)
+        Booking.objects.bulk_create(bookings)
+        Booking.assign_missing_pks(bookings)
+        bookings_created.send(sender=Booking, bookings=bookings, source='waitlist')
+        for booking in bookings:
+            enqueue('travel.send_booking_confirmation', {'booking_id': booking.pk})
+
+        now = timezone.now()
+        for entry, booking in zip(allocated, bookings):
+            entry.status = 'allocated'
+            entry.booking = booking
+            entry.allocated_at = now
+        WaitlistEntry.objects.bulk_update(allocated, ['status', 'booking', 'allocated_at'])
+
+        reserve_seats(travel_option, travel_option.available_seats - seats_left)
+        return bookings
+
+
+def process_waitlists(today=None):
+    """Run the allocator for every departure that needs it. Returns bookings created."""
+    created = 0
+    for travel_option_id in list(departures_needing_allocation(today)):
+        try:
+            created += len(allocate_waitlist(travel_option_id))
+        except InsufficientSeats:
+            # Rolled back; the departure is tried again on the next run
+            logger.warning('Waitlist allocation of travel option %s failed', travel_option_id, exc_info=True)
+    return created
@@ -2,6 +2,9 @@
 ASGI config for travel_booking project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the project with it (for example ``uvicorn travel_booking.asgi:application``)
+to stream live seat availability from ``/travel/live/``; under WSGI that
+endpoint falls back to one snapshot per reconnect.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
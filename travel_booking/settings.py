@@ -45,6 +45,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'travel.ratelimit.AdmissionControlMiddleware',
+    'travel.slowlog.SlowQueryMiddleware',
+    'travel.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -66,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'travel.currency.currency_context',
             ],
         },
     },
@@ -91,6 +95,35 @@ DATABASES = {
     }
 }
 
+# Cache
+# Shared by every process in production (e.g. BACKEND
+# django.core.cache.backends.redis.RedisCache, LOCATION redis://host:6379):
+# sessions, logged-in users, rate limits and reports are kept here.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Per-process caches would let a logged-out session live on in other workers,
+# so sessions and logged-in users are only cached in a shared cache
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Logged-in users (with their profile) are cached for a minute (see accounts/backends.py)
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+if SHARED_CACHE:
+    # Sessions are read from the cache and written through to the database
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    ACCOUNTS_USER_CACHE_TTL = 60
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+    ACCOUNTS_USER_CACHE_TTL = 0
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -141,6 +174,83 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
+# Email (booking confirmations are sent by the background job worker)
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='TravelBook <noreply@travelbook.local>')
+
+# Admission control for the booking endpoints (see travel/ratelimit.py).
+# Buckets are (tokens per second, burst size), per process unless the cache
+# is shared. Behind a reverse proxy, set ADMISSION_PROXY_HOPS to the number
+# of proxies in front of the app so clients are told apart by
+# X-Forwarded-For instead of all sharing the proxy's address.
+TRAVEL_ADMISSION_CONTROL = {
+    'ENABLED': config('ADMISSION_CONTROL', default=True, cast=bool),
+    'CACHE': 'default',
+    'MAX_IN_FLIGHT': 64,
+    'PROXY_HEADER': config('ADMISSION_PROXY_HEADER', default='HTTP_X_FORWARDED_FOR'),
+    'PROXY_HOPS': config('ADMISSION_PROXY_HOPS', default=0, cast=int),
+    'VIEWS': {
+        'travel:home': {
+            'ip': (10, 40),
+        },
+        'travel:book_travel': {
+            'ip': (2, 20),
+            'user': (1, 10),
+            'travel_option': (50, 200),
+        },
+    },
+}
+
+# Metrics (see travel/metrics.py). With several worker processes, point this
+# at a directory shared by them so /ops/metrics/ reports all of them.
+TRAVEL_METRICS_DIR = config('METRICS_DIR', default='') or None
+
+# Slow-query log (see travel/slowlog.py), browsable in the admin
+TRAVEL_SLOW_QUERY_LOG = {
+    'ENABLED': config('SLOW_QUERY_LOG', default=True, cast=bool),
+    'THRESHOLD_MS': config('SLOW_QUERY_MS', default=200, cast=int),
+    'EXPLAIN': True,
+}
+
+# Currency prices are stored and charged in; others are display only, with
+# rates from `manage.py load_exchange_rates` (see travel/currency.py)
+TRAVEL_BASE_CURRENCY = 'USD'
+
+# Live seat availability over Server-Sent Events (see travel/live.py); needs ASGI
+TRAVEL_LIVE_SEATS = {
+    'POLL_INTERVAL': 1.0,
+    'MAX_SUBSCRIBERS': config('LIVE_SEATS_MAX_SUBSCRIBERS', default=10000, cast=int),
+}
+
+# Popular routes on the home page (see travel/trending.py)
+TRAVEL_TRENDING = {
+    'HALF_LIFE_DAYS': 7,
+    'TOP_N': 6,
+}
+
+# Seconds a booking or cancellation idempotency key is remembered (see travel/idempotency.py)
+TRAVEL_IDEMPOTENCY_TTL = 24 * 60 * 60
+
+# Days finished and dead background jobs are kept before `manage.py purge_jobs` deletes them
+TRAVEL_JOB_RETENTION_DAYS = 7
+
+# Seat counters a departure is split into when switched to sharded inventory
+# in the admin (see travel/inventory.py)
+TRAVEL_SEAT_SHARDS = 8
+
+# Days ahead recurring schedules are expanded into departures (see travel/recurring.py)
+TRAVEL_SCHEDULE_HORIZON_DAYS = 60
+
+# Outbox of seat, price and booking changes for downstream systems, delivered
+# by `manage.py relay_outbox` (see travel/outbox.py). SINK is 'file' (PATH),
+# 'socket' (ADDRESS: a Unix socket path or host:port) or a sink class's dotted path.
+TRAVEL_OUTBOX = {
+    'SINK': config('OUTBOX_SINK', default='file'),
+    'PATH': config('OUTBOX_PATH', default='') or str(BASE_DIR / 'outbox.jsonl'),
+    'ADDRESS': config('OUTBOX_ADDRESS', default=''),
+    'BATCH_SIZE': 500,
+}
+
 # Login/Logout URLs
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'travel:home'